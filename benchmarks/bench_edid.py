@@ -0,0 +1,56 @@
+"""Benchmark EDID decode latency for 1 to 8 monitors.
+
+Compares the built-in decoder against the edid-decode subprocess path.
+Run from the repository root:
+
+    python -m benchmarks.bench_edid
+"""
+
+import shutil
+import time
+
+from loguru import logger
+
+from screenman.edid import Edid
+from tests.helpers import make_cta_ext, make_edid
+
+REPEAT = 20
+
+
+def _edids(count):
+    return [
+        make_edid(serial_str=f"SN{index:011d}", name=f"Monitor {index}", extensions=(make_cta_ext(),))
+        for index in range(count)
+    ]
+
+
+def _bench(decode, edids, repeat):
+    """Return the best wall time in milliseconds to decode all EDIDs once."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for edid_hex in edids:
+            decode(edid_hex)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    logger.remove()
+    has_edid_decode = shutil.which("edid-decode") is not None
+    print(f"{'monitors':>8} {'native [ms]':>12} {'edid-decode [ms]':>17}")
+    for count in range(1, 9):
+        edids = _edids(count)
+        native = _bench(Edid.from_edid_hex, edids, REPEAT)
+        external = (
+            f"{_bench(Edid.from_edid_decode, edids, REPEAT // 4):17.3f}"
+            if has_edid_decode
+            else f"{'n/a':>17}"
+        )
+        print(f"{count:8d} {native:12.3f} {external}")
+    if not has_edid_decode:
+        print("edid-decode is not installed, skipped the subprocess path.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Benchmark a CLI call forwarded to the daemon against running it in-process.
+
+A fake `xrandr` printing a canned dump is put on PATH, so that no X server is
+needed and the numbers show the Python overhead. Run from the repository root:
+
+    python -m benchmarks.bench_ipc
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from screenman import ipc
+from tests.helpers import make_edid, make_xrandr_output
+
+REPEAT = 10
+
+
+def _fake_xrandr(bin_dir: Path):
+    dump = bin_dir / "xrandr.txt"
+    dump.write_text(
+        "\n".join(
+            make_xrandr_output(
+                [
+                    {"name": "eDP-1", "primary": True, "edid": make_edid(serial_str="INTERNAL")},
+                    {"name": "DP-1", "position": (1920, 0), "edid": make_edid(serial_str="EXTERNAL")},
+                    {"name": "DP-2", "connected": False},
+                ]
+            )
+        )
+        + "\n"
+    )
+    script = bin_dir / "xrandr"
+    script.write_text(f'#!/bin/sh\nif [ "$1" = "--props" ]; then cat "{dump}"; fi\n')
+    script.chmod(0o755)
+
+
+def _best(func):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    logger.remove()
+    with tempfile.TemporaryDirectory(prefix="screenman-bench-") as tmp:
+        tmp = Path(tmp)
+        _fake_xrandr(tmp)
+        env = dict(os.environ, PATH=f"{tmp}{os.pathsep}{os.environ['PATH']}", XDG_RUNTIME_DIR=str(tmp))
+        os.environ["XDG_RUNTIME_DIR"] = str(tmp)
+        cli = [sys.executable, "-m", "screenman.cli", "--log-level", "WARNING"]
+
+        def run(*args):
+            subprocess.run([*cli, *args], env=env, check=True, stdout=subprocess.DEVNULL)
+
+        daemon = subprocess.Popen([*cli, "daemon", "--no-hotplug"], env=env)
+        try:
+            while ipc.call("print-info") is None:
+                time.sleep(0.05)
+            print(f"{'path':<34} {'best [ms]':>10}")
+            print(f"{'screenman --print-info (process)':<34} {_best(lambda: run('--print-info', '--no-daemon')):10.3f}")
+            print(f"{'screenman --print-info (daemon)':<34} {_best(lambda: run('--print-info')):10.3f}")
+            print(f"{'screenman apply (process)':<34} {_best(lambda: run('--no-daemon')):10.3f}")
+            print(f"{'screenman apply (daemon)':<34} {_best(lambda: run()):10.3f}")
+            print(f"{'ipc.call apply (no start-up)':<34} {_best(lambda: ipc.call('apply')):10.3f}")
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+
+if __name__ == "__main__":
+    main()
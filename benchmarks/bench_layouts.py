@@ -0,0 +1,61 @@
+"""Benchmark layout matching with large layout catalogs.
+
+Compares the indexed matching of determine_layout with a scan over all
+layouts. Run from the repository root:
+
+    python -m benchmarks.bench_layouts
+"""
+
+import random
+import time
+
+from screenman.layouts import LayoutIndex
+
+REPEAT = 200
+
+
+def make_layouts(num_layouts, num_uids, rng):
+    uids = [f"SN{i:08d}" for i in range(num_uids)]
+    layouts = {
+        f"layout{i}": {uid: None for uid in rng.sample(uids, rng.randint(1, 4))}
+        for i in range(num_layouts)
+    }
+    return layouts, uids
+
+
+def scan(layouts, uids):
+    """The matching of determine_layout before it used an index."""
+    for name, layout in sorted(layouts.items(), key=lambda x: len(x[1]), reverse=True):
+        if all(uid in uids for uid in layout):
+            return name
+    return None
+
+
+def _best_us(func):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6
+
+
+def main():
+    rng = random.Random(0)
+    print(f"{'layouts':>7} {'build [ms]':>11} {'scan [us]':>10} {'index [us]':>11}")
+    for num_layouts in (10, 100, 1000, 5000):
+        layouts, uids = make_layouts(num_layouts, max(20, num_layouts // 5), rng)
+        connected = set(rng.sample(uids, 3))
+
+        start = time.perf_counter()
+        index = LayoutIndex(layouts)
+        build = (time.perf_counter() - start) * 1000
+        assert index.match(connected) == scan(layouts, connected)
+
+        scan_us = _best_us(lambda: scan(layouts, connected))
+        index_us = _best_us(lambda: index.match(connected))
+        print(f"{num_layouts:7d} {build:11.3f} {scan_us:10.1f} {index_us:11.1f}")
+
+
+if __name__ == "__main__":
+    main()
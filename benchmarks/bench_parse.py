@@ -0,0 +1,52 @@
+"""Benchmark the xrandr --props parser on large synthetic dumps.
+
+The time per line should stay flat as the dump grows. Run from the
+repository root:
+
+    python -m benchmarks.bench_parse
+"""
+
+import time
+
+from loguru import logger
+
+from screenman.screen import iter_xrandr_outputs, parse_xrandr
+from tests.helpers import make_edid, make_xrandr_output
+
+REPEAT = 5
+
+
+def make_dump(num_outputs, num_modes):
+    modes = [(640 + 8 * i, 480 + 4 * i, [60.0, 59.94, 50.0]) for i in range(num_modes)]
+    return make_xrandr_output(
+        [
+            {"name": f"DP-{index}", "edid": make_edid(serial_str=f"SN{index}"), "modes": modes}
+            for index in range(num_outputs)
+        ]
+    )
+
+
+def _best(func, lines):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(iter(lines))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    logger.remove()
+    print(f"{'outputs':>7} {'lines':>7} {'split [ms]':>11} {'parse [ms]':>11} {'us/line':>8}")
+    for num_outputs, num_modes in [(1, 10), (4, 50), (16, 100), (32, 200), (64, 400)]:
+        lines = make_dump(num_outputs, num_modes)
+        split = _best(lambda it: list(iter_xrandr_outputs(it)), lines)
+        parse = _best(parse_xrandr, lines)
+        print(
+            f"{num_outputs:7d} {len(lines):7d} {split * 1000:11.3f} {parse * 1000:11.3f} "
+            f"{parse / len(lines) * 1e6:8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
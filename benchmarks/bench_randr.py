@@ -0,0 +1,41 @@
+"""Benchmark discovery through the RandR extension against forking xrandr.
+
+Needs a running X server with RandR, e.g. `Xvfb :99 +extension RANDR`, and
+python-xlib. Run from the repository root:
+
+    DISPLAY=:99 python -m benchmarks.bench_randr
+"""
+
+import shutil
+import time
+
+from loguru import logger
+
+from screenman import randr
+from screenman.screen import connected_screens
+
+REPEAT = 20
+
+
+def _best(func):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    logger.remove()
+    print(f"{'path':<28} {'best [ms]':>10}")
+    print(f"{'randr (reprobe)':<28} {_best(lambda: randr.connected_screens(probe=True)):10.3f}")
+    print(f"{'randr (current)':<28} {_best(lambda: randr.connected_screens(probe=False)):10.3f}")
+    if shutil.which("xrandr"):
+        print(f"{'xrandr --props subprocess':<28} {_best(lambda: connected_screens()):10.3f}")
+    else:
+        print("xrandr is not installed, skipped the subprocess path.")
+
+
+if __name__ == "__main__":
+    main()
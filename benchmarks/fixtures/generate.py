@@ -0,0 +1,262 @@
+"""Regenerate the benchmark fixture corpus.
+
+Writes, next to this file:
+
+- `edid/NN.hex`: one EDID per monitor, as xrandr prints it, and `edid/NN.txt`
+  with the report edid-decode prints for it, written by hand in its format and
+  served by the fake `edid-decode`.
+- `xrandr/outputs-NN.txt`: `xrandr --props` dumps with NN connected outputs,
+  the first NN monitors, and a few disconnected connectors.
+- `layouts.toml`: a layout for every dump plus decoy layouts.
+
+The corpus is checked in, so that the numbers of different runs compare the
+same input. Only regenerate it together with the baseline:
+
+    python -m benchmarks.fixtures.generate
+"""
+
+import random
+from pathlib import Path
+
+from screenman.edid import Edid
+from tests.helpers import make_cta_ext, make_displayid_ext, make_edid, make_xrandr_output
+
+FIXTURES = Path(__file__).parent
+OUTPUT_COUNTS = (1, 2, 4, 8, 16)
+NUM_DECOY_LAYOUTS = 200
+# The internal panel has no serial, it is matched through the fallback_uid table
+INTERNAL_UID = "internal_panel"
+
+MONITORS = [
+    {"manufacturer": "BOE", "product_code": 2445, "serial": 0, "name": None},
+    {"manufacturer": "DEL", "product_code": 41146, "serial_str": "7MT0186B1WRL", "name": "DELL U2720Q"},
+    {"manufacturer": "GSM", "product_code": 23305, "serial": 436245, "name": "LG HDR 4K"},
+    {"manufacturer": "SAM", "product_code": 3857, "serial": 1129729611, "serial_str": "HNTR700123", "name": "LS27A600U"},
+    {"manufacturer": "DEL", "product_code": 41200, "serial_str": "CN0F2M8H", "name": "DELL P2419H", "cta": True},
+    {"manufacturer": "ACR", "product_code": 1769, "serial": 2204118373, "name": "XF270HU"},
+    {"manufacturer": "AUS", "product_code": 10161, "serial_str": "L8LMQS141563", "name": "PA278QV", "cta": True},
+    {"manufacturer": "BNQ", "product_code": 30892, "serial_str": "ET5AL01234SL0", "name": "BenQ PD2700U"},
+    {"manufacturer": "LEN", "product_code": 25008, "serial": 16843009, "name": "LEN T27h-20"},
+    {"manufacturer": "HWP", "product_code": 13397, "serial_str": "CNC0231XYZ", "name": "HP Z27n G2"},
+    {"manufacturer": "APP", "product_code": 44592, "displayid": (31337, "Pro Display")},
+    {"manufacturer": "PHL", "product_code": 2353, "serial": 4660, "serial_str": "UK02011000123", "name": "PHL 276E8V"},
+    {"manufacturer": "DEL", "product_code": 41146, "serial_str": "7MT0186B2WRL", "name": "DELL U2720Q"},
+    {"manufacturer": "VSC", "product_code": 15652, "serial": 16843010, "name": "VX2758-2KP"},
+    {"manufacturer": "SNY", "product_code": 2560, "serial_str": "SNY0042", "name": "SONY TV", "cta": True},
+    {"manufacturer": "MSI", "product_code": 15522, "serial_str": "CA2A011223344", "name": "MSI MAG274QRF"},
+]
+
+CONNECTORS = [
+    "eDP-1", "DP-1", "DP-2", "HDMI-1", "DP-3", "DP-1-1", "DP-1-2", "DP-1-3",
+    "HDMI-2", "DP-4", "DP-2-1", "DP-2-2", "DP-2-3", "HDMI-3", "DP-5", "DP-6",
+]  # fmt: skip
+
+# Resolutions and refresh rates reported by typical monitors, largest first
+MODE_TABLE = [
+    (3840, 2160, [60.0, 59.94, 50.0, 30.0, 29.97, 25.0, 24.0, 23.98]),
+    (3200, 1800, [59.96]),
+    (2880, 1620, [59.96]),
+    (2560, 2880, [59.97]),
+    (2560, 1600, [59.99, 59.97]),
+    (2560, 1440, [144.0, 120.0, 99.95, 59.95]),
+    (2048, 1536, [60.0]),
+    (1920, 1440, [60.0]),
+    (1920, 1200, [59.95, 59.88]),
+    (1920, 1080, [144.0, 120.0, 100.0, 60.0, 59.94, 50.0, 30.0, 29.97, 25.0, 24.0, 23.98]),
+    (1856, 1392, [60.0]),
+    (1792, 1344, [60.0]),
+    (1680, 1050, [59.95, 59.88]),
+    (1600, 1200, [60.0]),
+    (1600, 900, [60.0, 59.95, 59.82]),
+    (1440, 900, [59.89]),
+    (1400, 1050, [59.98]),
+    (1368, 768, [59.88, 59.85]),
+    (1280, 1024, [75.02, 60.02]),
+    (1280, 960, [60.0]),
+    (1280, 800, [59.99, 59.97, 59.81, 59.91]),
+    (1280, 720, [60.0, 59.94, 50.0, 59.86, 59.74]),
+    (1152, 864, [75.0]),
+    (1024, 768, [75.03, 70.07, 60.0]),
+    (1024, 576, [59.95, 59.96, 59.9, 59.82]),
+    (960, 600, [59.93, 60.0]),
+    (960, 540, [59.96, 59.99, 59.63, 59.82]),
+    (864, 486, [59.92, 59.57]),
+    (832, 624, [74.55]),
+    (800, 600, [75.0, 72.19, 60.32, 56.25]),
+    (800, 450, [59.95, 59.82]),
+    (720, 576, [50.0]),
+    (720, 480, [60.0, 59.94]),
+    (720, 400, [70.08]),
+    (700, 450, [59.96, 59.88]),
+    (684, 384, [59.88, 59.85]),
+    (640, 512, [75.02, 60.02]),
+    (640, 480, [75.0, 72.81, 60.0, 59.94]),
+    (640, 400, [59.88, 59.98]),
+    (640, 360, [59.86, 59.83, 59.84, 59.32]),
+]
+
+# Properties xrandr --props lists for a connected output, besides the EDID
+PROPS = [
+    "\tscaling mode: None ",
+    "\t\tsupported: None, Full, Center, Full aspect",
+    "\tColorspace: Default ",
+    "\t\tsupported: Default, RGB_Wide_Gamut_Fixed_Point, BT2020_RGB, BT2020_YCC",
+    "\tmax bpc: 12 ",
+    "\t\trange: (6, 12)",
+    "\tBroadcast RGB: Automatic ",
+    "\t\tsupported: Automatic, Full, Limited 16:235",
+    "\taudio: auto ",
+    "\t\tsupported: force-dvi, off, auto, on",
+    "\tsubconnector: Native ",
+    "\t\tsupported: Unknown, VGA, DVI-D, HDMI, DP, Wireless, Native",
+    "\tHDCP Content Type: HDCP Type0 ",
+    "\t\tsupported: HDCP Type0, HDCP Type1",
+    "\tContent Protection: Undesired ",
+    "\t\tsupported: Undesired, Desired, Enabled",
+    "\tvrr_capable: 0 ",
+    "\t\trange: (0, 1)",
+    "\tCONNECTOR_ID: 95 ",
+    "\t\tsupported: 95",
+]
+
+
+def monitor_edid(monitor) -> str:
+    extensions = []
+    if monitor.get("cta"):
+        extensions.append(make_cta_ext())
+    if "displayid" in monitor:
+        serial, name = monitor["displayid"]
+        extensions.append(make_displayid_ext(serial, name))
+    return make_edid(
+        manufacturer=monitor["manufacturer"],
+        product_code=monitor["product_code"],
+        serial=monitor.get("serial", 0),
+        serial_str=monitor.get("serial_str"),
+        name=monitor.get("name"),
+        extensions=tuple(extensions),
+    )
+
+
+def edid_decode_text(monitor, edid_hex: str) -> str:
+    """
+    Write the report edid-decode prints for the EDID of a monitor.
+
+    The report is written by hand from the monitor spec, in edid-decode's format
+    but abridged to the hex dump, the identification and the descriptors, so that
+    it does not depend on the native decoder it is compared against.
+    """
+    raw = bytes.fromhex(edid_hex)
+    blocks = [raw[offset : offset + 128] for offset in range(0, len(raw), 128)]
+    lines = ["edid-decode (hex):", ""]
+    for block in blocks:
+        lines.extend(" ".join(f"{byte:02x}" for byte in block[row : row + 16]) for row in range(0, 128, 16))
+        lines.append("")
+    lines += [
+        "----------------",
+        "",
+        "Block 0, Base EDID:",
+        "  EDID Structure Version & Revision: 1.4",
+        "  Vendor & Product Identification:",
+        f"    Manufacturer: {monitor['manufacturer']}",
+        f"    Model: {monitor['product_code']}",
+    ]
+    if serial := monitor.get("serial"):
+        lines.append(f"    Serial Number: {serial} (0x{serial:08x})")
+    lines += ["    Made in: week 1 of 2020", "  Detailed Timing Descriptors:"]
+    descriptors = 0
+    if "serial_str" in monitor:
+        lines.append(f"    Display Product Serial Number: '{monitor['serial_str']}'")
+        descriptors += 1
+    if monitor.get("name"):
+        lines.append(f"    Display Product Name: '{monitor['name']}'")
+        descriptors += 1
+    lines += ["    Dummy Descriptor:"] * (4 - descriptors)
+    lines += [f"Extension blocks: {len(blocks) - 1}", f"Checksum: 0x{blocks[0][127]:02x}"]
+    for index, block in enumerate(blocks[1:], start=1):
+        lines.append("")
+        if block[0] == 0x02:
+            lines += [f"Block {index}, CTA-861 Extension Block:", "  Revision: 3"]
+        else:
+            serial, name = monitor["displayid"]
+            lines += [
+                f"Block {index}, DisplayID Extension Block:",
+                "  Version: 1.3",
+                "  Extension Count: 0",
+                "  Display Product Type: Extension Section",
+                "  Product Identification Data Block:",
+                # make_displayid_ext writes a fixed vendor and product code
+                "    Vendor ID: DEL",
+                "    Product Code: 4660",
+                f"    Serial Number: {serial}",
+                "    Year of Manufacture: 2030, Week 1",
+                f"    Product ID: {name}",
+            ]
+        lines.append(f"Checksum: 0x{block[127]:02x}")
+    return "\n".join(lines) + "\n"
+
+
+def xrandr_dump(edids: list) -> list:
+    outputs = []
+    x = 0
+    for index, edid in enumerate(edids):
+        width, height = MODE_TABLE[index % 3][:2]
+        modes = MODE_TABLE[index % 3 :]
+        outputs.append(
+            {
+                "name": CONNECTORS[index],
+                "primary": index == 0,
+                "edid": edid,
+                "position": (x, 0),
+                "modes": modes,
+                "current": (width, height, modes[0][2][0]),
+                "preferred": (width, height, modes[0][2][0]),
+            }
+        )
+        x += width
+    outputs.extend({"name": f"DP-{n}", "connected": False} for n in range(7, 10))
+    lines = []
+    for line in make_xrandr_output(outputs):
+        lines.append(line)
+        if line == "\t\tsupported: Good, Bad":
+            lines.extend(PROPS)
+    return lines
+
+
+def layouts_toml(uids: list) -> str:
+    rng = random.Random(0)
+    blocks = [f'[fallback_uid.{INTERNAL_UID}]\nManufacturer = "BOE"\nModel = "2445"\n']
+    for count in OUTPUT_COUNTS:
+        x = 0
+        for index, uid in enumerate(uids[:count]):
+            width, height = MODE_TABLE[index % 3][:2]
+            blocks.append(
+                f'[layouts.outputs_{count:02d}."{uid}"]\n'
+                f"primary = {'true' if index == 0 else 'false'}\n"
+                f"mode = [{width}, {height}]\n"
+                f"position = [{x}, 0]\n"
+                'rotation = "normal"\n'
+            )
+            x += width
+    for decoy in range(NUM_DECOY_LAYOUTS):
+        for uid in rng.sample(uids, rng.randint(1, 4)):
+            # Half of the decoys name a monitor that is never connected
+            uid = f"{uid}-{decoy}" if rng.random() < 0.5 else uid
+            blocks.append(f'[layouts.decoy_{decoy:03d}."{uid}"]\nmode = [1920, 1080]\n')
+    return "\n".join(blocks)
+
+
+def main():
+    (FIXTURES / "edid").mkdir(exist_ok=True)
+    (FIXTURES / "xrandr").mkdir(exist_ok=True)
+    edids = [monitor_edid(monitor) for monitor in MONITORS]
+    for index, edid in enumerate(edids):
+        (FIXTURES / "edid" / f"{index:02d}.hex").write_text(edid + "\n")
+        (FIXTURES / "edid" / f"{index:02d}.txt").write_text(edid_decode_text(MONITORS[index], edid))
+    for count in OUTPUT_COUNTS:
+        (FIXTURES / "xrandr" / f"outputs-{count:02d}.txt").write_text("\n".join(xrandr_dump(edids[:count])) + "\n")
+    uids = [Edid.from_edid_bytes(bytes.fromhex(edid)).serial or INTERNAL_UID for edid in edids]
+    (FIXTURES / "layouts.toml").write_text(layouts_toml(uids))
+
+
+if __name__ == "__main__":
+    main()
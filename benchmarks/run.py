@@ -0,0 +1,203 @@
+"""Offline benchmark suite on the recorded fixture corpus.
+
+Measures the stages of a screenman run separately on the xrandr dumps and EDIDs
+in benchmarks/fixtures, with the fake xrandr and edid-decode of benchmarks/bin
+on PATH, so that no X server or monitor is needed:
+
+- parse_xrandr: splitting a dump into outputs and decoding their EDIDs
+- edid_from_hex: decoding one EDID
+- determine_layout: matching the screens of a dump against layouts.toml
+- build_cmd: building the xrandr calls for every screen of a dump
+- plan_layout: planning the layout of a dump that is already active, the daemon's usual case
+- cli_main: `screenman --no-daemon --force` end to end, discovery through the fake xrandr
+
+The caches and the saved states go to a temporary directory instead of the
+user's. Run from the repository root. The results are compared against the
+saved baseline, entries slower than the tolerance are reported as regressions.
+They make the run fail if the baseline was recorded on this host, the absolute
+numbers of another one say little:
+
+    python -m benchmarks.run
+    python -m benchmarks.run --save   # record a new baseline
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from screenman import cli, config, daemon
+from screenman.config import Config
+from screenman.edid import Edid
+from screenman.screen import determine_layout, parse_xrandr, plan_layout
+from screenman.utils import RotateDirection
+
+BENCHMARKS = Path(__file__).parent
+FIXTURES = BENCHMARKS / "fixtures"
+BASELINE = BENCHMARKS / "baseline.json"
+
+# Runs per benchmark, the best one counts
+REPEAT = 20
+# Slowdown against the baseline reported as a regression
+TOLERANCE = 1.25
+
+
+def _best_us(func, repeat=REPEAT):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6
+
+
+def fake_environment() -> tempfile.TemporaryDirectory:
+    """
+    Put the fake executables on PATH, load the fixture config and move the caches
+    and the saved states to a temporary directory.
+
+    Returns:
+        tempfile.TemporaryDirectory: The directory, removed when it is cleaned up.
+    """
+    state_dir = tempfile.TemporaryDirectory(prefix="screenman-bench-")
+    # Keeps the fixture UIDs out of the output cache and the fingerprint of the user
+    os.environ["XDG_CACHE_HOME"] = os.environ["XDG_RUNTIME_DIR"] = state_dir.name
+    os.environ["PATH"] = f"{BENCHMARKS / 'bin'}{os.pathsep}{os.environ['PATH']}"
+    config._config = Config.from_toml(FIXTURES / "layouts.toml")
+    return state_dir
+
+
+def dumps():
+    return sorted((FIXTURES / "xrandr").glob("outputs-*.txt"))
+
+
+def bench_parse_xrandr(results):
+    for dump in dumps():
+        lines = dump.read_text().splitlines()
+        results[f"parse_xrandr[{dump.stem}]"] = _best_us(lambda: parse_xrandr(lines))
+
+
+def bench_edid(results):
+    for path in sorted((FIXTURES / "edid").glob("*.hex")):
+        edid_hex = path.read_text().strip()
+        results[f"edid_from_hex[{path.stem}]"] = _best_us(lambda: Edid.from_edid_hex(edid_hex))
+
+
+def bench_determine_layout(results):
+    for dump in dumps():
+        screens = parse_xrandr(dump.read_text().splitlines())
+        results[f"determine_layout[{dump.stem}]"] = _best_us(lambda: determine_layout(screens))
+
+
+def bench_build_cmd(results):
+    for dump in dumps():
+        screens = parse_xrandr(dump.read_text().splitlines())
+        for index, screen in enumerate(screens):
+            if screen.is_enabled:
+                screen.rotation = RotateDirection.Left
+                screen.position = ("--pos", f"{index * 100}x0")
+        results[f"build_cmd[{dump.stem}]"] = _best_us(lambda: [s.build_cmd() for s in screens])
+
+
+def bench_plan_layout(results):
+    for dump in dumps():
+        screens = parse_xrandr(dump.read_text().splitlines())
+        layout_name = determine_layout(screens)
+        results[f"plan_layout[{dump.stem}]"] = _best_us(lambda: plan_layout(screens, layout_name))
+
+
+def bench_cli_main(results):
+    run_command = daemon.run_command
+    commands = []
+
+    def counted(*args, **kwargs):
+        commands.append(args)
+        return run_command(*args, **kwargs)
+
+    daemon.run_command = counted
+    try:
+        for dump in dumps():
+            os.environ["SCREENMAN_FAKE_XRANDR"] = str(dump)
+            for name, args in [("print_info", ["--print-info"]), ("apply", [])]:
+                # Without --force, repeated runs would measure the skip of the unchanged fingerprint
+                argv = ["--no-daemon", "--force", "--log-level", "ERROR", *args]
+
+                def run():
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        cli.main(argv, standalone_mode=False)
+
+                commands.clear()
+                results[f"cli_main_{name}[{dump.stem}]"] = _best_us(run)
+                if len(commands) != REPEAT:
+                    raise RuntimeError(f"{REPEAT - len(commands)} runs of cli_main_{name} skipped the discovery")
+    finally:
+        daemon.run_command = run_command
+
+
+def compare(results: dict, baseline: dict) -> list:
+    """Print the results next to the baseline, return the names of the regressions."""
+    regressions = []
+    print(f"{'benchmark':<40} {'best [us]':>11} {'baseline':>11} {'ratio':>7}")
+    for name, value in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print(f"{name:<40} {value:11.1f} {'-':>11} {'-':>7}")
+            continue
+        ratio = value / reference
+        flag = ""
+        if ratio > TOLERANCE:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<40} {value:11.1f} {reference:11.1f} {ratio:7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--baseline", type=Path, default=BASELINE, help="baseline file to compare against")
+    args = parser.parse_args()
+
+    logger.remove()
+    results = {}
+    with fake_environment():
+        for bench in (
+            bench_parse_xrandr,
+            bench_edid,
+            bench_determine_layout,
+            bench_build_cmd,
+            bench_plan_layout,
+            bench_cli_main,
+        ):
+            bench(results)
+    logger.remove()
+
+    record = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    regressions = compare(results, record.get("results", {}))
+
+    if args.save:
+        record = {
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }
+        args.baseline.write_text(json.dumps(record, indent=2) + "\n")
+        print(f"Saved the baseline to {args.baseline}")
+    elif regressions:
+        print(f"{len(regressions)} benchmarks are more than {TOLERANCE:.2f}x slower than the baseline")
+        if record.get("host") == platform.node():
+            sys.exit(1)
+        print("The baseline was recorded on another host, record one for this host with --save")
+
+
+if __name__ == "__main__":
+    main()
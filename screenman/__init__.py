@@ -2,11 +2,16 @@
 
 __author__ = """Hendrik Klug"""
 __email__ = "hendrik.klug@gmail.com"
-from importlib.metadata import version as _version
 
-__version__ = _version("screenman")
 
-from screenman.config import Config
+def __getattr__(name):
+    # The version and the configuration are looked up lazily on first use, not on import
+    if name == "__version__":
+        from importlib.metadata import version
 
-# Load the configuration
-toml_config = Config.load_from_toml()
+        return version("screenman")
+    if name == "toml_config":
+        from screenman.config import get_config
+
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,191 @@
+"""On-disk caches for screenman."""
+
+import atexit
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+
+def cache_dir() -> Path:
+    """Return the user cache directory of screenman."""
+    from platformdirs import user_cache_dir
+
+    return Path(user_cache_dir("screenman"))
+
+
+def content_key(data: bytes) -> str:
+    """Return a content address for the given bytes."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def fallback_key(fallback_uid: dict) -> str:
+    """Return a content address for the `fallback_uid` table of the configuration."""
+    return content_key(json.dumps(fallback_uid, sort_keys=True).encode())
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """Write a file atomically, so concurrent runs never read a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def atomic_write_text(path: Path, text: str):
+    atomic_write_bytes(path, text.encode())
+
+
+class EdidCache:
+    """
+    Size-bounded LRU cache of decoded EDID fields, keyed by a hash of the raw EDID bytes.
+
+    The resolved fallback UID depends on the `fallback_uid` table of the configuration,
+    so all entries are dropped when that table changes.
+
+    Attributes:
+        path (Path): The JSON file backing the cache.
+        max_entries (int): The maximum number of EDIDs kept, least recently used are evicted first.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path: Path, fallback_uid: dict, max_entries: int = 64):
+        self.path = path
+        self.max_entries = max_entries
+        self._fallback_key = fallback_key(fallback_uid)
+        self._entries: Optional[OrderedDict] = None
+        self._dirty = False
+        self._save_registered = False
+
+    def _load(self) -> OrderedDict:
+        if self._entries is None:
+            self._entries = OrderedDict()
+            try:
+                data = json.loads(self.path.read_text())
+                if data.get("version") == self.VERSION and data.get("fallback") == self._fallback_key:
+                    self._entries.update(data["entries"])
+                else:
+                    logger.debug("EDID cache is stale, dropping all entries.")
+                    self._mark_dirty()
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError, AttributeError) as e:
+                logger.debug(f"Ignoring unreadable EDID cache '{self.path}': {e}")
+        return self._entries
+
+    def get(self, edid_bytes: bytes) -> Optional[dict]:
+        """Return the cached fields for the EDID, or None on a miss."""
+        entries = self._load()
+        key = content_key(edid_bytes)
+        fields = entries.get(key)
+        if fields is not None and next(reversed(entries)) != key:
+            entries.move_to_end(key)
+            self._mark_dirty()
+        return fields
+
+    def put(self, edid_bytes: bytes, fields: dict):
+        """Store the decoded fields of the EDID, evicting the least recently used entries."""
+        entries = self._load()
+        key = content_key(edid_bytes)
+        entries[key] = fields
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        self._mark_dirty()
+
+    def clear(self):
+        self._entries = OrderedDict()
+        self._mark_dirty()
+
+    def _mark_dirty(self):
+        if not self._save_registered:
+            atexit.register(self.save)
+            self._save_registered = True
+        self._dirty = True
+
+    def save(self):
+        """Write the cache back to disk if it changed."""
+        if not self._dirty or self._entries is None:
+            return
+        data = {"version": self.VERSION, "fallback": self._fallback_key, "entries": self._entries}
+        try:
+            atomic_write_text(self.path, json.dumps(data))
+            self._dirty = False
+        except OSError as e:
+            logger.debug(f"Failed to write EDID cache '{self.path}': {e}")
+
+
+class OutputCache:
+    """
+    The UIDs of the monitors last seen on each output, keyed by the output name and a hash of its modes.
+
+    Filled by every full probe, it lets the cheaper probes that do not read the
+    EDIDs, or do not reprobe the outputs, tell whether an output still shows the
+    monitor it showed then, see screen.connected_screens. Like in the EdidCache,
+    all entries are dropped when the `fallback_uid` table changes.
+
+    Attributes:
+        path (Path): The JSON file backing the cache.
+        max_entries (int): The maximum number of outputs kept, the oldest are evicted first.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path, fallback_uid: dict, max_entries: int = 64):
+        self.path = path
+        self.max_entries = max_entries
+        self._fallback_key = fallback_key(fallback_uid)
+        self._entries: Optional[OrderedDict] = None
+
+    @staticmethod
+    def key(name: str, modes_key: str) -> str:
+        return f"{name}\0{modes_key}"
+
+    def _load(self) -> OrderedDict:
+        if self._entries is None:
+            self._entries = OrderedDict()
+            try:
+                data = json.loads(self.path.read_text())
+                if data.get("version") == self.VERSION and data.get("fallback") == self._fallback_key:
+                    self._entries.update(data["entries"])
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError, AttributeError) as e:
+                logger.debug(f"Ignoring unreadable output cache '{self.path}': {e}")
+        return self._entries
+
+    def lookup(self, name: str, modes_key: str) -> tuple[bool, Optional[str]]:
+        """Return whether the output is known, and the UID of its monitor, None for monitors without one."""
+        entries = self._load()
+        key = self.key(name, modes_key)
+        return key in entries, entries.get(key)
+
+    def update(self, outputs: dict):
+        """
+        Remember the monitors of a full probe, written to disk at once if anything changed.
+
+        Args:
+            outputs (dict): Maps (output name, modes key) to the UID of the monitor.
+        """
+        entries = self._load()
+        changed = False
+        for (name, modes_key), uid in outputs.items():
+            key = self.key(name, modes_key)
+            if key not in entries or entries[key] != uid:
+                entries[key] = uid
+                changed = True
+            entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            changed = True
+        if changed:
+            try:
+                data = {"version": self.VERSION, "fallback": self._fallback_key, "entries": entries}
+                atomic_write_text(self.path, json.dumps(data))
+            except OSError as e:
+                logger.debug(f"Failed to write output cache '{self.path}': {e}")
@@ -1,15 +1,17 @@
 """Console script for screenman."""
 
+import contextlib
 import sys
-from importlib.metadata import version
 
 import click
-from loguru import logger
 
-from screenman.screen import apply_layout, apply_mirror, connected_screens, determine_layout
+# Only click is imported at start-up, so that --help and --version stay fast.
+# Everything else is imported in the code paths that need it.
 
 
 def configure_logger(log_level="INFO", log_file=None):
+    from loguru import logger
+
     logger.remove()  # Remove default logger
     logger.add(sys.stderr, level=log_level)  # Add stderr logging with chosen level
 
@@ -17,8 +19,25 @@ def configure_logger(log_level="INFO", log_file=None):
         logger.add(log_file, rotation="1 MB", retention="10 days", level=log_level)
 
 
-@click.command()
-@click.version_option(version=version("screenman"), prog_name="screenman")
+def print_version(ctx, param, value):
+    """Print the version, looking up the package metadata only when asked for."""
+    if not value or ctx.resilient_parsing:
+        return
+    from screenman import __version__
+
+    click.echo(f"screenman, version {__version__}")
+    ctx.exit()
+
+
+@click.group(invoke_without_command=True)
+@click.option(
+    "--version",
+    is_flag=True,
+    expose_value=False,
+    is_eager=True,
+    callback=print_version,
+    help="Show the version and exit.",
+)
 @click.option(
     "--log-level",
     default="INFO",
@@ -34,7 +53,8 @@ def configure_logger(log_level="INFO", log_file=None):
 @click.option(
     "--rescan-pci",
     is_flag=True,
-    help="Rescan PCI bus before applying layout. Useful for dock/display detection issues after resume.",
+    help="Rescan PCI bus and wait for the connectors to settle before discovering the screens. "
+    "Useful for dock/display detection issues after resume.",
 )
 @click.option(
     "--mirror",
@@ -46,34 +66,223 @@ def configure_logger(log_level="INFO", log_file=None):
     is_flag=True,
     help="Revert mirroring and apply the normal layout.",
 )
-def main(log_level, log_file, print_info, rescan_pci, mirror, mirror_off):
+@click.option(
+    "--edid-cross-check",
+    is_flag=True,
+    help="Compare the built-in EDID decoder against edid-decode and log mismatches.",
+)
+@click.option(
+    "--backend",
+    type=click.Choice(["xrandr", "sysfs", "randr", "sway"]),
+    default="xrandr",
+    show_default=True,
+    help="How to discover the screens. sysfs reads /sys/class/drm without reprobing the outputs, "
+    "randr talks to the X server directly, also to apply the layout (needs python-xlib), "
+    "sway talks to sway over $SWAYSOCK, also to apply the layout.",
+)
+@click.option(
+    "--probe",
+    type=click.Choice(["full", "current", "modes"]),
+    default="full",
+    show_default=True,
+    help="How deep to discover the screens. full reprobes the outputs, current reads the state the "
+    "X server has cached, modes also skips the EDIDs of the monitors seen before. The cheap levels "
+    "reprobe in full when an output shows a monitor that was not seen before. modes tells the monitors "
+    "apart by their modes, two identical ones that swapped connectors get each other's UIDs.",
+)
+@click.option(
+    "--no-daemon",
+    is_flag=True,
+    help="Run in this process even if a screenman daemon is running.",
+)
+@click.option(
+    "--display",
+    "displays",
+    multiple=True,
+    metavar="DISPLAY",
+    help="Run on this X display instead of $DISPLAY. Repeat it to run on several displays concurrently, "
+    "each with its own layout match.",
+)
+@click.option(
+    "--all-displays",
+    is_flag=True,
+    help="Run on every local X display found in /tmp/.X11-unix concurrently, e.g. the seats of a multi-seat host.",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Discover the screens and apply the layout even if the monitors, the X state and the "
+    "configuration are unchanged since the last apply.",
+)
+@click.option(
+    "--timings",
+    "show_timings",
+    is_flag=True,
+    help="Print the wall time and subprocess count of every phase (discovery, PCI rescan, reset, apply). "
+    "Runs in this process.",
+)
+@click.option(
+    "--timings-file",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write the phase timings to this file. Runs in this process.",
+)
+@click.option(
+    "--timings-format",
+    type=click.Choice(["json", "chrome"]),
+    default="json",
+    show_default=True,
+    help="Format of --timings-file, chrome writes a trace for chrome://tracing or Perfetto.",
+)
+@click.pass_context
+def main(
+    ctx,
+    log_level,
+    log_file,
+    print_info,
+    rescan_pci,
+    mirror,
+    mirror_off,
+    edid_cross_check,
+    backend,
+    probe,
+    no_daemon,
+    displays,
+    all_displays,
+    force,
+    show_timings,
+    timings_file,
+    timings_format,
+):
     """Console script for screenman."""
-    configure_logger(log_level, log_file)
-
     if mirror and mirror_off:
         raise click.UsageError("Cannot use --mirror and --mirror-off together.")
 
-    screens = connected_screens()
+    timed = show_timings or timings_file
+    multi_display = bool(displays) or all_displays
+    fast_path = not (
+        force or timed or rescan_pci or edid_cross_check or print_info or mirror or mirror_off or multi_display
+    )
+    if fast_path and ctx.invoked_subcommand is None:
+        from screenman import fingerprint
 
-    if mirror:
-        apply_mirror(screens)
-        return
+        # Checked before the logger is set up, importing loguru costs more than the check
+        state = fingerprint.unchanged()
+        if state is not None:
+            if log_file or log_level in ("TRACE", "DEBUG"):
+                configure_logger(log_level, log_file)
+                from loguru import logger
 
-    if mirror_off:
-        logger.info("Reverting mirror mode, applying normal layout.")
+                logger.debug(f"Nothing changed since layout {state['layout']} was applied, skipping.")
+            return
 
-    layout_name = determine_layout(screens)
-    if print_info:
-        for s in screens:
-            print(s)
-        print(f"Layout: {layout_name}")
+    recorder = None
+    if timed and ctx.invoked_subcommand is None:
+        from screenman import timings
+
+        recorder = timings.enable()
+
+    with recorder.phase("configure_logger") if recorder else contextlib.nullcontext():
+        configure_logger(log_level, log_file)
+
+    if ctx.invoked_subcommand is not None:
+        from screenman.edid import Edid
+
+        Edid.CROSS_CHECK = edid_cross_check
+        ctx.obj = {"backend": backend}
         return
 
-    if layout_name:
-        logger.info(f"Applying layout: {layout_name}")
-        apply_layout(screens, layout_name, do_rescan_pci=rescan_pci)
+    from loguru import logger
+
+    if print_info:
+        command = "print-info"
+    elif mirror:
+        command = "mirror"
+    elif mirror_off:
+        command = "mirror-off"
     else:
-        logger.info("No matching layout found.")
+        command = "apply"
+
+    # The daemon runs with its own backend and display, without the cross-check and the timings
+    if not no_daemon and not edid_cross_check and recorder is None and not multi_display:
+        from screenman import ipc
+
+        response = ipc.call(command, rescan_pci=rescan_pci, probe=probe)
+        if response is not None:
+            logger.debug(f"Ran {command} in the screenman daemon")
+            if not response["ok"]:
+                raise click.ClickException(response["error"])
+            if response["output"]:
+                print(response["output"])
+            return
+
+    from screenman import timings
+
+    with timings.phase("import"):
+        from screenman.daemon import run_command
+        from screenman.edid import Edid
+
+    Edid.CROSS_CHECK = edid_cross_check
+    failed = []
+    try:
+        if multi_display:
+            from screenman import displays as multi
+
+            names: list[str] = list(dict.fromkeys([*displays, *(multi.find_displays() if all_displays else [])]))
+            if not names:
+                raise click.ClickException(f"No X displays found in {multi.X11_SOCKET_DIR}")
+            results = multi.run_on_displays(
+                names, command, backend=backend, rescan_pci=rescan_pci, probe=probe
+            )
+            output = multi.report(results)
+            failed = [result.display for result in results if not result.ok]
+        else:
+            output = run_command(command, backend=backend, rescan_pci=rescan_pci, probe=probe)
+    finally:
+        if recorder is not None:
+            timings.disable()
+            if show_timings:
+                click.echo(recorder.report(), err=True)
+            if timings_file:
+                recorder.write(timings_file, timings_format)
+    if output:
+        print(output)
+    if failed:
+        raise click.ClickException(f"Failed on {len(failed)} of {len(displays)} displays: {', '.join(failed)}")
+
+
+@main.command()
+@click.option(
+    "--debounce",
+    default=0.5,
+    show_default=True,
+    help="Seconds without a new hotplug event before the layout is applied.",
+)
+@click.option(
+    "--no-hotplug",
+    is_flag=True,
+    help="Only serve the CLI on the socket, do not listen for hotplug events.",
+)
+@click.pass_obj
+def daemon(obj, debounce, no_hotplug):
+    """
+    Stay resident and apply the matching layout whenever a display is plugged or unplugged.
+
+    The daemon also serves the CLI on a Unix socket in $XDG_RUNTIME_DIR: while it
+    runs, `screenman` forwards its commands to it.
+
+    Changes to the configuration file are picked up without a restart.
+    """
+    from screenman.daemon import Daemon, QueueSource, UeventSource
+    from screenman.ipc import socket_path
+
+    source = QueueSource() if no_hotplug else UeventSource()
+    try:
+        Daemon(
+            source, backend=obj["backend"], debounce=debounce, server_path=socket_path(), watch_config=True
+        ).run()
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
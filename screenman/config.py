@@ -1,16 +1,36 @@
 from screenman.utils import ScreenSettings
 
 
-from platformdirs import site_config_dir, user_config_dir
-
-
-import tomllib
+import pickle
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional, Union
+
+from loguru import logger
 
+from screenman import timings
+from screenman.cache import atomic_write_bytes, cache_dir
+from screenman.layouts import LayoutIndex, LayoutPlans
 from screenman.utils import str_to_rot
 
+CONFIG_NAME = "screenman.toml"
+
+
+def config_paths() -> list[Path]:
+    """Return the candidate configuration files, in order of priority."""
+    from platformdirs import site_config_dir, user_config_dir
+
+    return [
+        path / CONFIG_NAME
+        for path in (
+            Path.cwd(),
+            Path.home(),
+            Path(user_config_dir(roaming=True)),
+            Path(user_config_dir("screenman", roaming=False)),
+            Path(site_config_dir()),
+        )
+    ]
+
 
 @dataclass
 class Config:
@@ -19,47 +39,158 @@ class Config:
     # This will not be a unique identifier, so it will not work if you have multiple monitors of the same model
     fallback_uid: Dict[str, Dict[str, str]] = field(default_factory=dict)
     layouts: Dict[str, Dict[str, ScreenSettings]] = field(default_factory=dict)
+    _layout_index: Optional[LayoutIndex] = field(default=None, init=False, repr=False, compare=False)
+    _layout_plans: Optional[LayoutPlans] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def layout_index(self) -> LayoutIndex:
+        """The index used to match screens against the layouts, rebuilt if the layouts are replaced."""
+        if self._layout_index is None or self._layout_index.layouts is not self.layouts:
+            self._layout_index = LayoutIndex(self.layouts)
+        return self._layout_index
+
+    @property
+    def layout_plans(self) -> LayoutPlans:
+        """The compiled targets of the layouts, rebuilt if the layouts are replaced."""
+        if self._layout_plans is None or self._layout_plans.layouts is not self.layouts:
+            self._layout_plans = LayoutPlans(self.layouts)
+        return self._layout_plans
+
+    @classmethod
+    def from_toml(cls, path: Path) -> "Config":
+        # Only needed on a compiled config cache miss
+        import tomllib
+
+        with open(path, "rb") as f:
+            config_data = tomllib.load(f)
+        fallback_uid = config_data.get("fallback_uid", {})
+        layouts = {
+            layout_name: {
+                screen_name: ScreenSettings(
+                    resolution=tuple(screen_data.get("mode", (0, 0))),
+                    is_primary=screen_data.get("primary", False),
+                    is_enabled=screen_data.get("enabled", True),
+                    rotation=str_to_rot(screen_data.get("rotation", "normal")),
+                    position=(
+                        "--pos",
+                        f"{screen_data['position'][0]}x{screen_data['position'][1]}",
+                    )
+                    if "position" in screen_data
+                    else None,
+                    rate=parse_rate(screen_data.get("rate"), f"layouts.{layout_name}.{screen_name}"),
+                )
+                for screen_name, screen_data in layout_screens.items()
+            }
+            for layout_name, layout_screens in config_data.get("layouts", {}).items()
+        }
+        config = cls(fallback_uid=fallback_uid, layouts=layouts)
+        # Built now, so that they are stored in the compiled config cache
+        config.layout_index
+        config.layout_plans
+        return config
 
     @classmethod
+    @timings.timed("load_config")
     def load_from_toml(cls) -> "Config":
-        config_paths = [
-            Path.cwd(),
-            Path.home(),
-            Path(user_config_dir(roaming=True)),
-            Path(user_config_dir("screenman", roaming=False)),
-            Path(site_config_dir()),
-        ]
-        for path in config_paths:
-            path = path / "screenman.toml"
-            if path and path.exists():
-                try:
-                    with open(path, "rb") as f:
-                        config_data = tomllib.load(f)
-                    fallback_uid = config_data.get("fallback_uid", {})
-                    layouts = {
-                        layout_name: {
-                            screen_name: ScreenSettings(
-                                resolution=tuple(screen_data.get("mode", (0, 0))),
-                                is_primary=screen_data.get("primary", False),
-                                is_enabled=screen_data.get("enabled", True),
-                                rotation=str_to_rot(
-                                    screen_data.get("rotation", "normal")
-                                ),
-                                position=(
-                                    "--pos",
-                                    f"{screen_data['position'][0]}x{screen_data['position'][1]}",
-                                )
-                                if "position" in screen_data
-                                else None,
-                            )
-                            for screen_name, screen_data in layout_screens.items()
-                        }
-                        for layout_name, layout_screens in config_data.get(
-                            "layouts", {}
-                        ).items()
-                    }
-                    return cls(fallback_uid=fallback_uid, layouts=layouts)
-                except Exception as e:
-                    print(f"Failed to load configuration file '{path}': {e}")
+        """
+        Load the first readable configuration file, using the compiled config cache.
+
+        The compiled cache stores the winning path together with its mtime and size.
+        If discovery finds the same file unchanged, the pickled config is used and the
+        TOML parsing is skipped.
+        """
+        compiled = CompiledConfigCache(cache_dir() / "config.pickle")
+        for path in config_paths():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if (config := compiled.get(path, stat)) is not None:
+                return config
+            try:
+                config = cls.from_toml(path)
+            except Exception as e:
+                print(f"Failed to load configuration file '{path}': {e}")
+                continue
+            compiled.put(path, stat, config)
+            return config
         # Default configuration if no config file is found
-        return cls()
\ No newline at end of file
+        return cls()
+
+
+def parse_rate(value, key: str = "rate") -> Optional[Union[float, str]]:
+    """
+    Validate the `rate` of a screen in the configuration.
+
+    Args:
+        value: The configured value, None if the key is missing.
+        key (str): Where the value comes from, for the error message.
+
+    Returns:
+        The rate in Hz, "max", or None if no rate is configured.
+
+    Raises:
+        ValueError: If the value is neither a positive number nor "max".
+    """
+    if value is None or value == "max":
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0:
+        return float(value)
+    raise ValueError(f'{key}.rate must be a positive number or "max", not {value!r}')
+
+
+class CompiledConfigCache:
+    """
+    On-disk cache of the parsed configuration, keyed by the path, mtime and size of the TOML file.
+
+    Attributes:
+        path (Path): The pickle file backing the cache.
+    """
+
+    # Bumped whenever the pickled classes change
+    VERSION = 5
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    @staticmethod
+    def _key(config_path: Path, stat) -> tuple:
+        return (CompiledConfigCache.VERSION, str(config_path), stat.st_mtime_ns, stat.st_size)
+
+    def get(self, config_path: Path, stat) -> Optional[Config]:
+        """Return the compiled config if it was built from the same, unchanged file."""
+        try:
+            with open(self.path, "rb") as f:
+                key, config = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug(f"Ignoring unreadable config cache '{self.path}': {e}")
+            return None
+        if key != self._key(config_path, stat):
+            return None
+        return config
+
+    def put(self, config_path: Path, stat, config: Config):
+        try:
+            atomic_write_bytes(self.path, pickle.dumps((self._key(config_path, stat), config)))
+        except OSError as e:
+            logger.debug(f"Failed to write config cache '{self.path}': {e}")
+
+
+_config: Optional[Config] = None
+
+
+def get_config() -> Config:
+    """Return the configuration, loading it on first use."""
+    global _config
+    if _config is None:
+        _config = Config.load_from_toml()
+    return _config
+
+
+def swap_config(config: Config) -> Config:
+    """Make the configuration the active one in a single assignment, returning the previous one."""
+    global _config
+    previous, _config = get_config(), config
+    return previous
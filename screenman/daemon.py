@@ -0,0 +1,407 @@
+"""Resident mode: re-apply the matching layout whenever a display is plugged or unplugged.
+
+The daemon waits for DRM change events from the kernel, lets the burst of events
+a dock produces settle, and then runs discovery and applies the matching layout.
+The compiled config and the decoded EDIDs stay in memory between events, and as
+layouts are applied as a diff, an event that changes nothing runs no xrandr call.
+
+Events come from an EventSource. UeventSource listens on the kernel uevent
+netlink socket, QueueSource takes events pushed by the caller, e.g. in tests.
+
+The daemon also serves the CLI on a Unix socket (see screenman.ipc), so that a
+keypress only pays for the client start-up and the X round-trip.
+"""
+
+import abc
+import json
+import os
+import queue
+import select
+import socket
+import socketserver
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+from screenman import fingerprint, mirror
+from screenman.config import config_paths, get_config
+from screenman.edid import Edid
+from screenman.ipc import COMMANDS
+from screenman.screen import apply_layout, apply_mirror, connected_screens, determine_layout
+from screenman.sysfs import rescan_and_settle
+from screenman.watch import ConfigWatcher
+
+# Netlink protocol and multicast group of the kernel uevents
+NETLINK_KOBJECT_UEVENT = 15
+UEVENT_KERNEL_GROUP = 1
+UEVENT_BUFFER_SIZE = 16384
+
+# Seconds without a new event before a burst counts as settled
+DEBOUNCE_SECONDS = 0.5
+# Upper bound of the wait for a burst to settle, in seconds
+MAX_SETTLE_SECONDS = 5.0
+
+
+def parse_uevent(data: bytes) -> dict:
+    """
+    Parse a kernel uevent message.
+
+    Args:
+        data (bytes): The message, a `action@devpath` header followed by
+            NUL-separated KEY=value pairs.
+
+    Returns:
+        dict: The key/value pairs of the event, empty if it is not a kernel uevent.
+    """
+    header, _, rest = data.partition(b"\0")
+    if b"@" not in header:
+        return {}
+    event = {}
+    for item in rest.split(b"\0"):
+        key, sep, value = item.partition(b"=")
+        if sep:
+            event[key.decode(errors="replace")] = value.decode(errors="replace")
+    return event
+
+
+def remember_layout(layout_name: Optional[str]):
+    """Save the fingerprint of the hardware and the X state the layout was applied to, see screenman.fingerprint."""
+    try:
+        if not fingerprint.save(layout_name, config_paths()):
+            logger.debug("Cannot fingerprint the hardware or the X state, the next run will not be skipped")
+    except OSError as e:
+        logger.debug(f"Failed to save the fingerprint: {e}")
+
+
+def remember_mirror(restore, configs, x_before: Optional[str]):
+    """Save both directions of the mirror toggle, see screenman.mirror."""
+    try:
+        if not mirror.save(restore, configs, x_before):
+            logger.debug("Cannot fingerprint the hardware or the X state, the mirror toggle needs discovery")
+    except OSError as e:
+        logger.debug(f"Failed to save the mirror state: {e}")
+
+
+@dataclass
+class CommandResult:
+    """
+    What a CLI command did.
+
+    Attributes:
+        output (str): The text to print, empty if there is none.
+        layout_name (Optional[str]): The layout matching the screens, None for mirror or if none matched.
+    """
+
+    output: str = ""
+    layout_name: Optional[str] = None
+
+
+def execute_command(
+    command: str, backend: str = "xrandr", rescan_pci: bool = False, probe: str = "full"
+) -> CommandResult:
+    """
+    Discover the screens and run a CLI command on them.
+
+    Args:
+        command (str): One of screenman.ipc.COMMANDS.
+        backend (str): The discovery and apply backend, see connected_screens.
+        rescan_pci (bool): If True, rescan the PCI bus and wait for the connectors
+            to settle before discovering the screens. The outputs are then reprobed in full.
+        probe (str): How deep discovery looks, see screen.PROBE_LEVELS.
+
+    Returns:
+        CommandResult: The text to print and the matching layout.
+    """
+    if command not in COMMANDS:
+        raise ValueError(f"Unknown command: {command}")
+    if command in ("mirror", "mirror-off") and not rescan_pci and mirror.toggle(command, backend=backend):
+        return CommandResult()
+    if rescan_pci:
+        rescan_and_settle()
+        probe = "full"
+    screens = connected_screens(backend=backend, probe=probe)
+
+    if command == "mirror":
+        # Mirrored already, e.g. by hand, there is no state worth restoring, and sysfs
+        # cannot report the position, primary and rotation of the outputs to restore
+        remember = all(screen.state_known and not screen.same_as for screen in screens)
+        x_before = fingerprint.x_state() if remember else None
+        restore, configs = apply_mirror(screens, backend=backend)
+        if remember:
+            remember_mirror(restore, configs, x_before)
+        return CommandResult()
+
+    if command == "mirror-off":
+        logger.info("Reverting mirror mode, applying normal layout.")
+
+    layout_name = determine_layout(screens)
+    if command == "print-info":
+        return CommandResult("\n".join([*(str(s) for s in screens), f"Layout: {layout_name}"]), layout_name)
+
+    if layout_name:
+        logger.info(f"Applying layout: {layout_name}")
+        apply_layout(screens, layout_name, backend=backend)
+    else:
+        logger.info("No matching layout found.")
+    remember_layout(layout_name)
+    return CommandResult(layout_name=layout_name)
+
+
+def run_command(command: str, backend: str = "xrandr", rescan_pci: bool = False, probe: str = "full") -> str:
+    """Run a CLI command, see execute_command, and return the text to print."""
+    return execute_command(command, backend=backend, rescan_pci=rescan_pci, probe=probe).output
+
+
+class EventSource(abc.ABC):
+    """Source of hotplug events for the daemon."""
+
+    @abc.abstractmethod
+    def wait(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """
+        Wait for the next event.
+
+        Args:
+            timeout (Optional[float]): Seconds to wait, None to wait forever.
+
+        Returns:
+            dict: The event, None if none arrived in time.
+
+        Raises:
+            EOFError: If the source is closed.
+        """
+
+    def close(self):
+        pass
+
+
+class UeventSource(EventSource):
+    """
+    Hotplug uevents of one subsystem, read from the netlink socket.
+
+    Only the events with HOTPLUG=1 are returned, and of those not the ones
+    announcing a changed connector PROPERTY, e.g. content protection. The drm
+    subsystem also sends lease changes and GPU errors and resets, none of
+    which change the connected monitors.
+    """
+
+    def __init__(self, subsystem: str = "drm"):
+        self.subsystem = subsystem
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+        self.sock.bind((0, UEVENT_KERNEL_GROUP))
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[dict]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if self.sock.fileno() < 0:
+                raise EOFError("uevent socket closed")
+            readable, _, _ = select.select([self.sock], [], [], remaining)
+            if not readable:
+                return None
+            event = parse_uevent(self.sock.recv(UEVENT_BUFFER_SIZE))
+            if event.get("SUBSYSTEM") == self.subsystem and event.get("HOTPLUG") == "1" and "PROPERTY" not in event:
+                return event
+
+    def close(self):
+        self.sock.close()
+
+
+class QueueSource(EventSource):
+    """Events pushed by the caller, from any thread."""
+
+    _CLOSED = object()
+
+    def __init__(self):
+        self.events = queue.Queue()
+
+    def push(self, event: Optional[dict] = None):
+        self.events.put(event or {"ACTION": "change", "SUBSYSTEM": "drm", "HOTPLUG": "1"})
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[dict]:
+        try:
+            event = self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if event is self._CLOSED:
+            raise EOFError("event source closed")
+        return event
+
+    def close(self):
+        self.events.put(self._CLOSED)
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    """Run the command of one CLI connection, see screenman.ipc for the protocol."""
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            server = self.server
+            assert isinstance(server, CommandServer)
+            output = server.daemon.handle(request.pop("command", None), **request)
+            response = {"ok": True, "output": output}
+        except Exception as e:
+            logger.exception("Failed to run the command")
+            response = {"ok": False, "error": str(e)}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class CommandServer(socketserver.UnixStreamServer):
+    """Unix socket server of the daemon, handling one command at a time."""
+
+    # Seconds between checks for a shutdown request
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, path: Path, daemon: "Daemon"):
+        self.path = path
+        self.daemon = daemon
+        if path.exists():
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(str(path))
+            except ConnectionRefusedError:
+                # Left behind by a daemon that did not shut down cleanly
+                path.unlink()
+            else:
+                raise RuntimeError(f"A screenman daemon is already listening on {path}")
+            finally:
+                probe.close()
+        super().__init__(str(path), CommandHandler)
+        os.chmod(path, 0o600)
+
+    def server_close(self):
+        super().server_close()
+        self.path.unlink(missing_ok=True)
+
+
+class Daemon:
+    """
+    Apply the matching layout at start-up and after every burst of hotplug events.
+
+    Attributes:
+        source (EventSource): Where the events come from.
+        backend (str): The discovery and apply backend, see connected_screens.
+        debounce (float): Seconds without a new event before a burst counts as settled.
+        max_settle (float): Upper bound of the wait for a burst to settle, in seconds.
+        server_path (Optional[Path]): Where to serve the CLI, None to not serve it.
+        watch_config (bool): If True, reload the configuration when its file changes
+            and apply the layout matching the screens under the new one.
+        screens (list): The screens found by the last discovery.
+        layout_name (Optional[str]): The layout applied last.
+        ready (threading.Event): Set once the layout is applied and the CLI is served.
+    """
+
+    def __init__(
+        self,
+        source: EventSource,
+        backend: str = "xrandr",
+        debounce: float = DEBOUNCE_SECONDS,
+        max_settle: float = MAX_SETTLE_SECONDS,
+        server_path: Optional[Path] = None,
+        watch_config: bool = False,
+    ):
+        self.source = source
+        self.backend = backend
+        self.debounce = debounce
+        self.max_settle = max_settle
+        self.server_path = server_path
+        self.watch_config = watch_config
+        self.screens = []
+        self.layout_name = None
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self._closed = False
+
+    def settle(self, first: dict) -> list:
+        """Collect the events following the first one until none arrives for `debounce` seconds."""
+        events = [first]
+        deadline = time.monotonic() + self.max_settle
+        while True:
+            remaining = min(self.debounce, deadline - time.monotonic())
+            if remaining <= 0:
+                break
+            try:
+                event = self.source.wait(remaining)
+            except EOFError:
+                self._closed = True
+                break
+            if event is None:
+                break
+            events.append(event)
+        return events
+
+    def refresh(self):
+        """Discover the screens and apply the layout matching them."""
+        with self.lock:
+            screens = connected_screens(backend=self.backend)
+            layout_name = determine_layout(screens)
+            if layout_name != self.layout_name:
+                logger.info(f"Applying layout: {layout_name}")
+            apply_layout(screens, layout_name, backend=self.backend)
+            remember_layout(layout_name)
+            self.screens, self.layout_name = screens, layout_name
+
+    def handle(self, command: str, rescan_pci: bool = False, probe: str = "full") -> str:
+        """Run a command sent by the CLI, see run_command."""
+        with self.lock:
+            logger.debug(f"Running {command} for a client")
+            return run_command(command, backend=self.backend, rescan_pci=rescan_pci, probe=probe)
+
+    def run(self):
+        """Apply the current layout, then handle events until the source is closed."""
+        if Edid.MEMO is None:
+            Edid.MEMO = {}
+        get_config()
+        try:
+            self.refresh()
+        except Exception:
+            # Serve the CLI and wait for the next hotplug event anyway
+            logger.exception("Failed to apply the layout")
+
+        watcher = None
+        if self.watch_config:
+            try:
+                watcher = ConfigWatcher(lock=self.lock, on_reload=self.refresh)
+            except OSError as e:
+                logger.warning(f"Cannot watch the configuration for changes: {e}")
+            else:
+                watcher.start()
+        server = None
+        if self.server_path is not None:
+            server = CommandServer(self.server_path, self)
+            thread = threading.Thread(
+                target=server.serve_forever, args=(server.POLL_INTERVAL,), name="screenman-server", daemon=True
+            )
+            thread.start()
+            logger.info(f"Serving the CLI on {self.server_path}")
+        self.ready.set()
+        try:
+            while not self._closed:
+                try:
+                    first = self.source.wait()
+                except EOFError:
+                    break
+                if first is None:
+                    # Only a timeout ends the wait without an event
+                    continue
+                events = self.settle(first)
+                logger.debug(f"{len(events)} hotplug events, rediscovering screens")
+                try:
+                    self.refresh()
+                except Exception:
+                    # A display can vanish while it is being configured, keep running
+                    logger.exception("Failed to apply the layout")
+        finally:
+            if watcher is not None:
+                watcher.stop()
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+            self.source.close()
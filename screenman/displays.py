@@ -0,0 +1,140 @@
+"""Run a CLI command on several X displays at once, e.g. the seats of a multi-seat host.
+
+Every display gets its own discovery and layout match. The displays are handled
+concurrently in a process pool, one worker process per display, as $DISPLAY is
+process-wide and both xrandr and the RandR backend pick it up from there.
+"""
+
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+# Where the X servers put their local sockets, X<number>
+X11_SOCKET_DIR = Path("/tmp/.X11-unix")
+RX_X11_SOCKET = re.compile(r"^X(\d+)$")
+
+
+@dataclass
+class DisplayResult:
+    """
+    What a command did on one display.
+
+    Attributes:
+        display (str): The X display, e.g. ":0".
+        ok (bool): Whether the command succeeded.
+        output (str): The text the command printed.
+        layout_name (Optional[str]): The layout matching the screens of the display.
+        error (str): Why the command failed, empty if it succeeded.
+        seconds (float): Wall time of the command.
+    """
+
+    display: str
+    ok: bool
+    output: str = ""
+    layout_name: Optional[str] = None
+    error: str = ""
+    seconds: float = 0.0
+
+
+def find_displays(socket_dir: Optional[Path] = None) -> list[str]:
+    """
+    Find the local X displays by their sockets.
+
+    Args:
+        socket_dir (Path): The socket directory, /tmp/.X11-unix by default.
+
+    Returns:
+        list: The display names, e.g. [":0", ":1"], in numeric order.
+    """
+    numbers = []
+    try:
+        for path in (socket_dir or X11_SOCKET_DIR).iterdir():
+            match = RX_X11_SOCKET.match(path.name)
+            if match:
+                numbers.append(int(match.group(1)))
+    except OSError as e:
+        logger.debug(f"Cannot list the X sockets: {e}")
+    return [f":{number}" for number in sorted(numbers)]
+
+
+def run_on_display(
+    display: str, command: str, backend: str = "xrandr", rescan_pci: bool = False, probe: str = "full"
+) -> DisplayResult:
+    """
+    Run a command on one display, in the calling process, see daemon.execute_command.
+
+    Errors are returned in the result, so that one failing display does not hide the others.
+    """
+    from screenman.daemon import execute_command
+
+    os.environ["DISPLAY"] = display
+    start = time.perf_counter()
+    try:
+        result = execute_command(command, backend=backend, rescan_pci=rescan_pci, probe=probe)
+    except Exception as e:
+        logger.exception(f"Failed to run {command} on display {display}")
+        return DisplayResult(display, False, error=str(e) or type(e).__name__, seconds=time.perf_counter() - start)
+    return DisplayResult(display, True, result.output, result.layout_name, seconds=time.perf_counter() - start)
+
+
+def run_on_displays(
+    displays: list[str],
+    command: str,
+    backend: str = "xrandr",
+    rescan_pci: bool = False,
+    probe: str = "full",
+    max_workers: Optional[int] = None,
+) -> list[DisplayResult]:
+    """
+    Run a command on every display concurrently, each in its own worker process.
+
+    Args:
+        displays (list): The X displays, e.g. [":0", ":1"].
+        command (str): One of screenman.ipc.COMMANDS.
+        backend (str): The discovery and apply backend, see connected_screens.
+        rescan_pci (bool): If True, rescan the PCI bus first. The bus is shared by
+            all displays, so it is rescanned once, before the workers start, and the
+            outputs of every display are reprobed in full.
+        probe (str): How deep discovery looks, see screen.PROBE_LEVELS.
+        max_workers (Optional[int]): The size of the pool, by default one worker per display.
+
+    Returns:
+        list: The DisplayResults, in the order of the displays.
+    """
+    if rescan_pci:
+        from screenman.sysfs import rescan_and_settle
+
+        rescan_and_settle()
+        probe = "full"
+    if len(displays) == 1:
+        return [run_on_display(displays[0], command, backend, probe=probe)]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers or len(displays)) as pool:
+        futures = [pool.submit(run_on_display, display, command, backend, probe=probe) for display in displays]
+        for display, future in zip(displays, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # The worker process died, e.g. killed by the OOM killer
+                results.append(DisplayResult(display, False, error=str(e) or type(e).__name__))
+    return results
+
+
+def report(results: list[DisplayResult]) -> str:
+    """Render the results of all displays as one report, the output of each display indented below it."""
+    lines = []
+    for result in results:
+        if result.ok:
+            status = f"layout: {result.layout_name}" if result.layout_name else "ok"
+        else:
+            status = f"failed: {result.error}"
+        lines.append(f"{result.display:<8} {status} ({result.seconds:.2f}s)")
+        lines.extend(f"    {line}" for line in result.output.splitlines())
+    return "\n".join(lines)
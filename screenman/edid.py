@@ -1,21 +1,82 @@
 import binascii
 import re
 import subprocess as sb
-from dataclasses import dataclass
-from typing import ClassVar, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, fields, replace
+from typing import ClassVar, Optional, Sequence
 
 from loguru import logger
 
-from screenman import toml_config
+from screenman import timings
+from screenman.cache import EdidCache, cache_dir
+from screenman.config import get_config
 
-FALLBACK_UID = toml_config.fallback_uid
+EDID_HEADER = b"\x00\xff\xff\xff\xff\xff\xff\x00"
+EDID_BLOCK_SIZE = 128
+
+# Upper bound of threads decoding EDIDs during discovery
+MAX_DECODE_WORKERS = 8
+
+# Display descriptor tags of the base block
+DESCRIPTOR_SERIAL = 0xFF
+DESCRIPTOR_NAME = 0xFC
+
+# Extension block tags
+EXT_CTA_861 = 0x02
+EXT_DISPLAYID = 0x70
+
+# DisplayID product identification data block tags (v1.x and v2.x)
+DISPLAYID_PRODUCT_ID_TAGS = (0x00, 0x20)
+
+
+def _pnp_id(raw: int) -> str:
+    """Decode the 3-letter PNP manufacturer ID packed into two big-endian bytes."""
+    return "".join(chr(((raw >> shift) & 0x1F) + ord("A") - 1) for shift in (10, 5, 0))
+
+
+def _descriptor_text(payload: bytes) -> str:
+    """Decode a 13-byte descriptor string, terminated by 0x0a and padded with spaces."""
+    return payload.split(b"\n", 1)[0].decode("cp437").strip()
+
+
+def _format_serial(serial: int) -> str:
+    """Format a numeric serial the same way edid-decode does, so UIDs stay stable."""
+    return f"{serial} (0x{serial:08x})"
+
+
+_edid_cache: Optional[EdidCache] = None
+
+
+def get_edid_cache() -> EdidCache:
+    """Return the persistent EDID decode cache, created on first use."""
+    global _edid_cache
+    if _edid_cache is None:
+        _edid_cache = EdidCache(cache_dir() / "edid.json", get_config().fallback_uid)
+    return _edid_cache
+
+
+def reset_decoded():
+    """
+    Forget the decoded EDIDs, whose fallback UIDs were resolved with the previous `fallback_uid` table.
+
+    The EDID cache is written back first, so that it is not saved again at exit over
+    the entries of its successor.
+    """
+    global _edid_cache
+    if _edid_cache is not None:
+        _edid_cache.save()
+        _edid_cache = None
+    if Edid.MEMO is not None:
+        Edid.MEMO.clear()
 
 
 @dataclass
 class Edid:
     """
     Represents the Extended Display Identification Data (EDID) of a monitor.
-    Needs the edid-decode utility to be installed:
+    The EDID is decoded in-process. The edid-decode utility is only needed for
+    the optional cross-check mode:
     https://git.linuxtv.org/edid-decode.git/
 
     Attributes:
@@ -26,6 +87,9 @@ class Edid:
         fallback_uid (Optional[str]): A fallback unique identifier for the monitor.
 
     Class Attributes:
+        CROSS_CHECK (ClassVar[bool]): If True, every decode is compared against edid-decode.
+        USE_CACHE (ClassVar[bool]): If True, edid-decode results are looked up in and stored to the on-disk cache.
+        MEMO (ClassVar[Optional[dict]]): Decoded EDIDs kept in memory by raw bytes, set by long-running processes.
         SERIAL_REGEX (ClassVar[re.Pattern]): Regex pattern to extract the serial number from EDID data.
         NAME_REGEX (ClassVar[re.Pattern]): Regex pattern to extract the name from EDID data.
         MANUFACTURER_REGEX (ClassVar[re.Pattern]): Regex pattern to extract the manufacturer from EDID data.
@@ -34,6 +98,12 @@ class Edid:
     Methods:
         from_edid_hex(cls, edid_hex: str) -> "Edid":
             Parses EDID data from a hexadecimal string and returns an Edid instance.
+        from_raw(cls, edid_bytes: bytes) -> "Edid":
+            Decodes raw EDID bytes, cross-checked against edid-decode if enabled.
+        from_edid_bytes(cls, edid_bytes: bytes) -> "Edid":
+            Decodes raw EDID bytes without spawning any process.
+        from_edid_decode(cls, edid_hex: str) -> "Edid":
+            Parses EDID data using the edid-decode utility.
         get_fallback_uid() -> Optional[str]:
             Returns a fallback unique identifier based on the manufacturer and model number.
     """
@@ -44,18 +114,112 @@ class Edid:
     model_number: Optional[str] = None
     fallback_uid: Optional[str] = None
 
+    CROSS_CHECK: ClassVar[bool] = False
+    USE_CACHE: ClassVar[bool] = True
+    MEMO: ClassVar[Optional[dict]] = None
+
     SERIAL_REGEX: ClassVar[re.Pattern] = re.compile(r"Serial Number: (.+)")
-    NAME_REGEX: ClassVar[re.Pattern] = re.compile(r"Monitor name: (.+)")
+    # Older edid-decode releases print "Monitor name", DisplayID blocks "Product ID"
+    NAME_REGEX: ClassVar[re.Pattern] = re.compile(r"(?:Display Product Name|Monitor name|Product ID): (.+)")
     MANUFACTURER_REGEX: ClassVar[re.Pattern] = re.compile(r"Manufacturer: (.+)")
     MODEL_NUMBER_REGEX: ClassVar[re.Pattern] = re.compile(r"Model: (.+)")
 
     @classmethod
     def from_edid_hex(cls, edid_hex: str) -> "Edid":
+        return cls.from_raw(binascii.unhexlify(edid_hex))
+
+    @classmethod
+    def from_raw(cls, edid_bytes: bytes) -> "Edid":
+        """Decode raw EDID bytes, cross-checking against edid-decode if enabled."""
+        if cls.MEMO is not None and bytes(edid_bytes) in cls.MEMO:
+            return replace(cls.MEMO[bytes(edid_bytes)])
+        edid = cls.from_edid_bytes(edid_bytes)
+        if cls.CROSS_CHECK and len(edid_bytes) >= EDID_BLOCK_SIZE:
+            edid.cross_check(cls.from_edid_decode(edid_bytes.hex()))
+        if cls.MEMO is not None:
+            cls.MEMO[bytes(edid_bytes)] = replace(edid)
+        return edid
+
+    @classmethod
+    def from_edid_bytes(cls, edid_bytes: bytes) -> "Edid":
+        """
+        Decode the base block, its display descriptors and the CTA-861/DisplayID
+        extension blocks of a raw EDID.
+
+        Args:
+            edid_bytes (bytes): The raw EDID, a multiple of 128 bytes.
+
+        Returns:
+            Edid: The decoded EDID, empty if the data is not a valid EDID.
+        """
+        if len(edid_bytes) < EDID_BLOCK_SIZE or edid_bytes[:8] != EDID_HEADER:
+            return Edid()
+
+        edid = Edid()
+        # The vendor ID is big-endian, product code and serial are little-endian
+        edid.manufacturer = _pnp_id(int.from_bytes(edid_bytes[8:10], "big"))
+        edid.model_number = str(int.from_bytes(edid_bytes[10:12], "little"))
+        serial = int.from_bytes(edid_bytes[12:16], "little")
+        if serial:
+            edid.serial = _format_serial(serial)
+
+        for offset in range(54, 126, 18):
+            descriptor = edid_bytes[offset : offset + 18]
+            # Display descriptors have a zero pixel clock, otherwise it is a timing
+            if descriptor[0:3] != b"\x00\x00\x00":
+                continue
+            tag = descriptor[3]
+            if tag == DESCRIPTOR_SERIAL:
+                edid.serial = _descriptor_text(descriptor[5:]) or edid.serial
+            elif tag == DESCRIPTOR_NAME:
+                edid.name = _descriptor_text(descriptor[5:]) or edid.name
+
+        num_blocks = len(edid_bytes) // EDID_BLOCK_SIZE
+        for index in range(1, min(edid_bytes[126] + 1, num_blocks)):
+            block = edid_bytes[index * EDID_BLOCK_SIZE : (index + 1) * EDID_BLOCK_SIZE]
+            if block[0] == EXT_DISPLAYID:
+                edid._parse_displayid(block)
+            # CTA-861 extensions only describe timings, audio and colorimetry
+            # and carry no identification data, so they are skipped.
+
+        if not edid.serial:
+            edid.fallback_uid = edid.get_fallback_uid()
+        return edid
+
+    def _parse_displayid(self, block: bytes):
+        """Fill in missing identification from a DisplayID product identification block."""
+        section_end = min(5 + block[2], len(block) - 1)
+        offset = 5
+        while offset + 3 <= section_end:
+            tag, _revision, length = block[offset : offset + 3]
+            payload = block[offset + 3 : offset + 3 + length]
+            if tag in DISPLAYID_PRODUCT_ID_TAGS and len(payload) >= 12:
+                serial = int.from_bytes(payload[5:9], "little")
+                if serial and not self.serial:
+                    self.serial = _format_serial(serial)
+                name_length = payload[11]
+                if name_length and not self.name:
+                    self.name = payload[12 : 12 + name_length].decode("ascii", "replace").strip()
+            if tag == 0 and length == 0:
+                # Padding, the rest of the section is empty
+                break
+            offset += 3 + length
+
+    @classmethod
+    @timings.timed("edid-decode")
+    def from_edid_decode(cls, edid_hex: str) -> "Edid":
         edid_bytes = binascii.unhexlify(edid_hex)
         if len(edid_bytes) < 128:
             return Edid()
 
+        # Decoding in-process is cheaper than reading the cache, so only the
+        # edid-decode results are cached
+        cache = get_edid_cache() if cls.USE_CACHE else None
+        if cache and (cached := cache.get(edid_bytes)) is not None:
+            return Edid(**cached)
+
         # Call edid-decode utility to parse the EDID bytes
+        timings.subprocess_started()
         try:
             proc = sb.run(
                 ["edid-decode"],
@@ -73,12 +237,18 @@ class Edid:
             return Edid()
 
         edid = Edid()
+        displayid = False
         # Extract useful information from the edid-decode output
         for line in edid_output.splitlines():
-            if serial_match := edid.SERIAL_REGEX.search(line):
-                edid.serial = serial_match.group(1).strip().replace("'", "")
-            if name_match := edid.NAME_REGEX.search(line):
-                edid.name = name_match.group(1).strip()
+            if line.startswith("Block "):
+                displayid = "DisplayID" in line
+            # Like the native decoder, DisplayID only fills in what the base block lacks
+            if (serial_match := edid.SERIAL_REGEX.search(line)) and not (displayid and edid.serial):
+                serial = serial_match.group(1).strip()
+                # DisplayID prints numeric serials without the hex form of the base block
+                edid.serial = _format_serial(int(serial)) if serial.isdigit() else serial.replace("'", "")
+            if (name_match := edid.NAME_REGEX.search(line)) and not (displayid and edid.name):
+                edid.name = name_match.group(1).strip().replace("'", "")
             if manufacturer_match := edid.MANUFACTURER_REGEX.search(line):
                 edid.manufacturer = manufacturer_match.group(1).strip()
             if model_number_match := edid.MODEL_NUMBER_REGEX.search(line):
@@ -86,13 +256,82 @@ class Edid:
 
         if not edid.serial:
             edid.fallback_uid = edid.get_fallback_uid()
+        if cache:
+            cache.put(edid_bytes, asdict(edid))
         return edid
 
+    def cross_check(self, reference: "Edid") -> bool:
+        """
+        Compare this EDID against one decoded by edid-decode and log any mismatch.
+
+        Fields that edid-decode did not report are not compared.
+
+        Returns:
+            bool: True if all reported fields match.
+        """
+        matches = True
+        for f in fields(self):
+            expected = getattr(reference, f.name)
+            actual = getattr(self, f.name)
+            if expected is not None and expected != actual:
+                logger.warning(
+                    f"EDID cross-check mismatch for {f.name}: native {actual!r}, edid-decode {expected!r}"
+                )
+                matches = False
+        return matches
+
     def get_fallback_uid(self) -> Optional[str]:
-        for uid, fallback in FALLBACK_UID.items():
+        for uid, fallback in get_config().fallback_uid.items():
             if (
                 fallback["Manufacturer"] == self.manufacturer
                 and fallback["Model"] == self.model_number
             ):
                 return uid
         return None
+
+
+def _timed_decode(edid: bytes) -> tuple[Edid, float]:
+    start = time.perf_counter()
+    decoded = Edid.from_raw(edid)
+    return decoded, time.perf_counter() - start
+
+
+@timings.timed("decode_edids")
+def decode_edids(
+    edids: Sequence[bytes], parallel: Optional[bool] = None
+) -> list[Optional[Edid]]:
+    """
+    Decode the EDIDs of several outputs, concurrently on a bounded thread pool.
+
+    Args:
+        edids (Sequence[bytes]): The raw EDIDs, empty for outputs without one.
+        parallel (Optional[bool]): Whether to use the thread pool. By default it is only used
+            when edid-decode is spawned, the in-process decoder holds the GIL and is faster
+            than starting the threads.
+
+    Returns:
+        list: The decoded EDIDs in the order of the input, None for outputs without EDID.
+    """
+    todo = [(index, edid) for index, edid in enumerate(edids) if edid]
+    results: list[Optional[Edid]] = [None] * len(edids)
+    if not todo:
+        return results
+    if parallel is None:
+        parallel = Edid.CROSS_CHECK and len(todo) > 1
+
+    start = time.perf_counter()
+    if parallel:
+        with ThreadPoolExecutor(max_workers=min(len(todo), MAX_DECODE_WORKERS)) as pool:
+            decoded = list(pool.map(_timed_decode, [edid for _, edid in todo]))
+    else:
+        decoded = [_timed_decode(edid) for _, edid in todo]
+    wall = time.perf_counter() - start
+
+    for (index, _), (edid, _) in zip(todo, decoded):
+        results[index] = edid
+    summed = sum(elapsed for _, elapsed in decoded)
+    logger.debug(
+        f"Decoded {len(todo)} EDIDs {'in parallel' if parallel else 'serially'}: "
+        f"{wall * 1000:.2f} ms wall clock, {summed * 1000:.2f} ms summed decode time"
+    )
+    return results
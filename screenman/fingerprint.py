@@ -0,0 +1,156 @@
+"""Fast path skipping a run when nothing changed since the last apply.
+
+After a layout is applied, the hardware fingerprint (the DRM connectors, their
+status and a hash of the EDIDs of the connected ones, read from sysfs without
+reprobing the outputs), a hash of the X state (`xrandr --current`, which does not
+reprobe either) and the configuration files are saved together with the layout.
+If the next run finds all of them unchanged, the same monitors are on the same
+connectors and nobody touched the X state since, so there is nothing to apply.
+
+Only the standard library is imported, so that a skipped run costs the CLI
+start-up, a few sysfs reads and one `xrandr --current`.
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Iterable, Optional
+
+VERSION = 1
+
+# Same as sysfs.DRM_ROOT, not imported from there to keep this module light
+DRM_ROOT = Path("/sys/class/drm")
+
+
+def state_path(kind: str = "state") -> Path:
+    """
+    Return the path of a saved state of $DISPLAY.
+
+    The state is kept in $XDG_RUNTIME_DIR, or under a per-user name in the temp dir.
+
+    Args:
+        kind (str): Which state, "state" for the one of the last apply.
+    """
+    display = os.environ.get("DISPLAY", "").replace("/", "_")
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / f"screenman{display}.{kind}.json"
+    return Path(tempfile.gettempdir()) / f"screenman-{os.getuid()}{display}.{kind}.json"
+
+
+def write_state(path: Path, state: dict):
+    """Write a state atomically, so that a concurrent run never reads a partial file."""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(state))
+    os.replace(tmp_path, path)
+
+
+def hardware_fingerprint(root: Optional[Path] = None) -> Optional[str]:
+    """
+    Hash the DRM connector names, their status and the EDIDs of the connected ones.
+
+    Args:
+        root (Path): The DRM class directory, `/sys/class/drm` by default.
+
+    Returns:
+        str: The fingerprint, None if there are no DRM connectors to read.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    found = False
+    for path in sorted((root or DRM_ROOT).glob("card*-*")):
+        try:
+            status = (path / "status").read_text().strip()
+            edid = (path / "edid").read_bytes() if status == "connected" else b""
+        except OSError:
+            continue
+        found = True
+        digest.update(f"{path.name}\0{status}\0{len(edid)}\0".encode())
+        digest.update(edid)
+    return digest.hexdigest() if found else None
+
+
+def x_state() -> Optional[str]:
+    """Hash what `xrandr --current` reports, None if it cannot be run."""
+    try:
+        result = subprocess.run(["xrandr", "--current"], capture_output=True, check=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return hashlib.blake2b(result.stdout, digest_size=16).hexdigest()
+
+
+def file_stamps(paths: Iterable[Path]) -> list:
+    """Return the path, mtime and size of every file, None for the files that do not exist."""
+    stamps = []
+    for path in paths:
+        try:
+            stat = path.stat()
+        except OSError:
+            stamps.append([str(path), None, None])
+        else:
+            stamps.append([str(path), stat.st_mtime_ns, stat.st_size])
+    return stamps
+
+
+def save(layout_name: Optional[str], config_files: Iterable[Path], root: Optional[Path] = None) -> bool:
+    """
+    Save the fingerprint of the current hardware and X state after a layout was applied.
+
+    Args:
+        layout_name (Optional[str]): The applied layout, None if no layout matched.
+        config_files (Iterable[Path]): The candidate configuration files, see config.config_paths.
+        root (Path): The DRM class directory, `/sys/class/drm` by default.
+
+    Returns:
+        bool: True if the state was saved, False if the hardware or the X state cannot be read.
+    """
+    path = state_path()
+    hardware = hardware_fingerprint(root)
+    x = x_state() if hardware is not None else None
+    if x is None:
+        path.unlink(missing_ok=True)
+        return False
+    state = {
+        "version": VERSION,
+        "layout": layout_name,
+        "hardware": hardware,
+        "x_state": x,
+        "cwd": os.getcwd(),
+        "config": file_stamps(config_files),
+    }
+    write_state(path, state)
+    return True
+
+
+def unchanged(root: Optional[Path] = None) -> Optional[dict]:
+    """
+    Check whether the hardware, the X state and the configuration are those of the last apply.
+
+    The checks run cheapest first, `xrandr --current` is only run if everything
+    else matches.
+
+    Args:
+        root (Path): The DRM class directory, `/sys/class/drm` by default.
+
+    Returns:
+        dict: The saved state, with the applied `layout`, if nothing changed, None otherwise.
+    """
+    try:
+        state = json.loads(state_path().read_text())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or state.get("version") != VERSION:
+        return None
+    if state.get("cwd") != os.getcwd():
+        # The working directory is one of the places the configuration is looked up
+        return None
+    config = state.get("config") or []
+    if file_stamps(Path(stamp[0]) for stamp in config) != config:
+        return None
+    if hardware_fingerprint(root) != state.get("hardware"):
+        return None
+    if x_state() != state.get("x_state"):
+        return None
+    return state
@@ -0,0 +1,68 @@
+"""Client side of the daemon's Unix socket.
+
+The CLI forwards its commands to a running `screenman daemon`, which already
+has the config and the decoded EDIDs in memory. Only the standard library is
+imported here, so that the client path stays as cheap as the CLI start-up.
+
+The protocol is one JSON object per line: the request holds the `command` and
+its options, the response `ok`, the `output` to print and an `error` message.
+"""
+
+import json
+import os
+import socket
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+SOCKET_NAME = "screenman.sock"
+
+# Commands the daemon runs on behalf of the CLI
+COMMANDS = ("apply", "print-info", "mirror", "mirror-off")
+
+# Seconds to wait for the daemon to answer, applying a layout can take a while
+CALL_TIMEOUT = 30.0
+
+
+def socket_path() -> Path:
+    """Return the socket path, in $XDG_RUNTIME_DIR or a per-user name in the temp dir."""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / SOCKET_NAME
+    return Path(tempfile.gettempdir()) / f"screenman-{os.getuid()}.sock"
+
+
+def call(command: str, path: Optional[Path] = None, timeout: float = CALL_TIMEOUT, **options) -> Optional[dict]:
+    """
+    Ask the daemon to run a command.
+
+    Args:
+        command (str): One of COMMANDS.
+        path (Optional[Path]): The socket, socket_path() by default.
+        timeout (float): Seconds to wait for the answer.
+        **options: The options of the command, e.g. rescan_pci.
+
+    Returns:
+        dict: The response, None if no daemon is listening or it cannot be reached,
+            e.g. because it is hung or the socket belongs to another user.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        with sock:
+            sock.connect(str(path or socket_path()))
+            with sock.makefile("rwb") as stream:
+                stream.write(json.dumps({"command": command, **options}).encode() + b"\n")
+                stream.flush()
+                line = stream.readline()
+        if not line:
+            raise ConnectionError("The daemon closed the connection without answering")
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+    except OSError as e:
+        # Imported on this error path only, the CLI has set up the logger by now
+        from loguru import logger
+
+        logger.warning(f"Cannot reach the screenman daemon, running in this process: {e!r}")
+        return None
+    return json.loads(line)
@@ -0,0 +1,186 @@
+"""Indexed matching of connected screens against the configured layouts, and their compiled targets."""
+
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, Optional, Union
+
+
+@dataclass(frozen=True)
+class LayoutScore:
+    """
+    How well a layout matches the connected screens.
+
+    Layouts match if all of their screens are connected. Among the matching
+    layouts the one with the most screens wins, ties go to the layout declared
+    first in the configuration.
+
+    Attributes:
+        name (str): The name of the layout.
+        rank (int): The position of the layout in match order.
+        size (int): The number of screens in the layout.
+        order (int): The position of the layout in the configuration file.
+        matched (tuple): The screens of the layout that are connected.
+        missing (tuple): The screens of the layout that are not connected.
+    """
+
+    name: str
+    rank: int
+    size: int
+    order: int
+    matched: tuple
+    missing: tuple
+
+    @property
+    def matches(self) -> bool:
+        return not self.missing
+
+    def reason(self) -> str:
+        if not self.matches:
+            return f"layout '{self.name}' does not match, missing {list(self.missing)}"
+        return (
+            f"layout '{self.name}' matches all {self.size} screens {list(self.matched)}, "
+            f"declared at position {self.order}"
+        )
+
+
+class LayoutIndex:
+    """
+    Inverted index from screen UIDs to layouts, built once when the configuration is loaded.
+
+    Matching counts, for every layout sharing a UID with the connected screens,
+    how many of its screens are connected, so its cost depends on the number of
+    connected screens instead of the number of layouts. If the connected screens
+    are exactly those of a layout, that layout is found with a single lookup.
+
+    Args:
+        layouts (dict): The layouts, mapping names to their screens by UID.
+    """
+
+    def __init__(self, layouts: dict):
+        self.layouts = layouts
+        declared = list(layouts.items())
+        ranked = sorted(range(len(declared)), key=lambda order: (-len(declared[order][1]), order))
+        self.names = [declared[order][0] for order in ranked]
+        self.orders = ranked
+        self.uids = [tuple(declared[order][1]) for order in ranked]
+        self.sizes = [len(uids) for uids in self.uids]
+        self.postings: dict[str, list[int]] = {}
+        self.exact: dict[frozenset, int] = {}
+        for rank, uids in enumerate(self.uids):
+            for uid in uids:
+                self.postings.setdefault(uid, []).append(rank)
+            self.exact.setdefault(frozenset(uids), rank)
+        # Layouts without screens match anything, the first one is the fallback
+        self.empty_rank = next((rank for rank, size in enumerate(self.sizes) if not size), None)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _counts(self, uids: frozenset) -> Counter:
+        counts = Counter()
+        for uid in uids:
+            counts.update(self.postings.get(uid, ()))
+        return counts
+
+    def match_rank(self, uids: Iterable[Optional[str]]) -> Optional[int]:
+        """Return the rank of the best matching layout for the connected UIDs, or None."""
+        uids = frozenset(uids)
+        rank = self.exact.get(uids)
+        if rank is not None:
+            return rank
+        best = self.empty_rank
+        for rank, count in self._counts(uids).items():
+            if count == self.sizes[rank] and (best is None or rank < best):
+                best = rank
+        return best
+
+    def match(self, uids: Iterable[Optional[str]]) -> Optional[str]:
+        """Return the name of the best matching layout for the connected UIDs, or None."""
+        rank = self.match_rank(uids)
+        return None if rank is None else self.names[rank]
+
+    def score(self, rank: int, uids: frozenset) -> LayoutScore:
+        layout_uids = self.uids[rank]
+        return LayoutScore(
+            self.names[rank],
+            rank,
+            self.sizes[rank],
+            self.orders[rank],
+            tuple(uid for uid in layout_uids if uid in uids),
+            tuple(uid for uid in layout_uids if uid not in uids),
+        )
+
+    def scores(self, uids: Iterable[Optional[str]]) -> list[LayoutScore]:
+        """
+        Score every layout that shares a screen with the connected UIDs.
+
+        Returns:
+            list: The scores in match order, the first matching one is the chosen layout.
+        """
+        uids = frozenset(uids)
+        ranks = set(self._counts(uids))
+        if self.empty_rank is not None:
+            ranks.add(self.empty_rank)
+        return [self.score(rank, uids) for rank in sorted(ranks)]
+
+
+@dataclass(frozen=True, slots=True)
+class ScreenTarget:
+    """
+    The settings a layout gives one screen, normalized for planning.
+
+    Attributes:
+        enabled (bool): Whether the screen is turned on.
+        resolution (Optional[tuple[int, int]]): The mode, None for the preferred one.
+        rate (Optional[Union[float, str]]): The refresh rate in Hz, "max" for the highest one.
+        primary (bool): Whether the screen is the primary one.
+        rotation (Optional[int]): The rotation, None to keep the current one.
+        position (Optional[tuple[str, str]]): The xrandr position option and its value.
+    """
+
+    enabled: bool = True
+    resolution: Optional[tuple[int, int]] = None
+    rate: Optional[Union[float, str]] = None
+    primary: bool = False
+    rotation: Optional[int] = None
+    position: Optional[tuple[str, str]] = None
+
+    @classmethod
+    def from_settings(cls, settings) -> "ScreenTarget":
+        """Compile the ScreenSettings of a layout, where a (0, 0) resolution stands for the preferred mode."""
+        resolution = tuple(settings.resolution)
+        return cls(
+            settings.is_enabled,
+            resolution if resolution != (0, 0) else None,
+            settings.rate,
+            settings.is_primary,
+            settings.rotation,
+            tuple(settings.position) if settings.position else None,
+        )
+
+
+# The target of every screen in the "auto" layout: on, in its preferred mode
+AUTO_TARGET = ScreenTarget()
+
+
+class LayoutPlans:
+    """
+    The layouts compiled into ScreenTargets, built once when the configuration is loaded.
+
+    Applying a layout then only looks up the targets of the connected screens
+    and compares them against the current state, see Screen.plan_config.
+
+    Args:
+        layouts (dict): The layouts, mapping names to their ScreenSettings by UID.
+    """
+
+    def __init__(self, layouts: dict):
+        self.layouts = layouts
+        self.targets = {
+            name: {uid: ScreenTarget.from_settings(settings) for uid, settings in screens.items()}
+            for name, screens in layouts.items()
+        }
+
+    def get(self, layout_name: str) -> dict:
+        """Return the targets of a layout by UID, empty if there is no such layout."""
+        return self.targets.get(layout_name, {})
@@ -0,0 +1,136 @@
+"""Instant mirror toggle.
+
+The first `--mirror` discovers the screens as usual. Along with the mirror
+configuration it applies, the exact configuration of every output before
+mirroring is saved, together with the hardware fingerprint, the X states
+before and after and the stamps of the configuration files (see
+screenman.fingerprint). As long as the same monitors are connected, the X state
+is the expected one and the configuration is unchanged, `--mirror` and
+`--mirror-off` then run the saved configuration without discovering the
+screens or decoding any EDID: `--mirror` in a single call, `--mirror-off` like
+apply_layout, clearing the scale of the mirrored output before restoring the
+layout.
+"""
+
+import json
+import subprocess
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Optional
+
+from loguru import logger
+
+from screenman import fingerprint
+from screenman.config import config_paths
+from screenman.screen import OutputConfig, run_configs
+
+VERSION = 3
+
+
+def state_path() -> Path:
+    """Return the path of the saved mirror state of $DISPLAY."""
+    return fingerprint.state_path("mirror")
+
+
+def _dump(configs) -> list:
+    return [asdict(config) for config in configs]
+
+
+def _load(items) -> list:
+    configs = []
+    for item in items:
+        # JSON has no tuples
+        fields: dict[str, Any] = {
+            key: tuple(value) if isinstance(value, list) else value for key, value in item.items()
+        }
+        configs.append(OutputConfig(**fields))
+    return configs
+
+
+def _unscale(configs) -> list:
+    """Return the configurations resetting the outputs that `configs` scale, see screen.plan_layout."""
+    return [
+        OutputConfig(config.name, scale=(1, 1))
+        for config in configs
+        if config.enabled and config.scale and tuple(config.scale) != (1, 1)
+    ]
+
+
+def save(restore, configs, x_before: Optional[str], root: Optional[Path] = None) -> bool:
+    """
+    Save the configurations of both directions after mirroring was set up.
+
+    Args:
+        restore (list): The OutputConfigs restoring the state before mirroring.
+        configs (list): The OutputConfigs that were applied to mirror.
+        x_before (Optional[str]): The X state before mirroring, see fingerprint.x_state.
+        root (Path): The DRM class directory, `/sys/class/drm` by default.
+
+    Returns:
+        bool: True if the state was saved, False if the hardware or the X state cannot be read.
+    """
+    path = state_path()
+    hardware = fingerprint.hardware_fingerprint(root)
+    x_after = fingerprint.x_state() if hardware is not None and x_before is not None else None
+    if x_after is None:
+        path.unlink(missing_ok=True)
+        return False
+    state = {
+        "version": VERSION,
+        "hardware": hardware,
+        "normal": x_before,
+        "mirrored": x_after,
+        "config": fingerprint.file_stamps(config_paths()),
+        "reset": _dump(_unscale(configs)),
+        "restore": _dump(restore),
+        "mirror": _dump(configs),
+    }
+    fingerprint.write_state(path, state)
+    return True
+
+
+def toggle(command: str, backend: str = "xrandr", root: Optional[Path] = None) -> bool:
+    """
+    Run `mirror` or `mirror-off` from the saved state, without discovering the screens.
+
+    Args:
+        command (str): "mirror" or "mirror-off".
+        backend (str): How to apply the configuration, see screen.run_configs.
+        root (Path): The DRM class directory, `/sys/class/drm` by default.
+
+    Returns:
+        bool: True if the command was handled, False if it needs the full run, e.g.
+            because the monitors, the X state or the configuration changed since
+            the state was saved.
+    """
+    path = state_path()
+    try:
+        state = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return False
+    if not isinstance(state, dict) or state.get("version") != VERSION:
+        return False
+    if fingerprint.hardware_fingerprint(root) != state.get("hardware"):
+        return False
+    # `--mirror-off` falls back to the layout, which may be a different one now
+    if fingerprint.file_stamps(config_paths()) != state.get("config"):
+        return False
+    turn_on = command == "mirror"
+    current = fingerprint.x_state()
+    if current == (state["mirrored"] if turn_on else state["normal"]):
+        logger.info(f"Mirroring is already {'on' if turn_on else 'off'}.")
+        return True
+    if current != (state["normal"] if turn_on else state["mirrored"]):
+        return False
+    # Like apply_layout, the scale is cleared before the framebuffer is resized
+    calls = [_load(state["mirror"])] if turn_on else [_load(state["reset"]), _load(state["restore"])]
+    logger.debug(f"Running the saved configuration: {calls}")
+    try:
+        for configs in calls:
+            if configs:
+                run_configs(configs, backend)
+    except (subprocess.CalledProcessError, OSError, RuntimeError) as e:
+        logger.warning(f"The saved mirror configuration failed, discovering the screens: {e}")
+        path.unlink(missing_ok=True)
+        return False
+    return True
@@ -0,0 +1,431 @@
+"""Discovery and apply backend talking to the X server through the RandR extension.
+
+No xrandr process is forked: outputs, modes and EDIDs are queried and CRTCs are
+configured over a connection to the X server. Needs python-xlib, install it with
+`pip install screenman[randr]`.
+
+Scaling is not supported by this backend, configurations that need it raise
+UnsupportedConfig so that the caller can fall back to xrandr.
+"""
+
+from dataclasses import dataclass, field
+from typing import Optional
+
+from loguru import logger
+
+from screenman.edid import decode_edids
+from screenman.screen import Mode, Screen, current_scale, detect_mirrors
+from screenman.utils import RotateDirection
+
+# RandR rotation bits, indexed by RotateDirection
+RR_ROTATIONS = {
+    RotateDirection.Normal: 1,
+    RotateDirection.Left: 2,
+    RotateDirection.Inverted: 4,
+    RotateDirection.Right: 8,
+}
+RR_ROTATION_MASK = 0x0F
+RR_CONNECTED = 0
+RR_SET_CONFIG_SUCCESS = 0
+RR_INTERLACE = 0x10
+RR_DOUBLE_SCAN = 0x20
+IDENTITY = 1 << 16  # 1.0 as a 16.16 fixed point number
+
+# Bytes of the EDID property read in one request, enough for 4 blocks
+EDID_LENGTH = 512
+
+
+class UnsupportedConfig(Exception):
+    """Raised for settings that cannot be applied through this backend."""
+
+
+def _xlib():
+    try:
+        from Xlib import X, display
+        from Xlib.ext import randr  # noqa: F401, registers the extension methods
+    except ImportError as e:
+        raise RuntimeError(
+            "The randr backend needs python-xlib: pip install 'screenman[randr]'"
+        ) from e
+    return X, display
+
+
+def refresh_rate(mode_info) -> float:
+    """Compute the refresh rate of a RandR mode in Hz, rounded like xrandr prints it."""
+    vtotal = mode_info.v_total
+    if mode_info.flags & RR_DOUBLE_SCAN:
+        vtotal *= 2
+    if mode_info.flags & RR_INTERLACE:
+        vtotal /= 2
+    if not mode_info.h_total or not vtotal:
+        return 0.0
+    return round(mode_info.dot_clock / (mode_info.h_total * vtotal), 2)
+
+
+def rotated_size(width, height, rotation):
+    """Return the size of a CRTC on the screen, rotation being RandR rotation bits."""
+    if rotation & (RR_ROTATIONS[RotateDirection.Left] | RR_ROTATIONS[RotateDirection.Right]):
+        return height, width
+    return width, height
+
+
+@dataclass
+class CrtcState:
+    """The configuration of a CRTC, as queried or as it should be set."""
+
+    x: int = 0
+    y: int = 0
+    mode: int = 0
+    rotation: int = 1
+    outputs: list = field(default_factory=list)
+    width: int = 0
+    height: int = 0
+
+    def same_config(self, other: "CrtcState") -> bool:
+        """Return True if both states set the same mode on the same outputs, ignoring the queried size."""
+        return (self.x, self.y, self.mode, self.rotation, self.outputs) == (
+            other.x,
+            other.y,
+            other.mode,
+            other.rotation,
+            other.outputs,
+        )
+
+    def fits(self, width: int, height: int) -> bool:
+        """Return True if the CRTC, as queried, lies within a screen of this size."""
+        return self.x + self.width <= width and self.y + self.height <= height
+
+
+@dataclass
+class OutputState:
+    """What the X server reports about an output."""
+
+    id: int
+    name: str
+    connected: bool
+    crtc: int
+    crtcs: list
+    mode_ids: list
+    num_preferred: int
+
+
+class RandrConnection:
+    """
+    A connection to the X server to query and configure outputs through RandR.
+
+    Args:
+        display_name (str): The X display, `$DISPLAY` by default.
+    """
+
+    def __init__(self, display_name: Optional[str] = None):
+        self.X, display = _xlib()
+        self.display = display.Display(display_name)
+        if not self.display.has_extension("RANDR"):
+            self.display.close()
+            raise RuntimeError("The X server does not support the RandR extension")
+        self.root = self.display.screen().root
+        self.edid_atom = self.display.intern_atom("EDID")
+        self.modes = {}
+        self.outputs = {}
+        self.crtcs = {}
+        self.config_timestamp = 0
+
+    def close(self):
+        self.display.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def refresh(self, probe: bool = True):
+        """
+        Query the modes, outputs and CRTCs.
+
+        Args:
+            probe (bool): If True, ask the server to reprobe the outputs like
+                `xrandr` does, otherwise return the state it already knows.
+        """
+        if probe:
+            resources = self.root.xrandr_get_screen_resources()
+        else:
+            resources = self.root.xrandr_get_screen_resources_current()
+        self.config_timestamp = resources.config_timestamp
+        self.modes = {mode.id: mode for mode in resources.modes}
+        self.outputs = {}
+        for output in resources.outputs:
+            info = self.display.xrandr_get_output_info(output, resources.config_timestamp)
+            self.outputs[info.name] = OutputState(
+                output,
+                info.name,
+                info.connection == RR_CONNECTED,
+                info.crtc,
+                list(info.crtcs),
+                list(info.modes),
+                info.num_preferred,
+            )
+        self.crtcs = {}
+        for crtc in resources.crtcs:
+            info = self.display.xrandr_get_crtc_info(crtc, resources.config_timestamp)
+            self.crtcs[crtc] = CrtcState(
+                info.x, info.y, info.mode, info.rotation, list(info.outputs), info.width, info.height
+            )
+
+    def edid(self, output: OutputState) -> bytes:
+        reply = self.display.xrandr_get_output_property(
+            output.id, self.edid_atom, self.X.AnyPropertyType, 0, EDID_LENGTH // 4
+        )
+        return bytes(reply.value)
+
+    def primary_output(self) -> int:
+        return self.root.xrandr_get_output_primary().output
+
+    def screens(self, probe: bool = True) -> list:
+        """Query all outputs and return them as Screen objects, in server order."""
+        self.refresh(probe)
+        primary = self.primary_output()
+        outputs = list(self.outputs.values())
+        decoded = decode_edids([self.edid(o) if o.connected else b"" for o in outputs])
+
+        screens = []
+        for output, edid in zip(outputs, decoded):
+            crtc = self.crtcs.get(output.crtc)
+            # The CRTC of an enabled output, None for disabled outputs
+            active = crtc if crtc is not None and crtc.mode else None
+            modes = []
+            if output.connected:
+                for index, mode_id in enumerate(output.mode_ids):
+                    info = self.modes[mode_id]
+                    modes.append(
+                        Mode(
+                            info.width,
+                            info.height,
+                            refresh_rate(info),
+                            current=crtc is not None and crtc.mode == mode_id,
+                            preferred=index < output.num_preferred,
+                        )
+                    )
+            rot = None
+            if active is not None:
+                rot = next(
+                    (d for d, bits in RR_ROTATIONS.items() if active.rotation & bits), RotateDirection.Normal
+                )
+            screen = Screen(output.name, output.id == primary, rot, modes, "", edid)
+            if active is not None:
+                info = self.modes[active.mode]
+                screen.record_state(
+                    position=("--pos", f"{active.x}x{active.y}"),
+                    scale=current_scale((active.width, active.height), (info.width, info.height), rot),
+                )
+            screens.append(screen)
+        return detect_mirrors(screens)
+
+    def _find_mode(self, output: OutputState, resolution, rate: Optional[float] = None) -> int:
+        """
+        Return the mode to set for a resolution, the preferred one if resolution is None.
+
+        With a rate, the mode of that resolution with the closest refresh rate is
+        returned, otherwise the first one.
+        """
+        if resolution is None:
+            if not output.mode_ids:
+                raise ValueError("Output has no modes", output.name)
+            return output.mode_ids[0]
+        candidates = [
+            mode_id
+            for mode_id in output.mode_ids
+            if (self.modes[mode_id].width, self.modes[mode_id].height) == tuple(resolution)
+        ]
+        if not candidates:
+            raise ValueError("Requested resolution is not supported", output.name, resolution)
+        if rate is None:
+            return candidates[0]
+        return min(candidates, key=lambda mode_id: abs(refresh_rate(self.modes[mode_id]) - rate))
+
+    def plan(self, configs) -> tuple[dict, Optional[int]]:
+        """
+        Translate output configurations into CRTC configurations.
+
+        Returns:
+            tuple: The new state of every CRTC that changes, and the primary output or None.
+        """
+        targets = {}
+        primary = None
+        positions = {}
+        for config in configs:
+            output = self.outputs.get(config.name)
+            if output is None:
+                raise ValueError("Unknown output", config.name)
+            if config.scale and tuple(config.scale) != (1, 1):
+                raise UnsupportedConfig("scaling", config.name, config.scale)
+            current = self.crtcs.get(output.crtc)
+            if not config.enabled:
+                targets[output.name] = None
+                continue
+
+            if config.position:
+                option, value = config.position
+                if option != "--pos":
+                    raise UnsupportedConfig("relative position", config.name, option)
+                x, y = (int(v) for v in value.split("x"))
+            elif current is not None and current.mode:
+                x, y = current.x, current.y
+            else:
+                x, y = 0, 0
+            if config.rotation is not None:
+                rotation = RR_ROTATIONS[config.rotation]
+            elif current is not None and current.mode:
+                rotation = current.rotation & RR_ROTATION_MASK
+            else:
+                rotation = RR_ROTATIONS[RotateDirection.Normal]
+            if config.resolution is None and not config.auto and current is not None and current.mode:
+                mode = current.mode
+            else:
+                mode = self._find_mode(output, config.resolution, config.rate)
+            targets[output.name] = CrtcState(x, y, mode, rotation, [output.id])
+            positions[output.name] = (x, y)
+            if config.primary:
+                primary = output.id
+
+        for config in configs:
+            if config.enabled and config.same_as:
+                target = targets[config.name]
+                if config.same_as in positions:
+                    target.x, target.y = positions[config.same_as]
+                else:
+                    other = self.crtcs.get(self.outputs[config.same_as].crtc)
+                    target.x, target.y = (other.x, other.y) if other else (0, 0)
+
+        return self._assign_crtcs(targets), primary
+
+    def _assign_crtcs(self, targets: dict) -> dict:
+        """
+        Place each target on a CRTC, keeping outputs on the CRTC they already use.
+
+        CRTCs already in their target state are left out of the changes.
+        """
+        changes = {}
+        used = {crtc for crtc, state in self.crtcs.items() if state.mode}
+        for name, target in targets.items():
+            output = self.outputs[name]
+            if output.crtc:
+                state = target or CrtcState()
+                if target is None:
+                    used.discard(output.crtc)
+                current = self.crtcs.get(output.crtc, CrtcState())
+                # Off already, or the same mode on the same outputs
+                if not (state.same_config(current) or not (state.mode or current.mode)):
+                    changes[output.crtc] = state
+        for name, target in targets.items():
+            output = self.outputs[name]
+            if target is None or output.crtc:
+                continue
+            crtc = next((c for c in output.crtcs if c not in used and c not in changes), None)
+            if crtc is None:
+                raise RuntimeError("No free CRTC for output", name)
+            changes[crtc] = target
+            used.add(crtc)
+        return changes
+
+    def screen_size(self, changes: dict) -> tuple[int, int]:
+        """Return the framebuffer size that fits all CRTCs after the changes."""
+        width, height = 1, 1
+        for crtc, state in self.crtcs.items():
+            state = changes.get(crtc, state)
+            if not state.mode:
+                continue
+            info = self.modes[state.mode]
+            w, h = rotated_size(info.width, info.height, state.rotation)
+            width, height = max(width, state.x + w), max(height, state.y + h)
+        return width, height
+
+    def _has_transform(self, crtc: int) -> bool:
+        current = self.display.xrandr_get_crtc_transform(crtc).current_transform
+        diagonal = (current.matrix11, current.matrix22, current.matrix33)
+        rest = (
+            current.matrix12,
+            current.matrix13,
+            current.matrix21,
+            current.matrix23,
+            current.matrix31,
+            current.matrix32,
+        )
+        return diagonal != (IDENTITY,) * 3 or any(rest)
+
+    def apply(self, configs):
+        """
+        Apply output configurations, the equivalent of a single xrandr call.
+
+        Like xrandr, only the CRTCs that change are set, and a change of the
+        primary output alone sets nothing else, so the other screens do not blank.
+
+        Raises:
+            UnsupportedConfig: If a configuration needs a feature this backend lacks.
+        """
+        self.refresh(probe=False)
+        changes, primary = self.plan(configs)
+        if not changes:
+            if primary is not None:
+                self.root.xrandr_set_output_primary(primary)
+                self.display.sync()
+            return
+        for crtc, state in changes.items():
+            if state.mode and self.crtcs[crtc].mode and self._has_transform(crtc):
+                raise UnsupportedConfig("clearing a scale transform", crtc)
+        width, height = self.screen_size(changes)
+        geometry = self.root.get_geometry()
+
+        screen = self.display.screen()
+        mm_width = max(1, round(width * screen.width_in_mms / screen.width_in_pixels))
+        mm_height = max(1, round(height * screen.height_in_mms / screen.height_in_pixels))
+
+        self.display.grab_server()
+        try:
+            # The screen can only shrink when no CRTC exceeds it, so those are turned off
+            # first, together with the ones turned off or moved to other outputs
+            for crtc, state in changes.items():
+                current = self.crtcs[crtc]
+                moved = state.outputs != current.outputs
+                if current.mode and (not state.mode or moved or not current.fits(width, height)):
+                    self._set_crtc(crtc, CrtcState())
+            if (width, height) != (geometry.width, geometry.height):
+                logger.debug(f"Setting screen size to {width}x{height} ({mm_width}x{mm_height} mm)")
+                self.root.xrandr_set_screen_size(width, height, mm_width, mm_height)
+            for crtc, state in changes.items():
+                if state.mode:
+                    self._set_crtc(crtc, state)
+            if primary is not None:
+                self.root.xrandr_set_output_primary(primary)
+        finally:
+            self.display.ungrab_server()
+            self.display.sync()
+
+    def _set_crtc(self, crtc: int, state: CrtcState):
+        logger.debug(f"Setting CRTC {crtc}: {state}")
+        reply = self.display.xrandr_set_crtc_config(
+            crtc, self.config_timestamp, state.x, state.y, state.mode, state.rotation, state.outputs
+        )
+        if reply.status != RR_SET_CONFIG_SUCCESS:
+            raise RuntimeError("Failed to configure CRTC", crtc, reply.status)
+
+
+def connected_screens(display_name: Optional[str] = None, probe: bool = True) -> list:
+    """
+    Get a list of connected screens through the RandR extension.
+
+    Args:
+        display_name (str): The X display, `$DISPLAY` by default.
+        probe (bool): If True, reprobe the outputs like `xrandr --props` does.
+
+    Returns:
+        list: A list of connected Screen objects.
+    """
+    with RandrConnection(display_name) as conn:
+        return [s for s in conn.screens(probe) if s.is_connected]
+
+
+def apply_configs(configs, display_name: Optional[str] = None):
+    """Apply output configurations through the RandR extension."""
+    with RandrConnection(display_name) as conn:
+        conn.apply(configs)
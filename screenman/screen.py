@@ -1,18 +1,47 @@
 """Screen abstractions for screenman."""
 
+import os
 import re
-from dataclasses import dataclass
+import struct
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
 
 from loguru import logger
 
-from screenman import toml_config
-from screenman.edid import Edid
-from screenman.utils import ScreenSettings, exec_cmd, rescan_pci, rot_to_str, str_to_rot
-
-LAYOUTS: dict[str, dict[str, ScreenSettings]] = toml_config.layouts
-
-
-@dataclass
+from screenman import timings
+from screenman.cache import OutputCache, cache_dir, content_key
+from screenman.config import get_config
+from screenman.edid import MAX_DECODE_WORKERS, Edid, decode_edids
+from screenman.layouts import AUTO_TARGET
+from screenman.utils import (
+    Change,
+    RotateDirection,
+    ScreenSettings,
+    exec_cmd,
+    exec_cmd_stream,
+    rot_to_str,
+    str_to_rot,
+)
+
+# Patterns for the lines of `xrandr --props`, compiled once
+RX_OUTPUT_HEADER = re.compile(
+    r"^(?P<name>\S+) (?P<status>connected|disconnected)\b"
+    r"(?P<primary> primary)?"
+    r"(?: (?P<width>\d+)x(?P<height>\d+)\+(?P<x>\d+)\+(?P<y>\d+))?"
+    r"(?: (?P<rotation>normal|left|inverted|right)\b)?"
+)
+RX_EDID_DATA = re.compile(r"\s+([0-9a-fA-F]{32})")
+RX_MODE = re.compile(r"\s+(\d+)x(\d+)\s+(.*)")
+# One refresh rate of a mode line, flagged * if current and + if preferred
+RX_RATE = re.compile(r"((?:\d+\.)?\d+)([* ]?)([+ ]?)")
+
+# Largest difference in Hz between a configured rate and the one it selects
+RATE_TOLERANCE = 0.5
+
+
+@dataclass(slots=True)
 class Mode:
     width: int
     height: int
@@ -30,6 +59,113 @@ class Mode:
         return f"{self.width}x{self.height}"
 
 
+class ModeTable:
+    """
+    The modes of an output, in the order xrandr lists them, indexed by resolution.
+
+    The index, the current and the preferred mode are found once when the table
+    is built, so that lookups do not scan the modes.
+
+    Attributes:
+        modes (tuple): The Mode objects.
+        by_resolution (dict): Maps (width, height) to the modes of that resolution, in order.
+        current (Optional[Mode]): The mode the output is in, None if it is off.
+        preferred (Optional[Mode]): The first preferred mode, None if there is none.
+    """
+
+    __slots__ = ("modes", "by_resolution", "current", "preferred")
+
+    def __init__(self, modes=()):
+        self.modes = tuple(modes)
+        self.by_resolution = {}
+        self.current = None
+        self.preferred = None
+        for mode in self.modes:
+            self.by_resolution.setdefault((mode.width, mode.height), []).append(mode)
+            if mode.current and self.current is None:
+                self.current = mode
+            if mode.preferred and self.preferred is None:
+                self.preferred = mode
+
+    def __len__(self):
+        return len(self.modes)
+
+    def __iter__(self):
+        return iter(self.modes)
+
+    def __getitem__(self, index):
+        return self.modes[index]
+
+    def __contains__(self, resolution):
+        return tuple(resolution) in self.by_resolution
+
+    def resolutions(self):
+        """Return the distinct resolutions, in the order of the modes."""
+        return list(self.by_resolution)
+
+    def rates(self, resolution):
+        """Return the refresh rates of a resolution, 0.0 standing for an unknown rate."""
+        return [mode.freq for mode in self.by_resolution.get(tuple(resolution), ())]
+
+
+@dataclass
+class OutputConfig:
+    """
+    Structured representation of the xrandr arguments for one output.
+
+    Settings that are None are left as they are. With `auto`, an enabled output
+    is set to `--auto` first, so an unset resolution means the preferred mode.
+    Without it, an unset resolution keeps the current mode.
+
+    Attributes:
+        name (str): The name of the output.
+        enabled (bool): Whether the output is turned on.
+        auto (bool): Whether to pass `--auto`.
+        resolution (Optional[tuple[int, int]]): The mode to set.
+        rate (Optional[float]): The refresh rate of the mode, in Hz.
+        primary (bool): Whether to make the output the primary one.
+        rotation (Optional[int]): The rotation, see RotateDirection.
+        position (Optional[tuple[str, str]]): The xrandr position option and its value.
+        scale (Optional[tuple[float, float]]): The scale factors.
+        same_as (Optional[str]): The output to mirror.
+    """
+
+    name: str
+    enabled: bool = True
+    resolution: Optional[tuple[int, int]] = None
+    primary: bool = False
+    rotation: Optional[int] = None
+    position: Optional[tuple[str, str]] = None
+    scale: Optional[tuple[float, float]] = None
+    same_as: Optional[str] = None
+    auto: bool = True
+    rate: Optional[float] = None
+
+    def to_args(self):
+        """Return the xrandr arguments for this output, starting with `--output`."""
+        args = ["--output", self.name]
+        if not self.enabled:
+            args.append("--off")
+            return args
+        if self.auto:
+            args.append("--auto")
+        if self.resolution:
+            args.extend(["--mode", f"{self.resolution[0]}x{self.resolution[1]}"])
+        if self.rate:
+            args.extend(["--rate", f"{self.rate:.2f}"])
+        if self.primary:
+            args.append("--primary")
+        if self.rotation is not None:
+            args.extend(["--rotate", RotateDirection.valtoname[self.rotation]])
+        if self.position:
+            args.extend(self.position)
+        if self.scale:
+            args.extend(["--scale", f"{self.scale[0]}x{self.scale[1]}"])
+        if self.same_as:
+            args.extend(["--same-as", self.same_as])
+        return args
+
+
 class Screen:
     """
     Represents a screen with various settings and capabilities.
@@ -40,7 +176,10 @@ class Screen:
         name (str): The name of the screen.
         uid (str): The unique identifier for the screen, derived from EDID.
         curr_mode (Mode): The current mode of the screen.
-        supported_modes (list): List of supported modes for the screen.
+        supported_modes (ModeTable): The supported modes of the screen.
+        state_known (bool): Whether the backend reports the current mode, scale and mirror
+            state. If not, e.g. for sysfs, applying a layout resets the output and sets every
+            setting explicitly.
         __set (ScreenSettings): The settings for the screen.
 
     Methods:
@@ -54,29 +193,30 @@ class Screen:
         available_resolutions: Returns a list of available resolutions.
         check_resolution: Checks if a given resolution is supported.
         build_cmd: Builds the command to apply the screen settings.
+        build_config: Builds the structured equivalent of build_cmd.
     """
 
-    def __init__(self, name, primary, rot, modes, edid_hex):
+    __slots__ = ("__name", "__set", "uid", "curr_mode", "supported_modes", "state_known")
+
+    def __init__(self, name, primary, rot, modes, edid_hex, edid=None):
         self.__name = name
         self.__set = ScreenSettings()
         self.uid = None
+        self.state_known = True
 
-        if edid_hex:
+        if edid is None and edid_hex:
             edid = Edid.from_edid_hex(edid_hex)
+        if edid is not None:
             self.uid = edid.serial or edid.fallback_uid
 
-        self.curr_mode = (
-            next((item for item in modes if item.current), None) if modes else None
-        )
-        self.supported_modes = modes
+        self.supported_modes = ModeTable(modes or ())
+        self.curr_mode = self.supported_modes.current
         self._initialize_settings(primary, rot)
 
     def _initialize_settings(self, primary, rot):
         self.__set.rotation = rot
         self.__set.is_primary = primary
-        self.__set.is_enabled = bool(
-            [mode for mode in self.supported_modes if mode.current]
-        )
+        self.__set.is_enabled = self.curr_mode is not None
         self.__set.is_connected = bool(self.supported_modes)
         if self.curr_mode:
             self.__set.resolution = self.curr_mode.resolution()
@@ -97,7 +237,7 @@ class Screen:
     def is_enabled(self, enable):
         if enable != self.__set.is_enabled:
             self.__set.is_enabled = enable
-            self.__set.change_table["is_enabled"] = True
+            self.__set.changed |= Change.ENABLED
 
     @property
     def is_primary(self):
@@ -107,7 +247,7 @@ class Screen:
     def is_primary(self, is_primary):
         if is_primary != self.__set.is_primary:
             self.__set.is_primary = is_primary
-            self.__set.change_table["is_primary"] = True
+            self.__set.changed |= Change.PRIMARY
 
     @property
     def resolution(self):
@@ -115,12 +255,12 @@ class Screen:
 
     @resolution.setter
     def resolution(self, newres):
-        if not self.is_enabled and not self.__set.change_table["is_enabled"]:
+        if not self.is_enabled and not self.__set.changed & Change.ENABLED:
             return
         if newres != self.__set.resolution:
             self.check_resolution(newres)
             self.__set.resolution = newres
-            self.__set.change_table["resolution"] = True
+            self.__set.changed |= Change.RESOLUTION
 
     @property
     def rotation(self):
@@ -130,7 +270,7 @@ class Screen:
     def rotation(self, direction):
         if direction != self.__set.rotation:
             self.__set.rotation = direction
-            self.__set.change_table["rotation"] = True
+            self.__set.changed |= Change.ROTATION
 
     @property
     def position(self):
@@ -140,7 +280,7 @@ class Screen:
     def position(self, args):
         if args != self.__set.position:
             self.__set.position = args
-            self.__set.change_table["position"] = True
+            self.__set.changed |= Change.POSITION
 
     @property
     def scale(self):
@@ -150,7 +290,7 @@ class Screen:
     def scale(self, value):
         if value != self.__set.scale:
             self.__set.scale = value
-            self.__set.change_table["scale"] = True
+            self.__set.changed |= Change.SCALE
 
     @property
     def same_as(self):
@@ -160,68 +300,153 @@ class Screen:
     def same_as(self, value):
         if value != self.__set.same_as:
             self.__set.same_as = value
-            self.__set.change_table["same_as"] = True
+            self.__set.changed |= Change.SAME_AS
+
+    def record_state(self, position=None, scale=None, same_as=None):
+        """
+        Record the position, scale and mirror state the output is currently in,
+        without marking them as changes.
+        """
+        self.__set.position = position
+        self.__set.scale = scale
+        self.__set.same_as = same_as
+
+    def preferred_resolution(self):
+        preferred = self.supported_modes.preferred
+        return preferred.resolution() if preferred else None
+
+    def plan_config(self, target):
+        """
+        Compare the current state against the target settings.
+
+        Only the settings that differ are set in the returned config, and `--auto`
+        is only used to turn on an output without a configured mode. Settings the
+        target leaves open (no position, no rotation, no rate) are not changed. A
+        rate is always set together with its mode.
+
+        Args:
+            target (ScreenTarget): The compiled settings from the layout, None to turn the output off.
+
+        Returns:
+            OutputConfig: The minimal config to reach the target, or None if it is already reached.
+        """
+        if target is None or not target.enabled:
+            return OutputConfig(self.name, enabled=False) if self.is_enabled else None
+
+        resolution = target.resolution or self.preferred_resolution()
+        if resolution:
+            self.check_resolution(resolution)
+        auto = False
+        mode = rate = None
+        if not self.is_enabled:
+            mode = resolution
+            auto = not resolution
+        elif resolution and (resolution != self.resolution or not self.state_known):
+            mode = resolution
+        if target.rate is not None:
+            mode_resolution = resolution or self.resolution
+            new_rate = self.resolve_rate(mode_resolution, target.rate)
+            current_rate = self.curr_mode.freq if self.curr_mode else None
+            if new_rate is not None and (mode or not current_rate or abs(new_rate - current_rate) > 0.005):
+                mode, rate, auto = mode_resolution, new_rate, False
+        rotation = target.rotation if target.rotation is not None and target.rotation != self.rotation else None
+        position = target.position if target.position and target.position != self.position else None
+        primary = target.primary and not self.is_primary
+        scale = (1, 1) if self.scale else None
+
+        if not (auto or mode or primary or scale) and rotation is None and position is None:
+            return None
+        return OutputConfig(self.name, True, mode, primary, rotation, position, scale, None, auto, rate)
+
+    def resolve_rate(self, resolution, rate):
+        """
+        Find the refresh rate to set for a resolution.
+
+        Args:
+            resolution (tuple): The resolution of the mode.
+            rate (Union[float, str]): The configured rate in Hz, or "max" for the highest one.
+
+        Returns:
+            float: The rate as the output reports it, the configured one if the output
+                reports no rates, or None if the highest rate is not known.
+
+        Raises:
+            ValueError: If the output does not offer the rate at this resolution.
+        """
+        rates = [r for r in self.supported_modes.rates(resolution) if r]
+        if not rates:
+            # e.g. discovered through sysfs, let xrandr check the rate
+            if rate == "max":
+                logger.warning(f"Refresh rates of {self.name} are unknown, keeping the default rate.")
+                return None
+            return float(rate)
+        if rate == "max":
+            return max(rates)
+        closest = min(rates, key=lambda r: abs(r - rate))
+        if abs(closest - rate) > RATE_TOLERANCE:
+            raise ValueError("Requested rate is not supported", self.name, resolution, rate, rates)
+        return closest
 
     def available_resolutions(self):
-        return [(r.width, r.height) for r in self.supported_modes]
+        return self.supported_modes.resolutions()
 
     def check_resolution(self, newres):
-        if newres not in self.available_resolutions():
+        if newres not in self.supported_modes:
             raise ValueError("Requested resolution is not supported", newres)
 
     def build_cmd(self):
-        if any(self.__set.change_table.values()):
+        config = self.build_config()
+        return ["xrandr", *config.to_args()] if config else None
+
+    def build_config(self):
+        """
+        Build the structured equivalent of build_cmd, with only the changed settings set.
+
+        Returns:
+            OutputConfig: The settings to apply, or None if nothing changed.
+        """
+        if self.__set.changed:
             if not self.name:
                 raise ValueError("Cannot apply settings without screen name", self.name)
-            cmd = ["xrandr", "--output", self.name]
+            config = OutputConfig(self.name, enabled=self.is_enabled)
 
             if self.is_enabled:
-                cmd.append("--auto")
-                self._add_resolution(cmd)
-                self._add_primary(cmd)
-                self._add_rotation(cmd)
-                self._add_position(cmd)
-                self._add_scale(cmd)
-                self._add_same_as(cmd)
-            else:
-                cmd.append("--off")
-
-            return cmd
+                self._add_resolution(config)
+                self._add_primary(config)
+                self._add_rotation(config)
+                self._add_position(config)
+                self._add_scale(config)
+                self._add_same_as(config)
+
+            return config
         return None
 
-    def _add_resolution(self, cmd):
-        if self.__set.change_table["resolution"]:
-            cmd.extend(
-                ["--mode", f"{self.__set.resolution[0]}x{self.__set.resolution[1]}"]
-            )
+    def _add_resolution(self, config):
+        if self.__set.changed & Change.RESOLUTION:
+            config.resolution = self.__set.resolution
 
-    def _add_primary(self, cmd):
-        if self.__set.change_table["is_primary"] and self.__set.is_primary:
-            cmd.append("--primary")
+    def _add_primary(self, config):
+        if self.__set.changed & Change.PRIMARY and self.__set.is_primary:
+            config.primary = True
 
-    def _add_rotation(self, cmd):
-        if self.__set.change_table["rotation"]:
+    def _add_rotation(self, config):
+        if self.__set.changed & Change.ROTATION:
             rot = rot_to_str(self.__set.rotation)
             if not rot:
                 raise ValueError("Invalid rotation value", rot, self.__set.rotation)
-            cmd.extend(["--rotate", rot])
+            config.rotation = self.__set.rotation
 
-    def _add_position(self, cmd):
-        if self.__set.change_table["position"]:
-            rel, pos = self.__set.position
-            cmd.extend([rel, pos])
+    def _add_position(self, config):
+        if self.__set.changed & Change.POSITION:
+            config.position = self.__set.position
 
-    def _add_scale(self, cmd):
-        if self.__set.change_table["scale"]:
-            if self.__set.scale:
-                sx, sy = self.__set.scale
-            else:
-                sx, sy = 1, 1
-            cmd.extend(["--scale", f"{sx}x{sy}"])
+    def _add_scale(self, config):
+        if self.__set.changed & Change.SCALE:
+            config.scale = self.__set.scale or (1, 1)
 
-    def _add_same_as(self, cmd):
-        if self.__set.change_table["same_as"] and self.__set.same_as:
-            cmd.extend(["--same-as", self.__set.same_as])
+    def _add_same_as(self, config):
+        if self.__set.changed & Change.SAME_AS and self.__set.same_as:
+            config.same_as = self.__set.same_as
 
     def __str__(self):
         return (
@@ -232,7 +457,7 @@ class Screen:
     __repr__ = __str__
 
 
-def create_screen(name_str, modes, edid):
+def create_screen(name_str, modes, edid, decoded_edid=None):
     """
     Create a Screen object from the given parameters.
 
@@ -240,80 +465,180 @@ def create_screen(name_str, modes, edid):
         name_str (str): The name string containing screen information.
         modes (list): A list of supported modes for the screen.
         edid (str): The EDID data for the screen.
+        decoded_edid (Edid): The already decoded EDID, if available.
 
     Returns:
         Screen: A Screen object initialized with the given parameters.
     """
-    sc_name = name_str.split()[0]
-    rot = str_to_rot(name_str.split()[3]) if len(name_str.split()) > 2 else None
-    return Screen(sc_name, "primary" in name_str, rot, modes, edid)
+    header = RX_OUTPUT_HEADER.match(name_str)
+    if header:
+        sc_name, primary = header.group("name"), bool(header.group("primary"))
+        rot = parse_rotation(header)
+    else:
+        sc_name, primary, rot = name_str.split()[0], "primary" in name_str, None
+    screen = Screen(sc_name, primary, rot, modes, edid, decoded_edid)
+    if header and header.group("width") and screen.curr_mode:
+        size = (int(header.group("width")), int(header.group("height")))
+        screen.record_state(
+            position=("--pos", f"{header.group('x')}x{header.group('y')}"),
+            scale=current_scale(size, screen.curr_mode.resolution(), rot),
+        )
+    return screen
 
 
-def parse_screen_connection(line):
+def current_scale(size, mode_size, rot):
     """
-    Parse a line to determine if it indicates a connected or disconnected screen.
-
-    Args:
-        line (str): The line to parse.
+    Derive the scale of an output from its size on the screen and its mode.
 
     Returns:
-        str: "connected" if the screen is connected, "disconnected" if the screen is disconnected, None otherwise.
+        tuple: The scale factors, or None if the output is not scaled.
     """
-    rx_conn = re.compile(r"\bconnected\b")
-    rx_disconn = re.compile(r"\bdisconnected\b")
-    if re.search(rx_conn, line):
-        return "connected"
-    elif re.search(rx_disconn, line):
-        return "disconnected"
-    return None
+    width, height = mode_size
+    if rot in (RotateDirection.Left, RotateDirection.Right):
+        width, height = height, width
+    if not width or not height or (width, height) == tuple(size):
+        return None
+    return round(size[0] / width, 4), round(size[1] / height, 4)
 
 
-def parse_edid_data(line, parsing_edid, edid):
+def detect_mirrors(screens):
     """
-    Extract EDID data from the line if currently parsing EDID information.
+    Record outputs showing the same area of the screen as mirrors.
 
-    Args:
-        line (str): The line to parse.
-        parsing_edid (bool): Whether EDID parsing is currently active.
-        edid (str): The accumulated EDID data.
+    Every enabled output at the same position and size as an earlier one is
+    recorded as `same_as` that earlier output.
+    """
+    seen = {}
+    for screen in screens:
+        if not screen.is_enabled or screen.position is None:
+            continue
+        area = (screen.position, screen.resolution, screen.scale)
+        if area in seen:
+            screen.record_state(screen.position, screen.scale, same_as=seen[area].name)
+        else:
+            seen[area] = screen
+    return screens
 
-    Returns:
-        tuple: A tuple containing a boolean indicating if EDID parsing is active and the accumulated EDID data.
+
+def parse_rotation(header):
+    """
+    Return the current rotation from a matched output header.
+
+    xrandr only prints the rotation if it is not normal, and no geometry at all
+    for disabled outputs.
+    """
+    if header.group("rotation"):
+        return str_to_rot(header.group("rotation"))
+    return str_to_rot("normal") if header.group("width") else None
+
+
+@dataclass
+class XrandrOutput:
+    """The lines of one output in the xrandr output, classified and parsed."""
+
+    header: str
+    modes: list = field(default_factory=list)
+    edid: bytearray = field(default_factory=bytearray)
+
+    @property
+    def edid_hex(self):
+        return self.edid.hex()
+
+
+class XrandrParser:
+    """
+    Single-pass state machine parser for the output of `xrandr --props`.
+
+    Each line is classified once by its indentation: output headers start in the
+    first column, properties (including the EDID) are indented with tabs, and
+    modes with spaces. Lines can be fed one at a time, so the parser also works
+    on output that is still being produced.
+
+    Args:
+        on_edid (callable): Called with the output as soon as its EDID block is complete.
     """
-    rx_edid_start = re.compile(r"\s+EDID:")
-    rx_edid_data = re.compile(r"\s+([0-9a-fA-F]{32})")
 
-    if re.search(rx_edid_start, line):
-        return True, edid
-    if parsing_edid:
-        match = re.match(rx_edid_data, line)
-        if match:
-            edid += match.group(1)
-            return parsing_edid, edid
-        return False, edid
-    return parsing_edid, edid
+    def __init__(self, on_edid=None):
+        self._current = None
+        self._in_edid = False
+        self._on_edid = on_edid
+
+    def _end_edid(self):
+        self._in_edid = False
+        output = self._current
+        if self._on_edid and output is not None and output.edid:
+            self._on_edid(output)
+
+    def feed(self, line):
+        """
+        Parse a single line.
+
+        Returns:
+            XrandrOutput: The previous output if this line started a new one, otherwise None.
+        """
+        first = line[:1]
+        if not first:
+            return None
+        if first == "\t":
+            if self._current is None:
+                return None
+            if self._in_edid:
+                match = RX_EDID_DATA.match(line)
+                if match:
+                    self._current.edid.extend(bytes.fromhex(match.group(1)))
+                    return None
+                self._end_edid()
+            if line.startswith("EDID:", 1):
+                self._in_edid = True
+            return None
+        if first == " ":
+            if self._in_edid:
+                self._end_edid()
+            if self._current is not None:
+                match = RX_MODE.match(line)
+                if match:
+                    width, height = int(match.group(1)), int(match.group(2))
+                    self._current.modes.extend(
+                        Mode(width, height, float(rate), current == "*", preferred == "+")
+                        for rate, current, preferred in RX_RATE.findall(match.group(3))
+                    )
+            return None
+
+        # Unindented: either an output header or the "Screen 0: ..." summary
+        if self._in_edid:
+            self._end_edid()
+        if RX_OUTPUT_HEADER.match(line):
+            done, self._current = self._current, XrandrOutput(line)
+            return done
+        return None
+
+    def finish(self):
+        """Return the last output, once all lines have been fed."""
+        if self._in_edid:
+            self._end_edid()
+        done, self._current = self._current, None
+        return done
 
 
-def parse_screen_modes(line, modes):
+def iter_xrandr_outputs(lines, on_edid=None):
     """
-    Parse a line to extract mode information.
+    Split the output of xrandr into outputs.
 
     Args:
-        line (str): The line to parse.
-        modes (list): The list of modes to append the parsed mode to.
+        lines (iterable): The lines of output, any iterable including a generator.
+        on_edid (callable): Called with each output as soon as its EDID block is complete.
 
-    Returns:
-        list: The updated list of modes.
+    Yields:
+        XrandrOutput: Each output as soon as all of its lines have been parsed.
     """
-    rx_mode = re.compile(r"^\s+(\d+)x(\d+)\s+((?:\d+\.)?\d+)([* ]?)([+ ]?)")
-    match = re.search(rx_mode, line)
-    if match:
-        width, height = int(match.group(1)), int(match.group(2))
-        freq = float(match.group(3))
-        current = match.group(4).strip() == "*"
-        preferred = match.group(5).strip() == "+"
-        modes.append(Mode(width, height, freq, current, preferred))
-    return modes
+    parser = XrandrParser(on_edid)
+    for line in lines:
+        output = parser.feed(line.rstrip("\n"))
+        if output is not None:
+            yield output
+    output = parser.finish()
+    if output is not None:
+        yield output
 
 
 def parse_xrandr(lines):
@@ -321,117 +646,328 @@ def parse_xrandr(lines):
     Parse the output of the xrandr command to extract screen information.
 
     Args:
-        lines (list): The lines of output from the xrandr command.
+        lines (iterable): The lines of output from the xrandr command.
 
     Returns:
         list: A list of Screen objects representing the connected screens.
     """
-    sc_name_line = None
-    edid = ""
-    parsing_edid = False
-    screens = []
-    modes = []
+    outputs = list(iter_xrandr_outputs(lines))
+
+    # Decode all EDIDs at once, so they can be decoded concurrently
+    decoded = decode_edids([bytes(output.edid) for output in outputs])
+    return detect_mirrors(
+        [
+            create_screen(output.header, output.modes, output.edid_hex, decoded_edid)
+            for output, decoded_edid in zip(outputs, decoded)
+        ]
+    )
+
+
+def parse_xrandr_stream(lines):
+    """
+    Parse the output of the xrandr command while it is still being produced.
 
-    for line in lines:
-        connection_status = parse_screen_connection(line)
-        if connection_status:
-            if sc_name_line:
-                newscreen = create_screen(sc_name_line, modes, edid)
-                screens.append(newscreen)
-                modes = []
-                edid = ""
-                parsing_edid = False
-            sc_name_line = line
-        else:
-            parsing_edid, edid = parse_edid_data(line, parsing_edid, edid)
-            modes = parse_screen_modes(line, modes)
+    The EDID of each output is decoded as soon as its EDID block is complete,
+    overlapping with xrandr probing the remaining outputs. When edid-decode is
+    spawned, the decodes run on a bounded thread pool.
 
-    if sc_name_line:
-        newscreen = create_screen(sc_name_line, modes, edid)
-        screens.append(newscreen)
+    Args:
+        lines (iterable): The lines of output, as they arrive.
 
+    Returns:
+        list: A list of Screen objects representing the screens, in xrandr order.
+    """
+    decoded = {}
+    pool = ThreadPoolExecutor(max_workers=MAX_DECODE_WORKERS) if Edid.CROSS_CHECK else None
+
+    def decode(output):
+        edid = bytes(output.edid)
+        decoded[id(output)] = pool.submit(Edid.from_raw, edid) if pool else Edid.from_raw(edid)
+
+    try:
+        outputs = list(iter_xrandr_outputs(lines, on_edid=decode))
+        screens = []
+        for output in outputs:
+            edid = decoded.get(id(output))
+            if isinstance(edid, Future):
+                edid = edid.result()
+            screens.append(create_screen(output.header, output.modes, output.edid_hex, edid))
+        return detect_mirrors(screens)
+    finally:
+        if pool:
+            pool.shutdown()
+
+
+BACKENDS = ("xrandr", "sysfs", "randr", "sway")
+# How deep discovery looks, from the most thorough to the cheapest
+PROBE_LEVELS = ("full", "current", "modes")
+# The xrandr arguments of each probe level
+XRANDR_PROBE_ARGS = {
+    # Reprobe every output and dump all properties
+    "full": ["--props"],
+    # The state the X server has cached, with the EDIDs
+    "current": ["--current", "--props"],
+    # The cached state without any property, the UIDs come from the OutputCache
+    "modes": ["--current"],
+}
+
+_output_cache: Optional[OutputCache] = None
+
+
+def output_cache_path() -> Path:
+    """Return the path of the output cache of $DISPLAY, the outputs of other X servers show other monitors."""
+    display = os.environ.get("DISPLAY", "").replace("/", "_")
+    return cache_dir() / f"outputs{display}.json"
+
+
+def get_output_cache() -> OutputCache:
+    """Return the cache of the monitors seen by the last full probes on $DISPLAY."""
+    global _output_cache
+    path = output_cache_path()
+    if _output_cache is None or _output_cache.path != path:
+        _output_cache = OutputCache(path, get_config().fallback_uid)
+    return _output_cache
+
+
+def reset_output_cache():
+    """Drop the in-memory output cache, e.g. after the `fallback_uid` table changed."""
+    global _output_cache
+    _output_cache = None
+
+
+def modes_key(screen) -> str:
+    """Hash the mode list of a screen, which changes with the monitor plugged into the output."""
+    # Packed rather than formatted, repr() of every mode costs more than the rest of the full probe
+    modes = screen.supported_modes.modes
+    values = [value for mode in modes for value in (mode.width, mode.height, mode.freq)]
+    return content_key(struct.pack(f"<{len(values)}d", *values))
+
+
+def _xrandr_screens(level, stream):
+    cmd = ["xrandr", *XRANDR_PROBE_ARGS[level]]
+    screens = parse_xrandr_stream(exec_cmd_stream(cmd)) if stream else parse_xrandr(exec_cmd(cmd))
+    return [s for s in screens if s.is_connected]
+
+
+def probe_xrandr(level="full", stream=True):
+    """
+    Discover the connected screens with xrandr, only as deep as the probe level asks.
+
+    The cheap levels do not reprobe the outputs. Their result is checked against
+    the monitors the last full probes found on each output, and if an output
+    shows a monitor that is not known, or no longer the one it showed, the
+    outputs changed and are reprobed in full. At the "modes" level the EDIDs are
+    not even dumped, the UIDs of the known monitors are taken from the cache.
+
+    Args:
+        level (str): One of PROBE_LEVELS.
+        stream (bool): If True, the output of xrandr is parsed while xrandr is still running.
+
+    Returns:
+        list: A list of connected Screen objects.
+    """
+    if level not in PROBE_LEVELS:
+        raise ValueError("Unknown probe level", level)
+    cache = get_output_cache()
+    if level != "full":
+        screens = _xrandr_screens(level, stream)
+        for screen in screens:
+            known, uid = cache.lookup(screen.name, modes_key(screen))
+            if not known or (level == "current" and screen.uid != uid):
+                logger.debug(f"{screen.name} changed since the last full probe, reprobing the outputs")
+                break
+            screen.uid = uid
+        else:
+            return screens
+    screens = _xrandr_screens("full", stream)
+    cache.update({(screen.name, modes_key(screen)): screen.uid for screen in screens})
     return screens
 
 
-def connected_screens():
+@timings.timed("connected_screens")
+def connected_screens(stream=True, backend="xrandr", probe="full"):
     """
     Get a list of connected screens.
 
+    Args:
+        stream (bool): If True, the output of xrandr is parsed line by line while
+            xrandr is still running, otherwise only after it exited.
+        backend (str): "xrandr" to run `xrandr --props`, "sysfs" to read the
+            DRM connectors from sysfs without reprobing the outputs (xrandr is
+            probed instead while a DP-MST connector is connected), "randr"
+            to query the X server through the RandR extension without forking,
+            or "sway" to ask sway over its IPC socket.
+        probe (str): One of PROBE_LEVELS, see probe_xrandr. The RandR backend
+            only reprobes at the "full" level, sysfs and sway never reprobe.
+
     Returns:
         list: A list of connected Screen objects.
     """
-    return [s for s in parse_xrandr(exec_cmd(["xrandr", "--props"])) if s.is_connected]
+    if backend == "sysfs":
+        from screenman import sysfs
+
+        try:
+            return sysfs.connected_screens()
+        except sysfs.UnsupportedConnector as e:
+            logger.info(f"sysfs does not tell the RandR names of the {e.args[0]} connectors {e.args[1:]}, using xrandr.")
+            return probe_xrandr(probe, stream)
+    if backend == "randr":
+        from screenman import randr
+
+        return randr.connected_screens(probe=probe == "full")
+    if backend == "sway":
+        from screenman import sway
 
+        return sway.connected_screens()
+    if backend != "xrandr":
+        raise ValueError("Unknown discovery backend", backend)
+    return probe_xrandr(probe, stream)
 
+
+@timings.timed("determine_layout")
 def determine_layout(screens):
     """
     Determine the layout name based on the connected screens.
 
+    Of the layouts whose screens are all connected, the one with the most
+    screens is chosen. Ties go to the layout declared first.
+
     Args:
         screens (list): A list of connected Screen objects.
 
     Returns:
         str: The name of the determined layout, or "auto" if no matching layout is found.
     """
-    layouts = sorted(LAYOUTS.items(), key=lambda x: len(x[1]), reverse=True)
-    for layout_name, layout in layouts:
-        if all(
-            screen_uid in {screen.uid for screen in screens} for screen_uid in layout
-        ):
-            return layout_name
-    return "auto"
+    index = get_config().layout_index
+    uids = frozenset(screen.uid for screen in screens)
+    rank = index.match_rank(uids)
+    if rank is None:
+        return "auto"
+    logger.debug(f"Chose {index.score(rank, uids).reason()}")
+    return index.names[rank]
+
+
+def score_layouts(screens):
+    """
+    Explain the layout choice for the connected screens.
+
+    Args:
+        screens (list): A list of connected Screen objects.
+
+    Returns:
+        list: A LayoutScore for every layout sharing a screen with the connected ones,
+            in match order. The first one that matches is the one determine_layout chooses.
+    """
+    return get_config().layout_index.scores(screen.uid for screen in screens)
 
 
-def apply_layout(screens, layout_name, do_rescan_pci=False):
+def run_configs(configs, backend="xrandr"):
+    """
+    Apply output configurations in one go.
+
+    Args:
+        configs (list): The OutputConfig objects to apply.
+        backend (str): "randr" to configure the CRTCs through the RandR extension,
+            "sway" to send the output commands to sway in one IPC message, anything
+            else runs a single xrandr command. The randr backend falls back to xrandr
+            for settings it does not support, sway has no such fallback.
+
+    Returns:
+        list: The output lines of xrandr, empty if it was not run.
+    """
+    if backend == "randr":
+        from screenman import randr
+
+        try:
+            randr.apply_configs(configs)
+            return []
+        except randr.UnsupportedConfig as e:
+            logger.debug(f"RandR backend does not support {e.args}, falling back to xrandr.")
+    elif backend == "sway":
+        from screenman import sway
+
+        sway.apply_configs(configs)
+        return []
+    xrandr_cmd = ["xrandr"]
+    for config in configs:
+        xrandr_cmd.extend(config.to_args())
+    return exec_cmd(xrandr_cmd)
+
+
+@timings.timed("apply_layout")
+def apply_layout(screens, layout_name, backend="xrandr"):
     """
     Apply the specified layout to the connected screens.
 
     Args:
         screens (list): A list of connected Screen objects.
         layout_name (str): The name of the layout to apply.
-        do_rescan_pci (bool): If True, rescan PCI bus before applying layout.
+        backend (str): How to apply the layout, see run_configs.
 
     Returns:
         None
     """
-    # Optionally rescan PCI bus to ensure dock/displays are detected
-    if do_rescan_pci:
-        if rescan_pci():
-            logger.debug("PCI bus rescanned successfully")
-        else:
-            logger.debug("PCI rescan failed or not available")
+    with timings.phase("plan"):
+        reset, configs = plan_layout(screens, layout_name)
+    if reset:
+        # Clear mirror/scale state first, changing the framebuffer size and
+        # the transforms in the same call can fail
+        with timings.phase("reset"):
+            xrandr_auto = run_configs(reset, backend)
+        logger.debug(f"Output of xrandr auto-reset: {xrandr_auto}")
+
+    if not configs:
+        logger.info(f"Layout {layout_name} is already active, nothing to apply.")
+        return
 
-    # Reset all outputs to auto with scale 1x1 to clear any mirror/scale state
-    reset_cmd = ["xrandr"]
-    for screen in screens:
-        reset_cmd.extend(["--output", screen.name, "--auto", "--scale", "1x1"])
-    xrandr_auto = exec_cmd(reset_cmd)
-    logger.debug(f"Output of xrandr auto-reset: {xrandr_auto}")
+    logger.debug(f"Applying settings: {configs}")
+    with timings.phase("apply"):
+        run_configs(configs, backend)
 
-    if layout_name == "auto":
-        return
 
-    xrandr_cmd = ["xrandr"]
+def plan_layout(screens, layout_name):
+    """
+    Plan the xrandr calls that take the screens from their current state to the layout.
 
-    layout = LAYOUTS.get(layout_name, {})
-    for screen in screens:
+    Outputs with a scale transform, or whose state the backend does not report
+    (see Screen.state_known), are reset to `--auto --scale 1x1` first. Then each
+    output only gets the settings that differ from its current state, so outputs
+    mirrored by position alone, e.g. two at 0x0, are left as they are.
+    Outputs not in the layout are turned off. The "auto" layout turns every
+    output on in its preferred mode.
+
+    Args:
+        screens (list): A list of connected Screen objects, with their current state.
+        layout_name (str): The name of the layout to apply.
+
+    Returns:
+        tuple: The OutputConfigs of the reset pass and those of the layout, both
+            empty if the layout is already active.
+    """
+    targets = None if layout_name == "auto" else get_config().layout_plans.get(layout_name)
+    screen_targets = [AUTO_TARGET if targets is None else targets.get(screen.uid) for screen in screens]
+
+    reset = []
+    for screen, target in zip(screens, screen_targets):
+        if not screen.is_enabled:
+            continue
+        # An output in an unknown state is not reset if it is turned off anyway
+        unknown = not screen.state_known and target is not None and target.enabled
+        if unknown or screen.scale:
+            reset.append(OutputConfig(screen.name, scale=(1, 1)))
+            # --auto switches to the preferred mode and drops the transform
+            screen.record_state(screen.position)
+            screen.resolution = screen.preferred_resolution() or screen.resolution
+
+    configs = []
+    for screen, target in zip(screens, screen_targets):
         screen: Screen
-        settings: ScreenSettings | None = layout.get(screen.uid)
-        if settings:
-            for key, value in settings.__dict__.items():
-                if key not in ["change_table", "is_connected"]:
-                    logger.debug(f"Setting {key} to {value} for screen {screen.uid}")
-                    setattr(screen, key, value)
-        else:
-            screen.is_enabled = False
-        cmd = screen.build_cmd()
-        if cmd:
-            xrandr_cmd.extend(screen.build_cmd()[1:])
+        config = screen.plan_config(target)
+        if config:
+            configs.append(config)
         else:
             logger.debug(f"No changes for screen {screen.uid}, skipping.")
-
-    logger.debug(f"Applying settings: {xrandr_cmd}")
-    exec_cmd(xrandr_cmd)
+    return reset, configs
 
 
 def find_internal_external(screens):
@@ -450,12 +986,42 @@ def find_internal_external(screens):
     return internal, externals
 
 
-def apply_mirror(screens):
+def snapshot_config(screen):
+    """
+    Return the config that puts an output back into the state it is in now.
+
+    Unlike the planned configs, every known setting is set, so that it can be
+    applied whatever state the output is in by then.
+    """
+    if not screen.is_enabled:
+        return OutputConfig(screen.name, enabled=False)
+    rate = screen.curr_mode.freq if screen.curr_mode else None
+    return OutputConfig(
+        screen.name,
+        True,
+        screen.resolution,
+        screen.is_primary,
+        screen.rotation,
+        screen.position,
+        screen.scale or (1, 1),
+        screen.same_as,
+        auto=False,
+        rate=rate or None,
+    )
+
+
+@timings.timed("apply_mirror")
+def apply_mirror(screens, backend="xrandr"):
     """Set up display mirroring between internal (eDP) and external screen.
 
     Scales the internal display's framebuffer to match the external's preferred
     resolution using xrandr --same-as and --scale.
+
+    Returns:
+        tuple: The OutputConfigs restoring the state before mirroring, see
+            snapshot_config, and those that were applied to mirror.
     """
+    restore = [snapshot_config(s) for s in screens]
     internal, externals = find_internal_external(screens)
     if not internal:
         raise RuntimeError("No internal (eDP) display found for mirroring")
@@ -471,8 +1037,8 @@ def apply_mirror(screens):
         for s in externals[1:]:
             s.is_enabled = False
 
-    ext_preferred = next((m for m in external.supported_modes if m.preferred), None)
-    int_preferred = next((m for m in internal.supported_modes if m.preferred), None)
+    ext_preferred = external.supported_modes.preferred
+    int_preferred = internal.supported_modes.preferred
     if not ext_preferred:
         raise RuntimeError(f"No preferred mode found for external display {external.name}")
     if not int_preferred:
@@ -498,16 +1064,17 @@ def apply_mirror(screens):
     internal.same_as = external.name
 
     # Build combined xrandr command
-    xrandr_cmd = ["xrandr"]
+    configs = []
     for s in screens:
-        cmd = s.build_cmd()
-        if cmd:
-            xrandr_cmd.extend(cmd[1:])
+        config = s.build_config()
+        if config:
+            configs.append(config)
         else:
             logger.debug(f"No changes for screen {s.name}, skipping.")
 
-    logger.debug(f"Mirror command: {xrandr_cmd}")
-    exec_cmd(xrandr_cmd)
+    logger.debug(f"Mirror command: {configs}")
+    run_configs(configs, backend)
+    return restore, configs
 
 
 ###
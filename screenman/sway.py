@@ -0,0 +1,266 @@
+"""Discovery and apply backend for sway and other compositors speaking the sway IPC protocol.
+
+The outputs are listed and configured over the `$SWAYSOCK` Unix socket, no
+`swaymsg` or `wlr-randr` process is forked. The connection is kept open and
+reused by every call of the process, e.g. in the daemon.
+
+Sway reports the make, model and serial of a monitor but not its EDID, so the
+EDID is read from the DRM connector in sysfs of the same name, which keeps the
+UIDs identical to those of the X backends. The IPC fields are only used if it
+cannot be read.
+
+Sway has no primary output and no mirroring. The primary flag is ignored, and
+mirror configurations raise UnsupportedConfig. Its output scale is a HiDPI
+factor rather than an xrandr transform, so it is left as the user set it.
+"""
+
+import json
+import os
+import re
+import socket
+import struct
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+from screenman import sysfs
+from screenman.edid import Edid, decode_edids
+from screenman.screen import Mode, Screen, detect_mirrors
+from screenman.utils import RotateDirection, rot_to_str
+
+MAGIC = b"i3-ipc"
+# Magic string, payload length and message type, in native byte order
+HEADER = struct.Struct("=6sII")
+RUN_COMMAND = 0
+GET_OUTPUTS = 3
+
+# Sway transforms rotate clockwise, like `xrandr --rotate right` for 90
+TRANSFORMS = {
+    "normal": RotateDirection.Normal,
+    "90": RotateDirection.Right,
+    "180": RotateDirection.Inverted,
+    "270": RotateDirection.Left,
+}
+SWAY_TRANSFORMS = {rotation: transform for transform, rotation in TRANSFORMS.items()}
+
+# wlroots formats numeric serials as 0x%08X
+RX_HEX_SERIAL = re.compile(r"^0x([0-9A-Fa-f]{8})$")
+
+
+class UnsupportedConfig(Exception):
+    """Raised for settings that cannot be applied through sway."""
+
+
+class SwayConnection:
+    """
+    A connection to the sway IPC socket, opened when it is created.
+
+    Args:
+        path (Optional[str]): The socket, `$SWAYSOCK` by default.
+
+    Raises:
+        RuntimeError: If no socket is given and $SWAYSOCK is not set.
+        OSError: If the socket cannot be connected.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        path = path or os.environ.get("SWAYSOCK")
+        if not path:
+            raise RuntimeError("The sway backend needs $SWAYSOCK, is sway running?")
+        self.path: str = path
+        self.sock = self._connect()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def close(self):
+        self.sock.close()
+
+    def _recv_exactly(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("sway closed the IPC connection")
+            data += chunk
+        return bytes(data)
+
+    def _exchange(self, message_type: int, payload: bytes):
+        self.sock.sendall(HEADER.pack(MAGIC, len(payload), message_type) + payload)
+        magic, length, reply_type = HEADER.unpack(self._recv_exactly(HEADER.size))
+        if magic != MAGIC or reply_type != message_type:
+            raise ConnectionError("Unexpected reply from sway", magic, reply_type)
+        return json.loads(self._recv_exactly(length))
+
+    def request(self, message_type: int, payload: str = ""):
+        """
+        Send one message and return its decoded reply.
+
+        A connection that went stale, e.g. because sway was restarted, is reopened once.
+        """
+        data = payload.encode()
+        try:
+            return self._exchange(message_type, data)
+        except OSError:
+            self.close()
+            self.sock = self._connect()
+            return self._exchange(message_type, data)
+
+    def outputs(self) -> list:
+        return self.request(GET_OUTPUTS)
+
+    def run(self, commands: list[str]):
+        """
+        Run sway commands in a single message.
+
+        Raises:
+            RuntimeError: If sway rejects any of the commands.
+        """
+        results = self.request(RUN_COMMAND, "; ".join(commands))
+        errors = [
+            (command, result.get("error", "failed"))
+            for command, result in zip(commands, results)
+            if not result.get("success")
+        ]
+        if errors:
+            raise RuntimeError("sway rejected output commands", errors)
+
+
+_connections: dict = {}
+
+
+def connection(path: Optional[str] = None) -> SwayConnection:
+    """Return the connection to a sway socket, `$SWAYSOCK` by default, opened on first use."""
+    path = path or os.environ.get("SWAYSOCK")
+    if path not in _connections:
+        _connections[path] = SwayConnection(path)
+    return _connections[path]
+
+
+def _normalize_serial(serial: Optional[str]) -> Optional[str]:
+    """Format a serial like the EDID decoder does, which wlroots prints as 0x%08X for numeric serials."""
+    serial = (serial or "").strip()
+    if not serial or serial == "Unknown":
+        return None
+    match = RX_HEX_SERIAL.match(serial)
+    if match:
+        number = int(match.group(1), 16)
+        return f"{number} (0x{number:08x})" if number else None
+    return serial
+
+
+def _drm_edid(name: str, root: Optional[Path] = None) -> bytes:
+    """Read the EDID of the DRM connector an output is named after, empty if there is none."""
+    for path in sorted((root or sysfs.DRM_ROOT).glob(f"card*-{name}")):
+        try:
+            return (path / "edid").read_bytes()
+        except OSError:
+            continue
+    return b""
+
+
+def _ipc_edid(output: dict) -> Edid:
+    """Build the identification from the make, model and serial sway reports."""
+    edid = Edid(
+        serial=_normalize_serial(output.get("serial")),
+        name=output.get("model"),
+        manufacturer=output.get("make"),
+        model_number=output.get("model"),
+    )
+    if not edid.serial:
+        edid.fallback_uid = edid.get_fallback_uid()
+    return edid
+
+
+def screen_from_output(output: dict, edid: Edid) -> Screen:
+    """Convert an output of the GET_OUTPUTS reply."""
+    active = output.get("active", False)
+    current = output.get("current_mode") if active else None
+    modes = []
+    for index, mode in enumerate(output.get("modes", [])):
+        modes.append(
+            Mode(
+                mode["width"],
+                mode["height"],
+                round(mode["refresh"] / 1000, 2),
+                current=current is not None
+                and (mode["width"], mode["height"], mode["refresh"])
+                == (current["width"], current["height"], current["refresh"]),
+                # Sway does not flag the preferred mode, the DRM driver lists it first
+                preferred=index == 0,
+            )
+        )
+    rot = TRANSFORMS.get(output.get("transform", "normal")) if active else None
+    screen = Screen(output["name"], False, rot, modes, "", edid)
+    if active:
+        rect = output.get("rect", {})
+        screen.record_state(position=("--pos", f"{rect.get('x', 0)}x{rect.get('y', 0)}"))
+    return screen
+
+
+def connected_screens(path: Optional[str] = None, root: Optional[Path] = None) -> list:
+    """
+    Get a list of connected screens from sway.
+
+    Args:
+        path (Optional[str]): The IPC socket, `$SWAYSOCK` by default.
+        root (Path): The DRM class directory the EDIDs are read from, `/sys/class/drm` by default.
+
+    Returns:
+        list: A list of connected Screen objects, in the order sway lists them.
+    """
+    outputs = connection(path).outputs()
+    decoded = decode_edids([_drm_edid(output["name"], root) for output in outputs])
+    screens = []
+    for output, edid in zip(outputs, decoded):
+        if edid is None or not (edid.serial or edid.fallback_uid or edid.manufacturer):
+            edid = _ipc_edid(output)
+        screens.append(screen_from_output(output, edid))
+    return detect_mirrors([s for s in screens if s.is_connected])
+
+
+def output_command(config) -> str:
+    """
+    Translate an output configuration into a sway `output` command.
+
+    Raises:
+        UnsupportedConfig: For mirroring, scaling and relative positions.
+    """
+    if not config.enabled:
+        return f"output {config.name} disable"
+    if config.same_as:
+        raise UnsupportedConfig("mirroring", config.name, config.same_as)
+    if config.scale and tuple(config.scale) != (1, 1):
+        raise UnsupportedConfig("scaling", config.name, config.scale)
+    parts = [f"output {config.name} enable"]
+    if config.resolution:
+        mode = f"{config.resolution[0]}x{config.resolution[1]}"
+        parts.append(f"mode {mode}@{config.rate:.3f}Hz" if config.rate else f"mode {mode}")
+    if config.position:
+        option, value = config.position
+        if option != "--pos":
+            raise UnsupportedConfig("relative position", config.name, option)
+        x, y = value.split("x")
+        parts.append(f"position {x} {y}")
+    if config.rotation is not None:
+        if config.rotation not in SWAY_TRANSFORMS:
+            raise UnsupportedConfig("rotation", config.name, rot_to_str(config.rotation))
+        parts.append(f"transform {SWAY_TRANSFORMS[config.rotation]}")
+    if config.primary:
+        logger.debug(f"sway has no primary output, ignoring it for {config.name}")
+    return " ".join(parts)
+
+
+def apply_configs(configs, path: Optional[str] = None):
+    """Apply output configurations in a single IPC message."""
+    commands = [output_command(config) for config in configs]
+    if commands:
+        logger.debug(f"Running sway commands: {commands}")
+        connection(path).run(commands)
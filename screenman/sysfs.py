@@ -0,0 +1,270 @@
+"""Discovery backend reading connector state from the DRM subsystem in sysfs.
+
+Unlike `xrandr --props`, reading `/sys/class/drm/card*-*/{status,edid,modes}`
+does not trigger a reprobe of every output. Layouts are still applied with xrandr,
+so the DRM connector names are mapped to the names of the RandR outputs. That
+mapping is not known for DP-MST connectors, e.g. those of a dock, the X drivers
+name them from their PATH property, which sysfs does not show.
+
+The connector status is also what `rescan_and_settle` polls after a PCI rescan,
+as reading it is cheap enough to do every few milliseconds.
+"""
+
+import re
+import time
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+from screenman import timings
+from screenman.edid import decode_edids
+from screenman.screen import Mode, Screen
+from screenman.utils import rescan_pci
+
+DRM_ROOT = Path("/sys/class/drm")
+
+# Backoff of the connector status polls after a PCI rescan, in seconds
+SETTLE_FIRST_DELAY = 0.02
+SETTLE_MAX_DELAY = 0.32
+# Seconds the connector status has to stay unchanged to count as settled
+SETTLE_QUIET = 0.3
+# Upper bound of the wait for the connectors to settle, in seconds
+SETTLE_DEADLINE = 5.0
+
+RX_CONNECTOR = re.compile(r"^card(?P<card>\d+)-(?P<type>.+)-(?P<index>\d+)$")
+RX_MODE = re.compile(r"^(\d+)x(\d+)$")
+
+# Connector type names that differ between the kernel and the modesetting X driver
+MODESETTING_TYPES = {"HDMI-A": "HDMI", "Unknown": "None"}
+
+
+class UnsupportedConnector(Exception):
+    """Raised for connected connectors whose RandR output name cannot be derived from sysfs."""
+
+
+def _read(path, default=""):
+    try:
+        return path.read_text().strip()
+    except OSError:
+        return default
+
+
+def card_driver(root: Path, card: str) -> str:
+    """Return the name of the kernel driver of a card, e.g. "i915" or "amdgpu"."""
+    return (root / f"card{card}" / "device" / "driver").resolve().name
+
+
+def primary_card(root: Path, cards: list[str]) -> str:
+    """Return the card the X server uses as primary GPU, the boot VGA device if known."""
+    for card in cards:
+        if _read(root / f"card{card}" / "device" / "boot_vga") == "1":
+            return card
+    return cards[0]
+
+
+def mst_connectors(root: Path) -> set:
+    """
+    Return the names of the DP-MST connectors, e.g. "card0-DP-7" for an output of a dock.
+
+    The kernel creates them without a DDC adapter, so on a card whose physical
+    connectors link theirs, a DisplayPort connector without one is an MST
+    connector. A `path` attribute, where the kernel exposes it, marks them as well.
+    """
+    connectors = [(path, RX_CONNECTOR.match(path.name)) for path in root.glob("card*-*")]
+    ddc_cards = {match.group("card") for path, match in connectors if match and (path / "ddc").exists()}
+    return {
+        path.name
+        for path, match in connectors
+        if match
+        and match.group("type") == "DP"
+        and ((path / "path").exists() or (match.group("card") in ddc_cards and not (path / "ddc").exists()))
+    }
+
+
+def randr_output_name(connector_type: str, index: int, driver: str = "", gpu: int = 0) -> str:
+    """
+    Map a DRM connector to the name of the RandR output the X driver gives it.
+
+    Args:
+        connector_type (str): The kernel connector type, e.g. "HDMI-A" or "eDP".
+        index (int): The kernel connector index, starting at 1.
+        driver (str): The kernel driver of the card.
+        gpu (int): 0 for the primary GPU, otherwise the number of the secondary GPU.
+
+    Returns:
+        str: The RandR output name.
+    """
+    if driver in ("amdgpu", "radeon"):
+        # The AMD X drivers keep the kernel names and count from 0
+        return f"{connector_type}-{index - 1}"
+    # The modesetting driver, used for Intel and most other drivers
+    name = MODESETTING_TYPES.get(connector_type, connector_type)
+    if gpu:
+        return f"{name}-{gpu}-{index}"
+    return f"{name}-{index}"
+
+
+def _parse_modes(text: str, enabled: bool) -> list:
+    """
+    Parse the modes file of a connector, which lists one resolution per line.
+
+    The file has no refresh rates and does not say which mode is current. The
+    first mode is the preferred one. Layouts are applied on top of an `--auto`
+    reset, so an enabled output is taken to run its preferred mode.
+    """
+    modes = []
+    seen = set()
+    for line in text.splitlines():
+        match = RX_MODE.match(line.strip())
+        if not match:
+            continue
+        resolution = (int(match.group(1)), int(match.group(2)))
+        if resolution in seen:
+            continue
+        seen.add(resolution)
+        first = not modes
+        modes.append(Mode(*resolution, 0.0, current=first and enabled, preferred=first))
+    return modes
+
+
+def connected_screens(root: Optional[Path] = None) -> list:
+    """
+    Get a list of connected screens from sysfs.
+
+    Args:
+        root (Path): The DRM class directory, `/sys/class/drm` by default.
+
+    Returns:
+        list: A list of connected Screen objects, in connector order.
+
+    Raises:
+        UnsupportedConnector: If a DP-MST connector is connected, see mst_connectors.
+    """
+    root = root or DRM_ROOT
+    connectors = []
+    for path in root.glob("card*-*"):
+        match = RX_CONNECTOR.match(path.name)
+        if match and _read(path / "status") == "connected":
+            connectors.append((path, match))
+    if not connectors:
+        logger.debug(f"No connected DRM connectors found in {root}")
+        return []
+    mst = sorted(mst_connectors(root) & {path.name for path, _ in connectors})
+    if mst:
+        raise UnsupportedConnector("DP-MST", *mst)
+
+    cards = sorted({match.group("card") for _, match in connectors}, key=int)
+    primary = primary_card(root, cards)
+    secondaries = [card for card in cards if card != primary]
+    drivers = {card: card_driver(root, card) for card in cards}
+    connectors.sort(
+        key=lambda c: (int(c[1].group("card")), int(_read(c[0] / "connector_id", "0")), c[0].name)
+    )
+
+    edids = []
+    for path, _ in connectors:
+        try:
+            edids.append((path / "edid").read_bytes())
+        except OSError:
+            edids.append(b"")
+    decoded = decode_edids(edids)
+
+    screens = []
+    for (path, match), edid, decoded_edid in zip(connectors, edids, decoded):
+        card = match.group("card")
+        name = randr_output_name(
+            match.group("type"),
+            int(match.group("index")),
+            drivers[card],
+            secondaries.index(card) + 1 if card in secondaries else 0,
+        )
+        enabled = _read(path / "enabled") == "enabled"
+        modes = _parse_modes(_read(path / "modes"), enabled)
+        # Neither the rotation nor the primary output are exposed by sysfs. Leaving
+        # the rotation unknown makes the layout always set it explicitly.
+        screen = Screen(name, False, None, modes, edid.hex(), decoded_edid)
+        # Nor are the active mode, the scale and the mirror state, the first mode is only a guess
+        screen.state_known = False
+        screens.append(screen)
+        logger.debug(f"DRM connector {path.name} is RandR output {name}")
+    return screens
+
+
+def connector_status(root: Optional[Path] = None) -> dict:
+    """
+    Read the status of every DRM connector, without reprobing the outputs.
+
+    Args:
+        root (Path): The DRM class directory, `/sys/class/drm` by default.
+
+    Returns:
+        dict: Maps the connector names, e.g. "card0-DP-1", to their status.
+    """
+    root = root or DRM_ROOT
+    return {
+        path.name: _read(path / "status", "unknown")
+        for path in root.glob("card*-*")
+        if RX_CONNECTOR.match(path.name)
+    }
+
+
+def wait_for_connectors(
+    status: dict,
+    root: Optional[Path] = None,
+    quiet: float = SETTLE_QUIET,
+    deadline: float = SETTLE_DEADLINE,
+) -> dict:
+    """
+    Poll the connector status with exponential backoff until it stops changing.
+
+    Args:
+        status (dict): The status to compare the first poll against, see connector_status.
+        root (Path): The DRM class directory, `/sys/class/drm` by default.
+        quiet (float): Seconds the status has to stay unchanged.
+        deadline (float): Seconds after which to stop waiting, settled or not.
+
+    Returns:
+        dict: The last status read.
+    """
+    start = unchanged_since = time.monotonic()
+    delay = SETTLE_FIRST_DELAY
+    while True:
+        time.sleep(delay)
+        now = time.monotonic()
+        current = connector_status(root)
+        if current != status:
+            status, unchanged_since = current, now
+        elif now - unchanged_since >= quiet:
+            return status
+        if now - start >= deadline:
+            logger.warning(f"DRM connectors still changing after {deadline:.1f}s, discovering anyway")
+            return status
+        delay = min(delay * 2, SETTLE_MAX_DELAY)
+
+
+@timings.timed("rescan_and_settle")
+def rescan_and_settle(root: Optional[Path] = None) -> dict:
+    """
+    Rescan the PCI bus and wait for the DRM connectors to settle.
+
+    Run before discovery, so that the displays of a dock that only shows up
+    after the rescan are probed as well.
+
+    Args:
+        root (Path): The DRM class directory, `/sys/class/drm` by default.
+
+    Returns:
+        dict: The connector status after the rescan, see connector_status.
+    """
+    before = connector_status(root)
+    if not rescan_pci():
+        logger.debug("PCI rescan failed or not available")
+        return before
+    logger.debug("PCI bus rescanned successfully")
+    with timings.phase("settle"):
+        after = wait_for_connectors(before, root)
+    for name in sorted(after.keys() | before.keys()):
+        if after.get(name) != before.get(name):
+            logger.debug(f"DRM connector {name}: {before.get(name, 'absent')} -> {after.get(name, 'absent')}")
+    return after
@@ -0,0 +1,170 @@
+"""Per-phase timing of a screenman run.
+
+Discovery, the PCI rescan, the reset and the apply are wrapped in phases, see
+`timed` and `phase`. While no Recorder is enabled the hooks only check a module
+global, so they cost nothing measurable. Enabled with `--timings`, every phase
+records its wall time and how many subprocesses were spawned during it, and the
+run can be written as JSON or as a Chrome trace (chrome://tracing, Perfetto).
+"""
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+FORMATS = ("json", "chrome")
+
+
+@dataclass
+class PhaseRecord:
+    """
+    A finished phase.
+
+    Attributes:
+        name (str): The name of the phase.
+        start (float): Seconds since the recorder was enabled.
+        wall (float): Wall time of the phase in seconds, including nested phases.
+        subprocesses (int): Subprocesses spawned during the phase, including nested phases.
+        depth (int): How many phases of the same thread enclose this one.
+        thread (int): The thread the phase ran in.
+    """
+
+    name: str
+    start: float
+    wall: float
+    subprocesses: int
+    depth: int
+    thread: int
+
+
+class Recorder:
+    """Collects the phases and the subprocess count of one run."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.records: list[PhaseRecord] = []
+        self.subprocesses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        spawned = self.subprocesses
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._local.depth = depth
+            record = PhaseRecord(
+                name, start - self.origin, end - start, self.subprocesses - spawned, depth, threading.get_ident()
+            )
+            with self._lock:
+                self.records.append(record)
+
+    def subprocess_started(self):
+        with self._lock:
+            self.subprocesses += 1
+
+    def total(self) -> float:
+        return time.perf_counter() - self.origin
+
+    def ordered(self) -> list:
+        """The phases in the order they started, enclosing phases first."""
+        return sorted(self.records, key=lambda r: (r.start, r.depth))
+
+    def report(self) -> str:
+        """Render the phases as an indented table."""
+        lines = [f"{'phase':<32} {'wall [ms]':>10} {'subprocesses':>12}"]
+        for record in self.ordered():
+            name = "  " * record.depth + record.name
+            lines.append(f"{name:<32} {record.wall * 1000:10.2f} {record.subprocesses:12d}")
+        lines.append(f"{'total':<32} {self.total() * 1000:10.2f} {self.subprocesses:12d}")
+        return "\n".join(lines)
+
+    def to_json(self) -> dict:
+        return {
+            "total_ms": self.total() * 1000,
+            "subprocesses": self.subprocesses,
+            "phases": [
+                {**asdict(r), "start": r.start * 1000, "wall": r.wall * 1000} for r in self.ordered()
+            ],
+        }
+
+    def to_chrome_trace(self) -> dict:
+        """Render the phases as complete events of the Chrome trace event format."""
+        pid = os.getpid()
+        events = [
+            {
+                "name": r.name,
+                "ph": "X",
+                "ts": r.start * 1e6,
+                "dur": r.wall * 1e6,
+                "pid": pid,
+                "tid": r.thread,
+                "args": {"subprocesses": r.subprocesses},
+            }
+            for r in self.ordered()
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path: Path, fmt: str = "json"):
+        """Write the phases to a file, in one of FORMATS."""
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown timings format: {fmt}")
+        data = self.to_chrome_trace() if fmt == "chrome" else self.to_json()
+        Path(path).write_text(json.dumps(data, indent=2) + "\n")
+
+
+_recorder: Optional[Recorder] = None
+_OFF = contextlib.nullcontext()
+
+
+def enable() -> Recorder:
+    """Start recording phases, replacing any previous recording."""
+    global _recorder
+    _recorder = Recorder()
+    return _recorder
+
+
+def disable() -> Optional[Recorder]:
+    """Stop recording and return the recorder, None if none was enabled."""
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder
+
+
+def phase(name: str):
+    """Return a context manager timing a phase, a no-op while no recorder is enabled."""
+    if _recorder is None:
+        return _OFF
+    return _recorder.phase(name)
+
+
+def timed(name: str):
+    """Decorator timing every call of a function as a phase."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return func(*args, **kwargs)
+            with _recorder.phase(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def subprocess_started():
+    """Count a spawned subprocess towards the running phases."""
+    if _recorder is not None:
+        _recorder.subprocess_started()
@@ -1,6 +1,8 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 import subprocess as sb
-from typing import Optional
+from typing import Optional, Union
+
+from screenman import timings
 
 
 class RotateDirection:
@@ -18,10 +20,28 @@ def str_to_rot(s):
 
 
 def exec_cmd(cmd):
+    timings.subprocess_started()
     s = sb.check_output(cmd, stderr=sb.STDOUT)
     return s.decode().split("\n")
 
 
+def exec_cmd_stream(cmd):
+    """
+    Run a command and yield its output line by line, as soon as it is produced.
+
+    Raises:
+        subprocess.CalledProcessError: If the command exits with a non-zero status.
+    """
+    timings.subprocess_started()
+    with sb.Popen(cmd, stdout=sb.PIPE, stderr=sb.STDOUT, text=True) as proc:
+        # stdout is only None without stdout=PIPE
+        for line in proc.stdout or ():
+            yield line.rstrip("\n")
+    if proc.returncode:
+        raise sb.CalledProcessError(proc.returncode, cmd)
+
+
+@timings.timed("rescan_pci")
 def rescan_pci():
     """
     Rescan PCI bus to detect dock/display hardware.
@@ -29,6 +49,7 @@ def rescan_pci():
     Returns:
         bool: True if rescan succeeded, False otherwise.
     """
+    timings.subprocess_started()
     try:
         sb.run(
             ["sudo", "tee", "/sys/bus/pci/rescan"],
@@ -43,7 +64,13 @@ def rescan_pci():
         return False
 
 
-@dataclass
+class Change:
+    """Bits of ScreenSettings.changed, one per setting."""
+
+    RESOLUTION, PRIMARY, ENABLED, ROTATION, POSITION, SCALE, SAME_AS = (1 << i for i in range(7))
+
+
+@dataclass(slots=True)
 class ScreenSettings:
     resolution: tuple[int, int] = (0, 0)
     is_primary: bool = False
@@ -53,14 +80,7 @@ class ScreenSettings:
     is_connected: bool = True
     scale: Optional[tuple[float, float]] = None
     same_as: Optional[str] = None
-    change_table: dict[str, bool] = field(
-        default_factory=lambda: {
-            "resolution": False,
-            "is_primary": False,
-            "is_enabled": False,
-            "rotation": False,
-            "position": False,
-            "scale": False,
-            "same_as": False,
-        }
-    )
\ No newline at end of file
+    # Refresh rate in Hz, "max" for the highest rate of the mode
+    rate: Optional[Union[float, str]] = None
+    # The settings changed since discovery, a combination of Change bits
+    changed: int = 0
\ No newline at end of file
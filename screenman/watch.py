@@ -0,0 +1,234 @@
+"""Hot reload of the configuration in long-running processes, e.g. the daemon.
+
+The directories of the configuration file in use and of the candidates taking
+priority over it (see config.config_paths) are watched with inotify, so that a
+file replaced by an editor or created in a higher-priority place is noticed as
+well. When a burst of changes settled, the configuration is parsed in the
+watcher thread and swapped in with a single assignment. If the new file is
+broken, the last good configuration stays active.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+from loguru import logger
+
+from screenman.cache import cache_dir
+from screenman.config import CompiledConfigCache, Config, config_paths, swap_config
+from screenman.edid import reset_decoded
+from screenman.screen import reset_output_cache
+
+# From <sys/inotify.h>
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+# Watch descriptor, mask, cookie and length of the name following the header
+EVENT_HEADER = struct.Struct("iIII")
+EVENT_BUFFER_SIZE = 16384
+
+# Seconds without a new change before a burst counts as settled
+DEBOUNCE_SECONDS = 0.2
+
+
+class Inotify:
+    """A minimal inotify instance, through the C library as the standard library has no binding."""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path: Path, mask: int = WATCH_MASK) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(path))
+        return wd
+
+    def rm_watch(self, wd: int):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout: Optional[float] = None) -> list[tuple[int, int, str]]:
+        """
+        Wait for events.
+
+        Returns:
+            list: The (watch descriptor, mask, name) of every event, empty if none arrived in time.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, EVENT_BUFFER_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def relevant_paths() -> list[Path]:
+    """Return the configuration file in use and the candidates taking priority over it, all if none exists."""
+    paths = []
+    for path in config_paths():
+        paths.append(path)
+        if path.is_file():
+            break
+    return paths
+
+
+def load_config() -> tuple[Optional[Path], Config]:
+    """
+    Parse the configuration file that would be used now, bypassing the compiled config cache.
+
+    Returns:
+        tuple: The path of the file, None if there is none, and the configuration.
+
+    Raises:
+        Exception: If the file cannot be read or is not a valid configuration.
+    """
+    for path in config_paths():
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        config = Config.from_toml(path)
+        CompiledConfigCache(cache_dir() / "config.pickle").put(path, stat, config)
+        return path, config
+    return None, Config()
+
+
+class ConfigWatcher:
+    """
+    Reload the configuration when its file changes, in a background thread.
+
+    Attributes:
+        lock (threading.Lock): Held while the configuration is swapped, so that it never
+            changes in the middle of a discovery or an apply holding it.
+        on_reload (Optional[Callable]): Called after a new configuration was swapped in.
+        debounce (float): Seconds without a new change before a burst counts as settled.
+    """
+
+    # Seconds between checks for a stop request
+    POLL_INTERVAL = 0.5
+
+    def __init__(
+        self,
+        lock: Optional[threading.Lock] = None,
+        on_reload: Optional[Callable[[], None]] = None,
+        debounce: float = DEBOUNCE_SECONDS,
+    ):
+        self.lock = lock or threading.Lock()
+        self.on_reload = on_reload
+        self.debounce = debounce
+        self.inotify = Inotify()
+        self.paths: set[Path] = set()
+        self.watches: dict[int, Path] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.update_watches()
+
+    def update_watches(self):
+        """Watch the directories of the relevant paths, and stop watching the others."""
+        paths = relevant_paths()
+        self.paths = set(paths)
+        directories = {path.parent for path in paths}
+        for wd, directory in list(self.watches.items()):
+            if directory not in directories:
+                self.inotify.rm_watch(wd)
+                del self.watches[wd]
+        watched = set(self.watches.values())
+        for directory in directories - watched:
+            try:
+                self.watches[self.inotify.add_watch(directory)] = directory
+            except OSError as e:
+                # The directory does not exist (yet), its file cannot take priority
+                logger.debug(f"Not watching {directory} for configuration changes: {e}")
+
+    def _relevant(self, events) -> bool:
+        changed = False
+        for wd, mask, name in events:
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+            elif wd in self.watches and self.watches[wd] / name in self.paths:
+                changed = True
+        return changed
+
+    def reload(self) -> bool:
+        """
+        Parse the configuration and swap it in.
+
+        Returns:
+            bool: True if the new configuration is active, False if the last good one was kept.
+        """
+        try:
+            path, config = load_config()
+        except Exception as e:
+            logger.error(f"Keeping the last good configuration, the new one is broken: {e}")
+            return False
+        with self.lock:
+            previous = swap_config(config)
+            if previous.fallback_uid != config.fallback_uid:
+                reset_decoded()
+                reset_output_cache()
+        logger.info(f"Reloaded the configuration from {path or 'the defaults'}")
+        return True
+
+    def run(self):
+        """Reload the configuration after every burst of changes, until stopped."""
+        while not self._stop.is_set():
+            if not self._relevant(self.inotify.read(self.POLL_INTERVAL)):
+                continue
+            while not self._stop.is_set():
+                events = self.inotify.read(self.debounce)
+                if not events:
+                    break
+                self._relevant(events)
+            if self._stop.is_set():
+                break
+            reloaded = self.reload()
+            # A new file may take priority now, or the one in use may be gone
+            self.update_watches()
+            if reloaded and self.on_reload is not None:
+                try:
+                    self.on_reload()
+                except Exception:
+                    logger.exception("Failed to apply the reloaded configuration")
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="screenman-config-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.inotify.close()
@@ -0,0 +1,106 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from screenman.config import Config
+from tests.helpers import FakeSwayServer
+
+BENCHMARK_FIXTURES = Path(__file__).parent.parent / "benchmarks" / "fixtures"
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Keep the on-disk caches of every test in a temporary directory."""
+    cache_home = tmp_path / "cache"
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache_home))
+    monkeypatch.setattr("screenman.edid._edid_cache", None)
+    monkeypatch.setattr("screenman.screen._output_cache", None)
+    return cache_home / "screenman"
+
+
+@pytest.fixture(autouse=True)
+def runtime_dir(monkeypatch):
+    """Keep the daemon socket out of the user's runtime directory, so no running daemon is reached."""
+    # Unix socket paths are limited to about 100 bytes, pytest's tmp_path can be longer
+    with tempfile.TemporaryDirectory(prefix="screenman-") as path:
+        monkeypatch.setenv("XDG_RUNTIME_DIR", path)
+        yield Path(path)
+
+
+@pytest.fixture(autouse=True)
+def empty_config(monkeypatch):
+    """Run every test against an empty configuration instead of the user's."""
+    config = Config()
+    monkeypatch.setattr("screenman.config._config", config)
+    return config
+
+
+def start_xvfb(display):
+    """Start an Xvfb server with RandR on the given display number, or skip the test."""
+    if not shutil.which("Xvfb"):
+        pytest.skip("Xvfb is not installed")
+    proc = subprocess.Popen(
+        ["Xvfb", f":{display}", "-screen", "0", "1920x1080x24", "+extension", "RANDR", "-nolisten", "tcp"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    socket = f"/tmp/.X11-unix/X{display}"
+    deadline = time.monotonic() + 10
+    while not os.path.exists(socket):
+        if proc.poll() is not None or time.monotonic() > deadline:
+            proc.kill()
+            pytest.skip(f"Xvfb failed to start on :{display}")
+        time.sleep(0.05)
+    return proc
+
+
+@pytest.fixture
+def xvfb_display():
+    """Run an Xvfb server for the test and return its display name."""
+    proc = start_xvfb(97)
+    yield ":97"
+    proc.terminate()
+    proc.wait()
+
+
+@pytest.fixture
+def xvfb_displays():
+    """Run two Xvfb servers for the test and return their display names."""
+    procs = [start_xvfb(95), start_xvfb(96)]
+    yield [":95", ":96"]
+    for proc in procs:
+        proc.terminate()
+        proc.wait()
+
+
+@pytest.fixture
+def fake_bin(monkeypatch):
+    """
+    Put the fake xrandr and edid-decode of the benchmarks on PATH, with the layouts of their corpus.
+
+    Returns a function selecting the xrandr dump by its number of connected outputs.
+    """
+    monkeypatch.setenv("PATH", f"{BENCHMARK_FIXTURES.parent / 'bin'}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr("screenman.config._config", Config.from_toml(BENCHMARK_FIXTURES / "layouts.toml"))
+
+    def select_dump(count=2):
+        monkeypatch.setenv("SCREENMAN_FAKE_XRANDR", str(BENCHMARK_FIXTURES / "xrandr" / f"outputs-{count:02d}.txt"))
+
+    select_dump()
+    return select_dump
+
+
+@pytest.fixture
+def fake_sway(runtime_dir, monkeypatch):
+    """Serve a fake sway IPC socket on $SWAYSOCK, its outputs can be replaced through `outputs`."""
+    path = runtime_dir / "sway-ipc.sock"
+    monkeypatch.setenv("SWAYSOCK", str(path))
+    monkeypatch.setattr("screenman.sway._connections", {})
+    server = FakeSwayServer(path, [])
+    yield server
+    server.stop()
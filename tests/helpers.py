@@ -0,0 +1,255 @@
+"""Helpers to build synthetic test data for `screenman`."""
+
+import json
+import socketserver
+import struct
+import threading
+
+EDID_HEADER = b"\x00\xff\xff\xff\xff\xff\xff\x00"
+
+
+def _checksum(block):
+    block[127] = (-sum(block[:127])) & 0xFF
+    return block
+
+
+def _pnp_id(manufacturer):
+    raw = 0
+    for char in manufacturer:
+        raw = (raw << 5) | (ord(char) - ord("A") + 1)
+    return raw.to_bytes(2, "big")
+
+
+def _text_descriptor(tag, text):
+    payload = text.encode("ascii")[:13]
+    if len(payload) < 13:
+        payload += b"\n" + b" " * (12 - len(payload))
+    return b"\x00\x00\x00" + bytes([tag, 0]) + payload
+
+
+def make_displayid_ext(serial=0, name=""):
+    """Build a DisplayID 1.3 extension block with a product identification block."""
+    name_bytes = name.encode("ascii")
+    payload = b"DEL" + (0x1234).to_bytes(2, "little") + serial.to_bytes(4, "little")
+    payload += bytes([1, 30, len(name_bytes)]) + name_bytes
+    data_block = bytes([0x00, 0x00, len(payload)]) + payload
+    block = bytearray(128)
+    block[0] = 0x70
+    block[1:5] = bytes([0x13, len(data_block), 0x00, 0x00])
+    block[5 : 5 + len(data_block)] = data_block
+    return bytes(_checksum(block))
+
+
+def make_cta_ext():
+    """Build a minimal CTA-861 extension block without data blocks."""
+    block = bytearray(128)
+    block[0:4] = bytes([0x02, 0x03, 0x04, 0x00])
+    return bytes(_checksum(block))
+
+
+def make_edid(
+    manufacturer="DEL",
+    product_code=41146,
+    serial=0,
+    serial_str=None,
+    name=None,
+    extensions=(),
+):
+    """
+    Build a raw EDID and return it as a hex string, like xrandr prints it.
+
+    Args:
+        manufacturer (str): The 3-letter PNP ID.
+        product_code (int): The product code.
+        serial (int): The numeric serial of the base block.
+        serial_str (str): The serial number display descriptor, if any.
+        name (str): The monitor name display descriptor, if any.
+        extensions (tuple): Raw 128-byte extension blocks.
+
+    Returns:
+        str: The EDID as a lowercase hex string.
+    """
+    block = bytearray(128)
+    block[0:8] = EDID_HEADER
+    block[8:10] = _pnp_id(manufacturer)
+    block[10:12] = product_code.to_bytes(2, "little")
+    block[12:16] = serial.to_bytes(4, "little")
+    block[16:20] = bytes([1, 30, 1, 4])
+    descriptors = []
+    if serial_str is not None:
+        descriptors.append(_text_descriptor(0xFF, serial_str))
+    if name is not None:
+        descriptors.append(_text_descriptor(0xFC, name))
+    while len(descriptors) < 4:
+        descriptors.append(b"\x00\x00\x00\x10" + b"\x00" * 14)
+    block[54:126] = b"".join(descriptors)
+    block[126] = len(extensions)
+    return (bytes(_checksum(block)) + b"".join(extensions)).hex()
+
+
+def make_xrandr_output(outputs):
+    """
+    Build the lines of an `xrandr --props` dump.
+
+    Args:
+        outputs (list): One dict per output with the keys `name`, and optionally
+            `connected` (default True), `primary`, `edid` (hex string), `position`
+            (x, y), `rotation`, `modes` (list of (width, height, rates)), `current`
+            ((width, height, rate), default the first rate of the first mode) and
+            `preferred` (same format, default the first mode).
+
+    Returns:
+        list: The lines of output, without trailing newlines.
+    """
+    lines = ["Screen 0: minimum 320 x 200, current 3840 x 2160, maximum 16384 x 16384"]
+    for output in outputs:
+        name = output["name"]
+        if not output.get("connected", True):
+            lines.append(f"{name} disconnected (normal left inverted right x axis y axis)")
+            lines.append("\tnon-desktop: 0 ")
+            lines.append("\t\tsupported: 0, 1")
+            continue
+        modes = output.get("modes", [(1920, 1080, [60.0])])
+        width, height, rates = modes[0]
+        current = output.get("current", (width, height, rates[0]))
+        preferred = output.get("preferred", (width, height, rates[0]))
+        words = [name, "connected"]
+        if output.get("primary"):
+            words.append("primary")
+        if current:
+            x, y = output.get("position", (0, 0))
+            rotation = output.get("rotation", "normal")
+            cur_w, cur_h = current[:2]
+            if rotation in ("left", "right"):
+                cur_w, cur_h = cur_h, cur_w
+            words.append(f"{cur_w}x{cur_h}+{x}+{y}")
+            if rotation != "normal":
+                words.append(rotation)
+        words.append("(normal left inverted right x axis y axis) 527mm x 296mm")
+        lines.append(" ".join(words))
+        if output.get("edid"):
+            lines.append("\tEDID: ")
+            edid = output["edid"]
+            lines.extend(f"\t\t{edid[i : i + 32]}" for i in range(0, len(edid), 32))
+        lines.append("\tnon-desktop: 0 ")
+        lines.append("\t\tsupported: 0, 1")
+        lines.append("\tlink-status: Good ")
+        lines.append("\t\tsupported: Good, Bad")
+        for width, height, rates in modes:
+            rate_strs = []
+            for rate in rates:
+                flags = "*" if current and (width, height, rate) == tuple(current) else " "
+                flags += "+" if (width, height, rate) == tuple(preferred) else " "
+                rate_strs.append(f"{rate:6.2f}{flags}")
+            lines.append(f"   {f'{width}x{height}':<14}" + " ".join(rate_strs))
+    lines.append("")
+    return lines
+
+
+def make_sysfs_tree(root, connectors, driver="i915"):
+    """
+    Build a fake `/sys/class/drm` tree.
+
+    Args:
+        root (Path): The directory standing in for `/sys/class/drm`.
+        connectors (dict): Maps connector names like "card0-HDMI-A-1" to dicts with
+            the keys `status`, and optionally `enabled`, `edid` (hex string),
+            `modes` (list of "WxH" strings) and `ddc` (True to link a DDC adapter).
+        driver (str): The kernel driver of every card.
+
+    Returns:
+        Path: The root directory.
+    """
+    for connector_id, (name, connector) in enumerate(connectors.items(), start=70):
+        card = name.split("-")[0]
+        device = root / card / "device"
+        if not device.exists():
+            (root / "drivers" / driver).mkdir(parents=True, exist_ok=True)
+            device.mkdir(parents=True)
+            (device / "driver").symlink_to(root / "drivers" / driver)
+        path = root / name
+        path.mkdir(parents=True)
+        (path / "connector_id").write_text(f"{connector_id}\n")
+        (path / "status").write_text(connector["status"] + "\n")
+        (path / "enabled").write_text(connector.get("enabled", "disabled") + "\n")
+        (path / "edid").write_bytes(bytes.fromhex(connector.get("edid", "")))
+        (path / "modes").write_text("".join(f"{mode}\n" for mode in connector.get("modes", [])))
+        if connector.get("ddc"):
+            (root / "i2c").mkdir(exist_ok=True)
+            (path / "ddc").symlink_to(root / "i2c")
+    return root
+
+
+def make_sway_output(name, modes=((1920, 1080, 60000),), active=True, position=(0, 0), transform="normal", **fields):
+    """
+    Build an output of sway's GET_OUTPUTS reply.
+
+    Args:
+        name (str): The output name, e.g. "DP-1".
+        modes (tuple): (width, height, refresh in mHz) of every mode, the first one is current if active.
+        active (bool): Whether the output is enabled.
+        position (tuple): The position of the output in the layout.
+        transform (str): The sway transform.
+        **fields: More fields, e.g. make, model and serial.
+    """
+    mode_dicts = [{"width": w, "height": h, "refresh": r} for w, h, r in modes]
+    output = {
+        "name": name,
+        "make": "Unknown",
+        "model": "Unknown",
+        "serial": "Unknown",
+        "active": active,
+        "modes": mode_dicts,
+        "transform": transform,
+        "rect": {"x": position[0], "y": position[1], "width": modes[0][0], "height": modes[0][1]},
+        **fields,
+    }
+    if active:
+        output["current_mode"] = mode_dicts[0]
+    return output
+
+
+class FakeSwayServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    A sway IPC socket answering GET_OUTPUTS with `outputs` and recording RUN_COMMAND payloads.
+
+    Commands containing "bogus" fail, like sway does for unknown commands.
+    """
+
+    daemon_threads = True
+    HEADER = struct.Struct("=6sII")
+
+    def __init__(self, path, outputs):
+        self.outputs = outputs
+        self.commands = []
+        self.connections = 0
+        super().__init__(str(path), self._Handler)
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.01,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def reply(self, message_type, payload):
+        if message_type == 3:
+            return self.outputs
+        self.commands.append(payload)
+        return [
+            {"success": False, "error": "Unknown/invalid command"} if "bogus" in command else {"success": True}
+            for command in payload.split(";")
+        ]
+
+    class _Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            self.server.connections += 1
+            header = FakeSwayServer.HEADER
+            while True:
+                data = self.rfile.read(header.size)
+                if len(data) < header.size:
+                    return
+                _magic, length, message_type = header.unpack(data)
+                payload = self.rfile.read(length).decode()
+                body = json.dumps(self.server.reply(message_type, payload)).encode()
+                self.wfile.write(header.pack(b"i3-ipc", len(body), message_type) + body)
+                self.wfile.flush()
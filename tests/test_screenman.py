@@ -2,13 +2,64 @@
 
 """Tests for `screenman` package."""
 
-from unittest.mock import patch
+import itertools
+import json
+import socket
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
 
 import pytest
 from click.testing import CliRunner
 
-from screenman import cli
-from screenman.screen import Mode, Screen, find_internal_external, apply_mirror
+from screenman import cli, displays, fingerprint, ipc, mirror, timings, watch
+from screenman.cache import EdidCache
+from screenman.config import CompiledConfigCache, Config, get_config
+from screenman.daemon import (
+    CommandServer,
+    Daemon,
+    EventSource,
+    QueueSource,
+    UeventSource,
+    parse_uevent,
+    run_command,
+)
+from screenman.edid import Edid, decode_edids
+from screenman.layouts import LayoutIndex, LayoutPlans, ScreenTarget
+from screenman.screen import (
+    Mode,
+    ModeTable,
+    OutputConfig,
+    Screen,
+    apply_mirror,
+    find_internal_external,
+    apply_layout,
+    connected_screens,
+    determine_layout,
+    get_output_cache,
+    iter_xrandr_outputs,
+    modes_key,
+    parse_xrandr,
+    parse_xrandr_stream,
+    plan_layout,
+    run_configs,
+    score_layouts,
+    snapshot_config,
+)
+from screenman.utils import RotateDirection, ScreenSettings, exec_cmd_stream
+from screenman import randr, sway, sysfs
+from tests.conftest import BENCHMARK_FIXTURES
+from tests.helpers import (
+    make_cta_ext,
+    make_displayid_ext,
+    make_edid,
+    make_sway_output,
+    make_sysfs_tree,
+    make_xrandr_output,
+)
 
 
 def _make_screen(name, modes=None, edid_hex=""):
@@ -151,3 +202,1554 @@ class TestCliMirrorFlags:
         result = runner.invoke(cli.main, ["--help"])
         assert "--mirror" in result.output
         assert "--mirror-off" in result.output
+
+
+class TestEdidDecoder:
+    def test_descriptor_serial_and_name(self):
+        edid = Edid.from_edid_hex(
+            make_edid("DEL", 41146, serial=0x4C4C4C, serial_str="DL51145435704", name="DELL U2415")
+        )
+        assert edid.manufacturer == "DEL"
+        assert edid.model_number == "41146"
+        assert edid.serial == "DL51145435704"
+        assert edid.name == "DELL U2415"
+        assert edid.fallback_uid is None
+
+    def test_numeric_serial_formatted_like_edid_decode(self):
+        edid = Edid.from_edid_hex(make_edid(serial=16843009))
+        assert edid.serial == "16843009 (0x01010101)"
+
+    def test_no_serial_uses_fallback(self, empty_config):
+        empty_config.fallback_uid = {"frametux": {"Manufacturer": "BOE", "Model": "3018"}}
+        edid = Edid.from_edid_hex(make_edid("BOE", 3018))
+        assert edid.serial is None
+        assert edid.fallback_uid == "frametux"
+
+    def test_displayid_extension(self):
+        edid_hex = make_edid(extensions=(make_cta_ext(), make_displayid_ext(serial=1234, name="Panel")))
+        edid = Edid.from_edid_hex(edid_hex)
+        assert edid.serial == "1234 (0x000004d2)"
+        assert edid.name == "Panel"
+
+    def test_invalid_edid(self):
+        assert Edid.from_edid_hex("00" * 64) == Edid()
+        assert Edid.from_edid_hex("ff" * 128) == Edid()
+
+    def test_native_decode_spawns_no_process(self):
+        with patch("screenman.edid.sb.run") as mock_run:
+            Edid.from_edid_hex(make_edid(serial_str="ABC"))
+        mock_run.assert_not_called()
+
+    def test_cross_check_reports_mismatch(self):
+        native = Edid(serial="A", manufacturer="DEL", model_number="1")
+        assert native.cross_check(Edid(serial="A", manufacturer="DEL"))
+        assert not native.cross_check(Edid(serial="B"))
+
+
+class TestEdidCache:
+    def test_hit_skips_edid_decode(self):
+        edid_hex = make_edid(serial_str="ABC")
+        proc = MagicMock(stdout="Manufacturer: DEL\nModel: 41146\nSerial Number: 'ABC'\n")
+        with patch("screenman.edid.sb.run", return_value=proc) as mock_run:
+            first = Edid.from_edid_decode(edid_hex)
+            assert Edid.from_edid_decode(edid_hex) == first
+        mock_run.assert_called_once()
+        assert first.serial == "ABC"
+
+    def test_persisted_across_instances(self, tmp_path):
+        path = tmp_path / "edid.json"
+        cache = EdidCache(path, {})
+        cache.put(b"raw", {"serial": "A"})
+        cache.save()
+        assert EdidCache(path, {}).get(b"raw") == {"serial": "A"}
+
+    def test_lru_eviction(self, tmp_path):
+        cache = EdidCache(tmp_path / "edid.json", {}, max_entries=2)
+        cache.put(b"a", {"serial": "a"})
+        cache.put(b"b", {"serial": "b"})
+        cache.get(b"a")
+        cache.put(b"c", {"serial": "c"})
+        assert cache.get(b"b") is None
+        assert cache.get(b"a") == {"serial": "a"}
+        assert cache.get(b"c") == {"serial": "c"}
+
+    def test_fallback_change_invalidates(self, tmp_path):
+        path = tmp_path / "edid.json"
+        cache = EdidCache(path, {"frametux": {"Manufacturer": "BOE", "Model": "3018"}})
+        cache.put(b"raw", {"fallback_uid": "frametux"})
+        cache.save()
+        assert EdidCache(path, {}).get(b"raw") is None
+
+
+class TestConcurrentDiscovery:
+    OUTPUTS = [
+        {"name": "eDP-1", "primary": True, "edid": make_edid("BOE", 3018, serial_str="INTERNAL")},
+        {"name": "HDMI-1", "connected": False},
+        {"name": "DP-1", "edid": make_edid(serial_str="EXT1")},
+        {"name": "DP-2", "edid": make_edid(serial_str="EXT2")},
+        {"name": "DP-3", "edid": make_edid(serial_str="EXT3")},
+    ]
+
+    def test_decode_edids_preserves_order(self):
+        edids = [bytes.fromhex(make_edid(serial_str=f"S{i}")) for i in range(5)]
+        decoded = decode_edids(edids[:2] + [b""] + edids[2:], parallel=True)
+        assert [e.serial if e else None for e in decoded] == ["S0", "S1", None, "S2", "S3", "S4"]
+
+    def test_parse_xrandr_keeps_xrandr_order(self):
+        with patch("screenman.screen.decode_edids", lambda edids: decode_edids(edids, parallel=True)):
+            screens = parse_xrandr(make_xrandr_output(self.OUTPUTS))
+        assert [s.name for s in screens] == ["eDP-1", "HDMI-1", "DP-1", "DP-2", "DP-3"]
+        assert [s.uid for s in screens] == ["INTERNAL", None, "EXT1", "EXT2", "EXT3"]
+        assert [s.is_connected for s in screens] == [True, False, True, True, True]
+
+
+CONFIG_TOML = """
+[fallback_uid]
+frametux = { Manufacturer = "BOE", Model = "3018" }
+
+[layouts.home.frametux]
+primary = true
+mode = [2256, 1504]
+position = [0, 0]
+"""
+
+
+class TestConfigLoading:
+    @pytest.fixture
+    def config_file(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        path = tmp_path / "screenman.toml"
+        path.write_text(CONFIG_TOML)
+        return path
+
+    def test_import_does_not_load_config(self):
+        code = "import screenman.cli, screenman.config as c; print(c._config)"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        assert result.stdout.strip() == "None"
+
+    def test_load_from_toml(self, config_file):
+        config = Config.load_from_toml()
+        assert config.fallback_uid == {"frametux": {"Manufacturer": "BOE", "Model": "3018"}}
+        settings = config.layouts["home"]["frametux"]
+        assert settings.resolution == (2256, 1504)
+        assert settings.position == ("--pos", "0x0")
+
+    def test_compiled_cache_hit_skips_parsing(self, config_file):
+        first = Config.load_from_toml()
+        with patch.object(Config, "from_toml") as mock_parse:
+            assert Config.load_from_toml() == first
+        mock_parse.assert_not_called()
+
+    def test_layout_plans_compiled_and_cached(self, config_file):
+        Config.load_from_toml()
+        with patch("screenman.config.LayoutPlans") as mock_plans:
+            config = Config.load_from_toml()
+            assert config.layout_plans.get("home") == {
+                "frametux": ScreenTarget(True, (2256, 1504), None, True, RotateDirection.Normal, ("--pos", "0x0"))
+            }
+        mock_plans.assert_not_called()
+
+    def test_compiled_cache_invalidated_on_change(self, config_file):
+        Config.load_from_toml()
+        config_file.write_text(CONFIG_TOML + "\n[layouts.office.X]\nprimary = true\n")
+        assert "office" in Config.load_from_toml().layouts
+
+    def test_rate(self, config_file, capsys):
+        config_file.write_text(CONFIG_TOML + '\n[layouts.desk.A]\nrate = 144\n[layouts.desk.B]\nrate = "max"\n')
+        config = Config.load_from_toml()
+        assert config.layouts["desk"]["A"].rate == 144.0 and config.layouts["desk"]["B"].rate == "max"
+        assert config.layouts["home"]["frametux"].rate is None
+
+    @pytest.mark.parametrize("rate", ['"fast"', "0", "true"])
+    def test_invalid_rate(self, config_file, capsys, rate):
+        config_file.write_text(CONFIG_TOML + f"\n[layouts.desk.A]\nrate = {rate}\n")
+        with pytest.raises(ValueError, match="layouts.desk.A.rate"):
+            Config.from_toml(config_file)
+        # The invalid file is skipped
+        assert Config.load_from_toml() == Config()
+        assert "rate must be a positive number" in capsys.readouterr().out
+
+    def test_compiled_cache_keyed_by_path(self, config_file, tmp_path):
+        cache = CompiledConfigCache(tmp_path / "config.pickle")
+        cache.put(config_file, config_file.stat(), Config(fallback_uid={"a": {}}))
+        assert cache.get(config_file, config_file.stat()) == Config(fallback_uid={"a": {}})
+        other = tmp_path / "other.toml"
+        other.write_text(CONFIG_TOML)
+        assert cache.get(other, config_file.stat()) is None
+
+
+# Cumulative import time of screenman.cli in microseconds, as reported by -X importtime
+IMPORT_TIME_BUDGET_US = 100_000
+
+
+def _import_time_us(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in result.stderr.splitlines():
+        _, _, cumulative, name = (part.strip() for part in line.replace(":", "|", 1).split("|"))
+        if name == module:
+            return int(cumulative)
+    raise AssertionError(f"{module} not found in -X importtime output")
+
+
+class TestColdStart:
+    def test_import_time_budget(self):
+        # Best of three to keep the test robust against a busy machine
+        best = min(_import_time_us("screenman.cli") for _ in range(3))
+        assert best < IMPORT_TIME_BUDGET_US, f"import screenman.cli took {best} us"
+
+    def test_heavy_modules_deferred(self):
+        code = (
+            "import sys, screenman, screenman.cli; "
+            "print(' '.join(m for m in ('loguru', 'importlib.metadata', 'platformdirs', "
+            "'tomllib', 'screenman.screen', 'screenman.config') if m in sys.modules))"
+        )
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        assert result.stdout.strip() == ""
+
+    def test_version_is_lazy(self):
+        runner = CliRunner()
+        result = runner.invoke(cli.main, ["--version"])
+        assert result.exit_code == 0
+        assert result.output.startswith("screenman, version ")
+
+
+class TestXrandrParser:
+    def test_accepts_generator(self):
+        edid = make_edid(serial_str="GEN")
+        lines = make_xrandr_output([{"name": "DP-1", "edid": edid}, {"name": "DP-2", "connected": False}])
+        outputs = list(iter_xrandr_outputs(line + "\n" for line in lines))
+        assert [o.header.split()[0] for o in outputs] == ["DP-1", "DP-2"]
+        assert outputs[0].edid == bytes.fromhex(edid)
+        assert outputs[1].edid == b""
+
+    def test_modes(self):
+        modes = [(2560, 1440, [144.0, 60.0]), (1920, 1080, [60.0])]
+        lines = make_xrandr_output([{"name": "DP-1", "modes": modes, "preferred": (2560, 1440, 60.0)}])
+        (screen,) = parse_xrandr(lines)
+        assert [(m.width, m.height, m.freq, m.current, m.preferred) for m in screen.supported_modes] == [
+            (2560, 1440, 144.0, True, False),
+            (2560, 1440, 60.0, False, True),
+            (1920, 1080, 60.0, False, False),
+        ]
+        assert screen.supported_modes.rates((2560, 1440)) == [144.0, 60.0]
+        assert screen.preferred_resolution() == (2560, 1440)
+        assert screen.resolution == (2560, 1440)
+
+    def test_primary_and_rotation(self):
+        lines = make_xrandr_output(
+            [
+                {"name": "eDP-1", "primary": True, "rotation": "left"},
+                {"name": "DP-1", "current": None},
+            ]
+        )
+        edp, dp = parse_xrandr(lines)
+        assert edp.is_primary and edp.rotation == RotateDirection.Left
+        assert not dp.is_primary and not dp.is_enabled and dp.rotation is None
+
+
+class TestStreamingDiscovery:
+    def test_exec_cmd_stream(self):
+        cmd = [sys.executable, "-c", "print('a'); print('b')"]
+        assert list(exec_cmd_stream(cmd)) == ["a", "b"]
+
+    def test_exec_cmd_stream_failure(self):
+        cmd = [sys.executable, "-c", "print('a'); raise SystemExit(3)"]
+        with pytest.raises(subprocess.CalledProcessError):
+            list(exec_cmd_stream(cmd))
+
+    def test_edid_decoded_before_xrandr_finishes(self):
+        lines = make_xrandr_output(
+            [
+                {"name": "DP-1", "edid": make_edid(serial_str="FIRST")},
+                {"name": "DP-2", "edid": make_edid(serial_str="SECOND")},
+            ]
+        )
+        consumed = []
+
+        def stream():
+            for line in lines:
+                consumed.append(line)
+                yield line
+
+        decoded_at = {}
+        original = Edid.from_raw
+
+        def from_raw(edid_bytes):
+            edid = original(edid_bytes)
+            decoded_at[edid.serial] = len(consumed)
+            return edid
+
+        with patch.object(Edid, "from_raw", from_raw):
+            screens = parse_xrandr_stream(stream())
+        assert [s.uid for s in screens] == ["FIRST", "SECOND"]
+        second_header = next(i for i, line in enumerate(lines) if line.startswith("DP-2"))
+        assert decoded_at["FIRST"] <= second_header
+
+
+class TestSysfsBackend:
+    CONNECTORS = {
+        "card0-eDP-1": {
+            "status": "connected",
+            "enabled": "enabled",
+            "edid": make_edid("BOE", 3018, serial_str="PANEL"),
+            "modes": ["2256x1504", "2256x1504", "1920x1200"],
+        },
+        "card0-HDMI-A-1": {"status": "disconnected"},
+        "card0-DP-2": {
+            "status": "connected",
+            "edid": make_edid(serial_str="DL51145435704"),
+            "modes": ["1920x1080", "1280x720", "720x400"],
+        },
+    }
+
+    def test_connected_screens(self, tmp_path):
+        root = make_sysfs_tree(tmp_path / "drm", self.CONNECTORS)
+        edp, dp = sysfs.connected_screens(root)
+        assert (edp.name, edp.uid, edp.is_enabled, edp.resolution) == ("eDP-1", "PANEL", True, (2256, 1504))
+        assert [m.resolution() for m in edp.supported_modes] == [(2256, 1504), (1920, 1200)]
+        assert (dp.name, dp.uid, dp.is_enabled) == ("DP-2", "DL51145435704", False)
+        assert dp.supported_modes[0].preferred
+
+    def test_layout_applied_with_randr_names(self, tmp_path, empty_config):
+        from screenman.utils import ScreenSettings
+
+        root = make_sysfs_tree(tmp_path / "drm", self.CONNECTORS)
+        empty_config.layouts = {"desk": {"DL51145435704": ScreenSettings(resolution=(1920, 1080), is_primary=True)}}
+        screens = sysfs.connected_screens(root)
+        assert determine_layout(screens) == "desk"
+        with patch("screenman.screen.exec_cmd") as mock_exec:
+            apply_layout(screens, "desk")
+        mock_exec.assert_called_once()
+        cmd = mock_exec.call_args[0][0]
+        assert cmd[:3] == ["xrandr", "--output", "eDP-1"] and "--off" in cmd
+        assert cmd[cmd.index("DP-2") :][:3] == ["DP-2", "--mode", "1920x1080"] and "--primary" in cmd
+
+    def test_unknown_state_reset(self, tmp_path, empty_config):
+        from screenman.utils import ScreenSettings
+
+        # As left by --mirror: both enabled, sysfs shows neither the scale nor the mirror
+        connectors = {name: {**c, "enabled": "enabled"} for name, c in self.CONNECTORS.items()}
+        root = make_sysfs_tree(tmp_path / "drm", connectors)
+        empty_config.layouts = {
+            "desk": {
+                "PANEL": ScreenSettings(resolution=(2256, 1504), position=("--pos", "0x0")),
+                "DL51145435704": ScreenSettings(resolution=(1920, 1080), position=("--pos", "2256x0")),
+            }
+        }
+        screens = sysfs.connected_screens(root)
+        assert not any(s.state_known for s in screens)
+        with patch("screenman.screen.exec_cmd", return_value=[]) as mock_exec:
+            apply_layout(screens, "desk")
+        reset, apply = (c[0][0] for c in mock_exec.call_args_list)
+        assert reset == [
+            *("xrandr", "--output", "eDP-1", "--auto", "--scale", "1x1"),
+            *("--output", "DP-2", "--auto", "--scale", "1x1"),
+        ]
+        assert apply == [
+            *("xrandr", "--output", "eDP-1", "--mode", "2256x1504", "--pos", "0x0"),
+            *("--output", "DP-2", "--mode", "1920x1080", "--pos", "2256x0"),
+        ]
+
+    def test_randr_output_names(self):
+        assert sysfs.randr_output_name("HDMI-A", 1) == "HDMI-1"
+        assert sysfs.randr_output_name("eDP", 1, "i915") == "eDP-1"
+        assert sysfs.randr_output_name("DP", 2, "i915", gpu=1) == "DP-1-2"
+        assert sysfs.randr_output_name("HDMI-A", 1, "amdgpu") == "HDMI-A-0"
+
+    def test_mst_connector_probed_with_xrandr(self, tmp_path):
+        connectors = {
+            "card0-eDP-1": {"status": "connected", "ddc": True},
+            "card0-DP-1": {"status": "disconnected", "ddc": True},
+            # An output of a dock, X names it DP-1-1 after its MST path
+            "card0-DP-7": {"status": "connected", "edid": make_edid(serial_str="DOCK")},
+        }
+        root = make_sysfs_tree(tmp_path / "drm", connectors)
+        assert sysfs.mst_connectors(root) == {"card0-DP-7"}
+        with pytest.raises(sysfs.UnsupportedConnector):
+            sysfs.connected_screens(root)
+        with patch("screenman.sysfs.DRM_ROOT", root), patch("screenman.screen.probe_xrandr") as mock_probe:
+            assert connected_screens(backend="sysfs") is mock_probe.return_value
+
+        # Without DDC links the MST connectors cannot be told apart
+        connectors = {name: {**c, "ddc": False} for name, c in connectors.items()}
+        root = make_sysfs_tree(tmp_path / "old-kernel", connectors)
+        assert sysfs.mst_connectors(root) == set()
+        (root / "card0-DP-7" / "path").write_text("mst:95-1\n")
+        assert sysfs.mst_connectors(root) == {"card0-DP-7"}
+
+    def test_connector_status(self, tmp_path):
+        root = make_sysfs_tree(tmp_path / "drm", self.CONNECTORS)
+        assert sysfs.connector_status(root) == {
+            "card0-eDP-1": "connected",
+            "card0-HDMI-A-1": "disconnected",
+            "card0-DP-2": "connected",
+        }
+
+    def test_wait_for_connectors(self):
+        before, docked = {"card0-eDP-1": "connected"}, {"card0-eDP-1": "connected", "card1-DP-1": "connected"}
+        # The dock's card shows up with its connector disconnected, which is probed a poll later
+        polls = itertools.chain([{**before, "card1-DP-1": "disconnected"}], itertools.repeat(docked))
+        with patch("screenman.sysfs.connector_status", side_effect=polls) as mock_status:
+            assert sysfs.wait_for_connectors(before, quiet=0.05) == docked
+        assert mock_status.call_count >= 3
+
+    def test_wait_for_connectors_deadline(self):
+        polls = ({"card0-DP-1": str(n)} for n in itertools.count())
+        with patch("screenman.sysfs.connector_status", side_effect=polls), patch("screenman.sysfs.logger") as mock_log:
+            assert sysfs.wait_for_connectors({}, quiet=0.05, deadline=0.1)
+        assert "still changing" in mock_log.warning.call_args[0][0]
+
+    def test_rescan_and_settle(self, tmp_path):
+        root = make_sysfs_tree(tmp_path / "drm", self.CONNECTORS)
+        with patch("screenman.sysfs.rescan_pci", return_value=False), patch(
+            "screenman.sysfs.wait_for_connectors"
+        ) as mock_wait:
+            assert sysfs.rescan_and_settle(root) == sysfs.connector_status(root)
+        mock_wait.assert_not_called()
+        with patch("screenman.sysfs.rescan_pci", return_value=True), patch(
+            "screenman.sysfs.wait_for_connectors", return_value={}
+        ) as mock_wait:
+            assert sysfs.rescan_and_settle(root) == {}
+        mock_wait.assert_called_once_with(sysfs.connector_status(root), root)
+
+    def test_rescan_before_discovery(self, empty_config):
+        calls = MagicMock()
+        with patch("screenman.daemon.rescan_and_settle", calls.rescan), patch(
+            "screenman.daemon.connected_screens", calls.discover
+        ):
+            calls.discover.return_value = []
+            run_command("apply", rescan_pci=True)
+        assert [c[0] for c in calls.mock_calls] == ["rescan", "discover"]
+
+    def test_backend_selection(self, tmp_path):
+        root = make_sysfs_tree(tmp_path / "drm", self.CONNECTORS)
+        with patch("screenman.sysfs.DRM_ROOT", root), patch("screenman.screen.exec_cmd_stream") as mock_xrandr:
+            screens = connected_screens(backend="sysfs")
+        mock_xrandr.assert_not_called()
+        assert [s.name for s in screens] == ["eDP-1", "DP-2"]
+
+
+def _mode_info(mode_id, width, height, rate=60):
+    h_total, v_total = width + 160, height + 40
+    return SimpleNamespace(
+        id=mode_id,
+        width=width,
+        height=height,
+        dot_clock=round(rate * h_total * v_total),
+        h_total=h_total,
+        v_total=v_total,
+        flags=0,
+    )
+
+
+def _fake_randr_connection():
+    """A RandrConnection with eDP-1 on CRTC 10 and HDMI-1 connected but disabled."""
+    conn = object.__new__(randr.RandrConnection)
+    conn.modes = {1: _mode_info(1, 1920, 1080), 2: _mode_info(2, 2560, 1440), 3: _mode_info(3, 1280, 720)}
+    conn.outputs = {
+        "eDP-1": randr.OutputState(100, "eDP-1", True, 10, [10, 11], [1, 3], 1),
+        "HDMI-1": randr.OutputState(101, "HDMI-1", True, 0, [10, 11], [2, 1], 1),
+    }
+    conn.crtcs = {10: randr.CrtcState(0, 0, 1, 1, [100], 1920, 1080), 11: randr.CrtcState()}
+    return conn
+
+
+class TestRandrBackend:
+    def test_build_config_matches_build_cmd(self):
+        s = _make_screen("eDP-1", [Mode(1920, 1080, 60.0, True, True), Mode(1280, 720, 60.0, False, False)])
+        s.resolution = (1280, 720)
+        s.is_primary = True
+        s.rotation = RotateDirection.Left
+        s.position = ("--pos", "10x0")
+        s.scale = (1.5, 1.5)
+        config = s.build_config()
+        assert config == OutputConfig(
+            "eDP-1", True, (1280, 720), True, RotateDirection.Left, ("--pos", "10x0"), (1.5, 1.5)
+        )
+        assert s.build_cmd() == ["xrandr", *config.to_args()]
+        assert _make_screen("DP-1").build_config() is None
+
+    def test_refresh_rate(self):
+        assert randr.refresh_rate(_mode_info(1, 1920, 1080, 144)) == 144.0
+
+    def test_plan(self):
+        conn = _fake_randr_connection()
+        changes, primary = conn.plan(
+            [
+                OutputConfig("eDP-1", resolution=(1280, 720), position=("--pos", "0x0")),
+                OutputConfig("HDMI-1", primary=True, position=("--pos", "1280x0"), rotation=RotateDirection.Left),
+            ]
+        )
+        assert changes == {
+            10: randr.CrtcState(0, 0, 3, 1, [100]),
+            11: randr.CrtcState(1280, 0, 2, 2, [101]),
+        }
+        assert primary == 101
+        # HDMI-1 is rotated left, so 2560x1440 takes 1440x2560
+        assert conn.screen_size(changes) == (1280 + 1440, 2560)
+
+    def test_plan_disable_and_same_as(self):
+        conn = _fake_randr_connection()
+        changes, _ = conn.plan(
+            [OutputConfig("eDP-1", enabled=False), OutputConfig("HDMI-1", same_as="eDP-1")]
+        )
+        assert changes[10] == randr.CrtcState()
+        assert changes[11].mode == 2 and (changes[11].x, changes[11].y) == (0, 0)
+
+    def test_plan_skips_unchanged_crtcs(self):
+        conn = _fake_randr_connection()
+        changes, primary = conn.plan(
+            [OutputConfig("eDP-1", primary=True, position=("--pos", "0x0")), OutputConfig("HDMI-1", enabled=False)]
+        )
+        assert changes == {} and primary == 100
+
+    @staticmethod
+    def _apply(configs):
+        """Apply through the fake connection, on a 1920x1080 screen, and return the requests."""
+        conn = _fake_randr_connection()
+        conn.config_timestamp = 0
+        conn.display = MagicMock()
+        conn.display.screen.return_value = SimpleNamespace(
+            width_in_pixels=1920, height_in_pixels=1080, width_in_mms=520, height_in_mms=290
+        )
+        conn.display.xrandr_set_crtc_config.return_value = SimpleNamespace(status=randr.RR_SET_CONFIG_SUCCESS)
+        conn.root = MagicMock()
+        conn.root.get_geometry.return_value = SimpleNamespace(width=1920, height=1080)
+        with patch.object(conn, "refresh"), patch.object(conn, "_has_transform", return_value=False):
+            conn.apply(configs)
+        crtcs = [(c.args[0], c.args[4]) for c in conn.display.xrandr_set_crtc_config.call_args_list]
+        return crtcs, conn.root
+
+    def test_apply_primary_only(self):
+        crtcs, root = self._apply([OutputConfig("eDP-1", primary=True)])
+        assert crtcs == []
+        root.xrandr_set_screen_size.assert_not_called()
+        root.xrandr_set_output_primary.assert_called_once_with(100)
+
+    def test_apply_keeps_unchanged_crtcs_on(self):
+        crtcs, root = self._apply([OutputConfig("HDMI-1", position=("--pos", "1920x0"))])
+        # (CRTC, mode): eDP-1 on CRTC 10 is not touched
+        assert crtcs == [(11, 2)]
+        root.xrandr_set_screen_size.assert_called_once()
+        assert root.xrandr_set_screen_size.call_args.args[:2] == (1920 + 2560, 1440)
+
+    def test_apply_turns_off_crtcs_exceeding_smaller_screen(self):
+        crtcs, root = self._apply([OutputConfig("eDP-1", resolution=(1280, 720))])
+        assert crtcs == [(10, 0), (10, 3)]
+        assert root.xrandr_set_screen_size.call_args.args[:2] == (1280, 720)
+
+    def test_scale_unsupported(self):
+        conn = _fake_randr_connection()
+        with pytest.raises(randr.UnsupportedConfig):
+            conn.plan([OutputConfig("eDP-1", scale=(2.0, 2.0))])
+
+    def test_unsupported_falls_back_to_xrandr(self):
+        with patch("screenman.randr.apply_configs", side_effect=randr.UnsupportedConfig("scaling")), patch(
+            "screenman.screen.exec_cmd"
+        ) as mock_exec:
+            run_configs([OutputConfig("eDP-1", scale=(2.0, 2.0))], backend="randr")
+        mock_exec.assert_called_once_with(["xrandr", "--output", "eDP-1", "--auto", "--scale", "2.0x2.0"])
+
+    def test_against_xvfb(self, xvfb_display):
+        pytest.importorskip("Xlib")
+        screens = randr.connected_screens(xvfb_display)
+        assert screens and all(s.supported_modes for s in screens)
+        current = screens[0]
+        randr.apply_configs([OutputConfig(current.name, resolution=current.resolution)], xvfb_display)
+        assert randr.connected_screens(xvfb_display)[0].resolution == current.resolution
+
+
+def _brute_force_layout(layouts, uids):
+    """The matching rule of determine_layout, without an index."""
+    for name, layout in sorted(layouts.items(), key=lambda x: len(x[1]), reverse=True):
+        if all(uid in uids for uid in layout):
+            return name
+    return None
+
+
+class TestLayoutIndex:
+    LAYOUTS = {
+        "laptop": {"panel": None},
+        "office": {"panel": None, "left": None, "right": None},
+        "desk_a": {"panel": None, "left": None},
+        "desk_b": {"panel": None, "right": None},
+        "desk_a_copy": {"left": None, "panel": None},
+    }
+
+    def test_largest_layout_wins(self):
+        assert LayoutIndex(self.LAYOUTS).match({"panel", "left", "right", None}) == "office"
+
+    def test_ties_go_to_first_declared(self):
+        index = LayoutIndex(self.LAYOUTS)
+        assert index.match({"panel", "left"}) == "desk_a"
+        assert index.match({"panel", "left", "extra"}) == "desk_a"
+
+    def test_no_match(self):
+        assert LayoutIndex(self.LAYOUTS).match({"left"}) is None
+        assert LayoutIndex({"empty": {}}).match({"left"}) == "empty"
+
+    def test_matches_brute_force(self):
+        import random
+
+        rng = random.Random(0)
+        uids = [f"uid{i}" for i in range(12)]
+        layouts = {
+            f"layout{i}": {uid: None for uid in rng.sample(uids, rng.randint(1, 4))} for i in range(300)
+        }
+        index = LayoutIndex(layouts)
+        for _ in range(200):
+            connected = set(rng.sample(uids, rng.randint(0, 6)))
+            assert index.match(connected) == _brute_force_layout(layouts, connected)
+
+    def test_scores_explain_choice(self, empty_config):
+        empty_config.layouts = self.LAYOUTS
+        screens = [_make_screen("eDP-1"), _make_screen("DP-1")]
+        screens[0].uid, screens[1].uid = "panel", "left"
+        assert determine_layout(screens) == "desk_a"
+        scores = score_layouts(screens)
+        assert [s.name for s in scores] == ["office", "desk_a", "desk_b", "desk_a_copy", "laptop"]
+        chosen = next(s for s in scores if s.matches)
+        assert chosen.name == "desk_a"
+        assert "declared at position 2" in chosen.reason()
+        assert scores[0].missing == ("right",)
+
+    def test_index_rebuilt_when_layouts_replaced(self, empty_config):
+        empty_config.layouts = {"a": {"x": None}}
+        assert empty_config.layout_index.match({"x"}) == "a"
+        empty_config.layouts = {"b": {"x": None}}
+        assert empty_config.layout_index.match({"x"}) == "b"
+
+
+class TestLayoutPlans:
+    def test_from_settings(self):
+        assert ScreenTarget.from_settings(ScreenSettings()) == ScreenTarget()
+        target = ScreenTarget.from_settings(
+            ScreenSettings(resolution=[1920, 1080], is_enabled=False, position=["--pos", "0x0"], rate="max")
+        )
+        assert target == ScreenTarget(False, (1920, 1080), "max", position=("--pos", "0x0"))
+
+    def test_rebuilt_when_layouts_replaced(self, empty_config):
+        empty_config.layouts = {"a": {"x": ScreenSettings(is_primary=True)}}
+        assert empty_config.layout_plans.get("a") == {"x": ScreenTarget(primary=True)}
+        empty_config.layouts = {"b": {"x": ScreenSettings()}}
+        assert empty_config.layout_plans.get("a") == {}
+        assert isinstance(empty_config.layout_plans, LayoutPlans)
+
+
+class TestMinimalApply:
+    @staticmethod
+    def _screens(*outputs):
+        return parse_xrandr(make_xrandr_output(list(outputs)))
+
+    def _apply(self, screens, layout):
+        config = Config(layouts={"desk": layout})
+        with patch("screenman.screen.get_config", return_value=config), patch("screenman.screen.exec_cmd") as mock_exec:
+            apply_layout(screens, "desk")
+        return [c[0][0] for c in mock_exec.call_args_list]
+
+    def test_current_state_parsed(self):
+        edp, dp = self._screens(
+            {"name": "eDP-1", "primary": True, "edid": make_edid(serial_str="A")},
+            {"name": "DP-1", "position": (1920, 0), "rotation": "left", "edid": make_edid(serial_str="B")},
+        )
+        assert edp.position == ("--pos", "0x0") and dp.position == ("--pos", "1920x0")
+        assert edp.scale is None and dp.scale is None
+        assert edp.build_cmd() is None and dp.build_cmd() is None
+
+    def test_active_layout_runs_nothing(self):
+        edp, dp = self._screens(
+            {"name": "eDP-1", "primary": True, "edid": make_edid(serial_str="A")},
+            {"name": "DP-1", "position": (1920, 0), "edid": make_edid(serial_str="B")},
+        )
+        layout = {
+            edp.uid: ScreenSettings(resolution=(1920, 1080), is_primary=True, position=("--pos", "0x0")),
+            dp.uid: ScreenSettings(resolution=(1920, 1080), position=("--pos", "1920x0")),
+        }
+        assert self._apply([edp, dp], layout) == []
+
+    def test_only_changed_settings_emitted(self):
+        edp, dp = self._screens(
+            {"name": "eDP-1", "primary": True, "edid": make_edid(serial_str="A")},
+            {"name": "DP-1", "position": (1920, 0), "edid": make_edid(serial_str="B")},
+        )
+        layout = {
+            edp.uid: ScreenSettings(resolution=(1920, 1080), is_primary=True, position=("--pos", "0x0")),
+            dp.uid: ScreenSettings(resolution=(1920, 1080), position=("--pos", "0x1080")),
+        }
+        assert self._apply([edp, dp], layout) == [["xrandr", "--output", "DP-1", "--pos", "0x1080"]]
+
+    def test_scaled_output_reset_first(self):
+        lines = make_xrandr_output([{"name": "DP-1", "edid": make_edid(serial_str="B")}])
+        lines[1] = lines[1].replace("1920x1080+0+0", "3840x2160+0+0")
+        (dp,) = parse_xrandr(lines)
+        assert dp.scale == (2.0, 2.0)
+        calls = self._apply([dp], {dp.uid: ScreenSettings(resolution=(1920, 1080))})
+        assert calls == [["xrandr", "--output", "DP-1", "--auto", "--scale", "1x1"]]
+
+    def test_mirror_detected_and_turned_off(self):
+        edp, dp = self._screens(
+            {"name": "eDP-1", "edid": make_edid(serial_str="A")},
+            {"name": "DP-1", "edid": make_edid(serial_str="B")},
+        )
+        assert edp.same_as is None and dp.same_as == "eDP-1"
+        layout = {edp.uid: ScreenSettings(resolution=(1920, 1080)), dp.uid: ScreenSettings(is_enabled=False)}
+        assert self._apply([edp, dp], layout) == [["xrandr", "--output", "DP-1", "--off"]]
+
+    def test_active_mirror_layout_runs_nothing(self):
+        edp, dp = self._screens(
+            {"name": "eDP-1", "primary": True, "edid": make_edid(serial_str="A")},
+            {"name": "DP-1", "edid": make_edid(serial_str="B")},
+        )
+        assert dp.same_as == "eDP-1"
+        layout = {
+            edp.uid: ScreenSettings(resolution=(1920, 1080), is_primary=True, position=("--pos", "0x0")),
+            dp.uid: ScreenSettings(resolution=(1920, 1080), position=("--pos", "0x0")),
+        }
+        with patch("screenman.screen.get_config", return_value=Config(layouts={"desk": layout})):
+            assert plan_layout([edp, dp], "desk") == ([], [])
+
+
+class TestDaemon:
+    @staticmethod
+    def _run(source, **kwargs):
+        daemon = Daemon(source, debounce=0.05, **kwargs)
+        with patch("screenman.daemon.connected_screens", return_value=[]) as mock_discover, patch(
+            "screenman.daemon.apply_layout"
+        ) as mock_apply:
+            daemon.run()
+        return daemon, mock_discover, mock_apply
+
+    def test_parse_uevent(self):
+        data = b"change@/devices/pci0000:00/0000:00:02.0/drm/card0\0ACTION=change\0SUBSYSTEM=drm\0HOTPLUG=1\0"
+        assert parse_uevent(data) == {"ACTION": "change", "SUBSYSTEM": "drm", "HOTPLUG": "1"}
+        assert parse_uevent(b"libudev\0\xfe\xed") == {}
+
+    def test_only_hotplug_uevents(self):
+        source = object.__new__(UeventSource)
+        source.subsystem = "drm"
+        source.sock, kernel = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        with source.sock, kernel:
+            for fields in (
+                b"ACTION=change\0SUBSYSTEM=drm\0LEASE=1\0",
+                b"ACTION=change\0SUBSYSTEM=drm\0HOTPLUG=1\0CONNECTOR=95\0PROPERTY=96\0",
+                b"ACTION=change\0SUBSYSTEM=drm\0ERROR=1\0",
+                b"ACTION=change\0SUBSYSTEM=drm\0HOTPLUG=1\0CONNECTOR=95\0",
+                b"ACTION=change\0SUBSYSTEM=drm\0HOTPLUG=1\0",
+            ):
+                kernel.send(b"change@/devices/pci0000:00/0000:00:02.0/drm/card0\0" + fields)
+            assert source.wait(1) == {"ACTION": "change", "SUBSYSTEM": "drm", "HOTPLUG": "1", "CONNECTOR": "95"}
+            assert source.wait(1) == {"ACTION": "change", "SUBSYSTEM": "drm", "HOTPLUG": "1"}
+            assert source.wait(0.05) is None
+
+    def test_burst_applied_once(self):
+        source = QueueSource()
+        for _ in range(5):
+            source.push()
+        source.close()
+        daemon, mock_discover, mock_apply = self._run(source)
+        # Once at start-up, once for the burst
+        assert mock_discover.call_count == 2
+        mock_apply.assert_called_with([], "auto", backend="xrandr")
+        assert daemon.layout_name == "auto"
+
+    def test_separate_bursts(self):
+        source = QueueSource()
+
+        def feed():
+            for _ in range(2):
+                time.sleep(0.1)
+                source.push()
+                source.push()
+            time.sleep(0.1)
+            source.close()
+
+        thread = threading.Thread(target=feed)
+        thread.start()
+        _, mock_discover, _ = self._run(source)
+        thread.join()
+        assert mock_discover.call_count == 3
+
+    def test_failed_apply_keeps_running(self):
+        source = QueueSource()
+        source.push()
+        source.close()
+        with patch("screenman.daemon.connected_screens", side_effect=[[], RuntimeError("gone")]):
+            with patch("screenman.daemon.apply_layout"):
+                Daemon(source, debounce=0.01).run()
+
+    def test_failed_start_up_keeps_serving(self, runtime_dir):
+        source = QueueSource()
+        source.push()
+        source.close()
+        with patch("screenman.daemon.connected_screens", side_effect=[RuntimeError("gone"), []]) as mock_discover:
+            with patch("screenman.daemon.apply_layout"):
+                daemon = Daemon(source, debounce=0.01, server_path=ipc.socket_path())
+                daemon.run()
+        assert daemon.ready.is_set() and mock_discover.call_count == 2
+
+    def test_event_source_is_abstract(self):
+        with pytest.raises(TypeError):
+            EventSource()
+
+    def test_edids_decoded_once(self, monkeypatch):
+        monkeypatch.setattr(Edid, "MEMO", {})
+        raw = bytes.fromhex(make_edid(serial_str="MEMO"))
+        with patch.object(Edid, "from_edid_bytes", wraps=Edid.from_edid_bytes) as mock_decode:
+            first, second = Edid.from_raw(raw), Edid.from_raw(raw)
+        assert mock_decode.call_count == 1
+        assert first == second and first is not second
+
+    def test_cli_daemon(self, runtime_dir):
+        with patch("screenman.daemon.UeventSource") as mock_source, patch("screenman.daemon.Daemon") as mock_daemon:
+            result = CliRunner().invoke(cli.main, ["--backend", "sysfs", "daemon", "--debounce", "1"])
+        assert result.exit_code == 0, result.output
+        mock_daemon.assert_called_once_with(
+            mock_source.return_value,
+            backend="sysfs",
+            debounce=1.0,
+            server_path=runtime_dir / "screenman.sock",
+            watch_config=True,
+        )
+
+
+class TestDaemonSocket:
+    @pytest.fixture
+    def running_daemon(self, runtime_dir, monkeypatch):
+        monkeypatch.setattr(CommandServer, "POLL_INTERVAL", 0.01)
+        source = QueueSource()
+        daemon = Daemon(source, server_path=ipc.socket_path())
+        with patch("screenman.daemon.connected_screens", return_value=[]) as mock_discover, patch(
+            "screenman.daemon.apply_layout"
+        ), patch("screenman.daemon.apply_mirror", return_value=([], [])) as mock_mirror:
+            thread = threading.Thread(target=daemon.run)
+            thread.start()
+            assert daemon.ready.wait(5)
+            yield SimpleNamespace(daemon=daemon, discover=mock_discover, mirror=mock_mirror)
+            source.close()
+            thread.join()
+
+    def test_no_daemon(self):
+        assert ipc.call("apply") is None
+
+    @pytest.fixture
+    def hung_daemon(self, runtime_dir):
+        """A socket that accepts connections but never answers."""
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(str(ipc.socket_path()))
+        server.listen()
+        yield server
+        server.close()
+
+    def test_hung_daemon(self, hung_daemon):
+        with patch("loguru.logger.warning") as mock_warning:
+            assert ipc.call("apply", timeout=0.05) is None
+        assert "Cannot reach the screenman daemon" in mock_warning.call_args[0][0]
+
+    def test_socket_of_another_user(self):
+        with patch("screenman.ipc.socket.socket") as mock_socket:
+            mock_socket.return_value.connect.side_effect = PermissionError(13, "Permission denied")
+            assert ipc.call("apply") is None
+
+    def test_cli_runs_in_process_when_daemon_hangs(self, hung_daemon):
+        call = ipc.call
+        with patch("screenman.ipc.call", lambda *args, **kwargs: call(*args, timeout=0.05, **kwargs)), patch(
+            "screenman.daemon.run_command", return_value=""
+        ) as mock_run:
+            result = CliRunner().invoke(cli.main, ["--force"])
+        assert result.exit_code == 0, result.output
+        mock_run.assert_called_once()
+
+    def test_commands(self, running_daemon):
+        assert ipc.call("print-info") == {"ok": True, "output": "Layout: auto"}
+        assert ipc.call("mirror") == {"ok": True, "output": ""}
+        running_daemon.mirror.assert_called_once_with([], backend="xrandr")
+        response = ipc.call("rotate")
+        assert not response["ok"] and "Unknown command" in response["error"]
+
+    def test_socket_removed_on_exit(self, running_daemon):
+        running_daemon.daemon.source.close()
+        for _ in range(100):
+            if not ipc.socket_path().exists():
+                break
+            time.sleep(0.01)
+        assert not ipc.socket_path().exists()
+
+    def test_second_daemon_refused(self, running_daemon):
+        with pytest.raises(RuntimeError, match="already listening"):
+            CommandServer(ipc.socket_path(), running_daemon.daemon)
+
+    def test_stale_socket_replaced(self, runtime_dir):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(str(ipc.socket_path()))
+        stale.close()
+        assert ipc.call("apply") is None
+        server = CommandServer(ipc.socket_path(), Daemon(QueueSource()))
+        server.server_close()
+        assert not ipc.socket_path().exists()
+
+    def test_cli_forwards_to_daemon(self, running_daemon):
+        with patch("screenman.daemon.run_command", wraps=run_command) as mock_run:
+            result = CliRunner().invoke(cli.main, ["--print-info"])
+        assert result.exit_code == 0, result.output
+        assert result.output == "Layout: auto\n"
+        # Run once, by the daemon's thread
+        assert mock_run.call_count == 1
+        assert running_daemon.discover.call_count == 2
+
+    def test_cli_no_daemon_flag(self, running_daemon):
+        with patch("screenman.ipc.call") as mock_call, patch("screenman.daemon.run_command", return_value="") as mock_run:
+            result = CliRunner().invoke(cli.main, ["--no-daemon"])
+        assert result.exit_code == 0, result.output
+        mock_call.assert_not_called()
+        mock_run.assert_called_once_with("apply", backend="xrandr", rescan_pci=False, probe="full")
+
+
+class TestFingerprint:
+    CONNECTORS = {
+        "card0-eDP-1": {"status": "connected", "edid": make_edid(serial_str="PANEL")},
+        "card0-DP-1": {"status": "disconnected"},
+    }
+
+    @pytest.fixture
+    def drm(self, tmp_path):
+        return make_sysfs_tree(tmp_path / "drm", self.CONNECTORS)
+
+    @pytest.fixture
+    def saved(self, drm, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        config_file = tmp_path / "screenman.toml"
+        config_file.write_text(CONFIG_TOML)
+        with patch("screenman.fingerprint.x_state", return_value="x1"):
+            assert fingerprint.save("home", [config_file, tmp_path / "missing.toml"], drm)
+        return config_file
+
+    def test_hardware_fingerprint(self, drm, tmp_path):
+        first = fingerprint.hardware_fingerprint(drm)
+        assert first == fingerprint.hardware_fingerprint(drm)
+        (drm / "card0-DP-1" / "status").write_text("connected\n")
+        assert fingerprint.hardware_fingerprint(drm) != first
+        (drm / "card0-DP-1" / "status").write_text("disconnected\n")
+        (drm / "card0-eDP-1" / "edid").write_bytes(bytes.fromhex(make_edid(serial_str="OTHER")))
+        assert fingerprint.hardware_fingerprint(drm) != first
+        assert fingerprint.hardware_fingerprint(tmp_path / "empty") is None
+
+    def test_unchanged(self, saved, drm):
+        with patch("screenman.fingerprint.x_state", return_value="x1"):
+            assert fingerprint.unchanged(drm)["layout"] == "home"
+
+    def test_x_state_drift(self, saved, drm):
+        with patch("screenman.fingerprint.x_state", return_value="x2"):
+            assert fingerprint.unchanged(drm) is None
+
+    def test_hardware_changed(self, saved, drm):
+        (drm / "card0-DP-1" / "status").write_text("connected\n")
+        with patch("screenman.fingerprint.x_state", return_value="x1") as mock_x:
+            assert fingerprint.unchanged(drm) is None
+        mock_x.assert_not_called()
+
+    def test_config_changed(self, saved, drm):
+        saved.write_text(CONFIG_TOML + "\n[layouts.office.X]\nprimary = true\n")
+        with patch("screenman.fingerprint.x_state", return_value="x1"):
+            assert fingerprint.unchanged(drm) is None
+
+    def test_nothing_saved_without_x(self, drm, runtime_dir):
+        with patch("screenman.fingerprint.x_state", return_value=None):
+            assert not fingerprint.save("home", [], drm)
+        assert fingerprint.unchanged(drm) is None
+
+    def test_run_command_saves(self, empty_config):
+        with patch("screenman.daemon.connected_screens", return_value=[]), patch(
+            "screenman.daemon.fingerprint.save", return_value=True
+        ) as mock_save:
+            run_command("apply")
+            run_command("print-info")
+        mock_save.assert_called_once()
+        assert mock_save.call_args[0][0] == "auto"
+
+    @pytest.mark.parametrize("args, skipped", [([], True), (["--force"], False), (["--print-info"], False)])
+    def test_cli_fast_path(self, args, skipped):
+        with patch("screenman.fingerprint.unchanged", return_value={"layout": "home"}), patch(
+            "screenman.daemon.run_command", return_value=""
+        ) as mock_run:
+            result = CliRunner().invoke(cli.main, ["--no-daemon", *args])
+        assert result.exit_code == 0, result.output
+        assert mock_run.called != skipped
+
+
+class TestSwayBackend:
+    @pytest.fixture
+    def outputs(self, fake_sway, tmp_path, monkeypatch):
+        root = make_sysfs_tree(
+            tmp_path / "drm", {"card0-eDP-1": {"status": "connected", "edid": make_edid(serial_str="PANEL")}}
+        )
+        monkeypatch.setattr("screenman.sysfs.DRM_ROOT", root)
+        fake_sway.outputs = [
+            make_sway_output("eDP-1", [(2256, 1504, 59999), (1920, 1200, 59950)], transform="90"),
+            make_sway_output(
+                "DP-1",
+                [(2560, 1440, 143973), (2560, 1440, 59951), (1920, 1080, 60000)],
+                active=False,
+                make="Dell Inc.",
+                model="DELL U2720Q",
+                serial="0x0001E240",
+            ),
+        ]
+        return fake_sway
+
+    def test_connected_screens(self, outputs):
+        edp, dp = connected_screens(backend="sway")
+        assert (edp.name, edp.uid, edp.is_enabled, edp.resolution) == ("eDP-1", "PANEL", True, (2256, 1504))
+        assert (edp.rotation, edp.position) == (RotateDirection.Right, ("--pos", "0x0"))
+        assert edp.curr_mode.freq == 60.0
+        assert (dp.uid, dp.is_enabled, dp.preferred_resolution()) == ("123456 (0x0001e240)", False, (2560, 1440))
+        assert dp.supported_modes.rates((2560, 1440)) == [143.97, 59.95]
+
+    def test_apply_in_one_message(self, outputs, empty_config):
+        empty_config.layouts = {
+            "desk": {
+                "PANEL": ScreenSettings(rotation=RotateDirection.Normal, is_primary=True),
+                "123456 (0x0001e240)": ScreenSettings(position=("--pos", "2256x0"), rate="max"),
+            }
+        }
+        screens = connected_screens(backend="sway")
+        apply_layout(screens, determine_layout(screens), backend="sway")
+        assert outputs.commands == [
+            "output eDP-1 enable transform normal; output DP-1 enable mode 2560x1440@143.970Hz position 2256 0"
+        ]
+        # Discovery and apply share one connection
+        assert outputs.connections == 1
+
+    def test_reconnect(self, outputs):
+        connected_screens(backend="sway")
+        sway.connection().sock.shutdown(socket.SHUT_RDWR)
+        assert len(connected_screens(backend="sway")) == 2
+        assert outputs.connections == 2
+
+    def test_rejected_command(self, fake_sway):
+        with pytest.raises(RuntimeError, match="rejected"):
+            sway.apply_configs([OutputConfig("bogus-1", enabled=False)])
+
+    def test_unsupported(self):
+        assert sway.output_command(OutputConfig("DP-1", enabled=False)) == "output DP-1 disable"
+        with pytest.raises(sway.UnsupportedConfig):
+            sway.output_command(OutputConfig("DP-1", same_as="eDP-1"))
+        with pytest.raises(sway.UnsupportedConfig):
+            sway.output_command(OutputConfig("DP-1", position=("--left-of", "eDP-1")))
+
+    def test_normalize_serial(self):
+        assert sway._normalize_serial("0x0001E240") == "123456 (0x0001e240)"
+        assert sway._normalize_serial("CN0F2M8H") == "CN0F2M8H"
+        assert sway._normalize_serial("Unknown") is None
+        assert sway._normalize_serial("0x00000000") is None
+
+    def test_no_socket(self, monkeypatch):
+        monkeypatch.delenv("SWAYSOCK", raising=False)
+        monkeypatch.setattr("screenman.sway._connections", {})
+        with pytest.raises(RuntimeError, match="SWAYSOCK"):
+            connected_screens(backend="sway")
+
+    def test_cli(self, outputs):
+        result = CliRunner().invoke(cli.main, ["--backend", "sway", "--no-daemon", "--print-info"])
+        assert result.exit_code == 0, result.output
+        assert "UID: PANEL" in result.output
+
+
+class TestDisplays:
+    def test_find_displays(self, tmp_path):
+        for name in ("X10", "X0", "X1", "ICE-unix", "X1-lock"):
+            (tmp_path / name).touch()
+        assert displays.find_displays(tmp_path) == [":0", ":1", ":10"]
+        assert displays.find_displays(tmp_path / "missing") == []
+
+    def test_run_on_displays(self, fake_bin):
+        results = displays.run_on_displays([":1", ":2"], "print-info")
+        assert [(r.display, r.ok, r.layout_name) for r in results] == [
+            (":1", True, "outputs_02"),
+            (":2", True, "outputs_02"),
+        ]
+        assert "Layout: outputs_02" in results[0].output
+
+    def test_failing_display(self, monkeypatch):
+        monkeypatch.setenv("DISPLAY", ":0")
+        with patch("screenman.daemon.execute_command", side_effect=RuntimeError("Can't open display")):
+            result = displays.run_on_display(":3", "apply")
+        assert (result.display, result.ok, result.error) == (":3", False, "Can't open display")
+        assert "failed: Can't open display" in displays.report([result])
+
+    def test_report(self):
+        results = [
+            displays.DisplayResult(":0", True, "DP-1\nLayout: desk", "desk", seconds=0.25),
+            displays.DisplayResult(":1", True),
+        ]
+        assert displays.report(results) == ":0       layout: desk (0.25s)\n    DP-1\n    Layout: desk\n:1       ok (0.00s)"
+
+    def test_cli(self, fake_bin):
+        result = CliRunner().invoke(cli.main, ["--display", ":1", "--display", ":2", "--log-level", "ERROR"])
+        assert result.exit_code == 0, result.output
+        assert ":1       layout: outputs_02" in result.output and ":2       layout: outputs_02" in result.output
+
+    def test_cli_failure(self):
+        failed = displays.DisplayResult(":1", False, error="boom")
+        with patch("screenman.displays.run_on_displays", return_value=[failed]):
+            result = CliRunner().invoke(cli.main, ["--display", ":1"])
+        assert result.exit_code == 1
+        assert "Failed on 1 of 1 displays: :1" in result.output
+
+    def test_against_xvfb(self, xvfb_displays):
+        pytest.importorskip("Xlib")
+        results = displays.run_on_displays(xvfb_displays, "apply", backend="randr")
+        assert all(result.ok for result in results), displays.report(results)
+        assert [result.display for result in results] == xvfb_displays
+
+
+class TestBenchmarkFixtures:
+    FIXTURES = BENCHMARK_FIXTURES
+
+    @pytest.mark.parametrize("count", [1, 2, 4, 8, 16])
+    def test_dump_matches_its_layout(self, fake_bin, count):
+        fake_bin(count)
+        screens = connected_screens()
+        connected = [s for s in screens if s.is_connected]
+        assert len(connected) == count and len({s.uid for s in connected}) == count
+        assert determine_layout(screens) == f"outputs_{count:02d}"
+        reset, configs = plan_layout(screens, f"outputs_{count:02d}")
+        assert reset == [] and configs == []
+
+    def test_fake_edid_decode_agrees(self, fake_bin):
+        for path in sorted((self.FIXTURES / "edid").glob("*.hex")):
+            edid_hex = path.read_text().strip()
+            assert Edid.from_edid_decode(edid_hex) == Edid.from_edid_bytes(bytes.fromhex(edid_hex)), path.name
+
+
+class TestTimings:
+    @pytest.fixture(autouse=True)
+    def no_recorder(self):
+        yield
+        timings.disable()
+
+    def test_disabled_hooks_record_nothing(self):
+        assert timings.phase("a") is timings.phase("b")
+        assert timings.timed("f")(lambda x: x + 1)(1) == 2
+        timings.subprocess_started()
+        assert timings.disable() is None
+
+    def test_nested_phases_and_subprocesses(self):
+        recorder = timings.enable()
+        with timings.phase("outer"):
+            with timings.phase("inner"):
+                list(exec_cmd_stream([sys.executable, "-c", "pass"]))
+            timings.timed("decorated")(lambda: None)()
+        outer, inner, decorated = recorder.ordered()
+        assert (outer.name, outer.depth, outer.subprocesses) == ("outer", 0, 1)
+        assert (inner.name, inner.depth, inner.subprocesses) == ("inner", 1, 1)
+        assert (decorated.name, decorated.depth, decorated.subprocesses) == ("decorated", 1, 0)
+        assert outer.wall >= inner.wall + decorated.wall
+        assert "  inner" in recorder.report()
+
+    def test_apply_phases(self):
+        lines = make_xrandr_output([{"name": "DP-1", "edid": make_edid(serial_str="B")}])
+        lines[1] = lines[1].replace("1920x1080+0+0", "3840x2160+0+0")
+        (dp,) = parse_xrandr(lines)
+        recorder = timings.enable()
+        with patch("screenman.screen.exec_cmd"), patch("screenman.sysfs.rescan_pci", return_value=False):
+            sysfs.rescan_and_settle()
+            apply_layout([dp], "auto")
+        assert [r.name for r in recorder.ordered()] == ["rescan_and_settle", "apply_layout", "plan", "reset"]
+
+    @pytest.mark.parametrize("fmt", ["json", "chrome"])
+    def test_cli_timings_file(self, fake_bin, tmp_path, fmt):
+        path = tmp_path / "timings.json"
+        result = CliRunner().invoke(
+            cli.main, ["--timings", "--timings-file", str(path), "--timings-format", fmt, "--log-level", "ERROR"]
+        )
+        assert result.exit_code == 0, result.output
+        assert "connected_screens" in result.output and "total" in result.output
+        data = json.loads(path.read_text())
+        if fmt == "chrome":
+            events = {e["name"]: e for e in data["traceEvents"]}
+            assert events["connected_screens"]["ph"] == "X"
+            assert events["connected_screens"]["args"]["subprocesses"] == 1
+        else:
+            phases = {p["name"]: p for p in data["phases"]}
+            assert phases["connected_screens"]["subprocesses"] == 1
+            assert data["subprocesses"] == 1
+            assert data["total_ms"] >= phases["connected_screens"]["wall"]
+
+    def test_cli_timings_bypass_daemon(self, fake_bin):
+        with patch("screenman.ipc.call") as mock_call:
+            result = CliRunner().invoke(cli.main, ["--timings", "--print-info", "--log-level", "ERROR"])
+        assert result.exit_code == 0, result.output
+        mock_call.assert_not_called()
+
+
+class TestModeTable:
+    MODES = [
+        Mode(2560, 1440, 144.0, current=False, preferred=False),
+        Mode(2560, 1440, 60.0, current=False, preferred=True),
+        Mode(1920, 1080, 60.0, current=True, preferred=False),
+        Mode(1920, 1080, 50.0, current=False, preferred=False),
+    ]
+
+    def test_index(self):
+        table = ModeTable(self.MODES)
+        assert len(table) == 4 and list(table) == self.MODES and table[2] is self.MODES[2]
+        assert table.resolutions() == [(2560, 1440), (1920, 1080)]
+        assert table.by_resolution[(1920, 1080)] == self.MODES[2:]
+        assert table.current is self.MODES[2] and table.preferred is self.MODES[1]
+        assert (2560, 1440) in table and [1920, 1080] in table and (1280, 720) not in table
+
+    def test_screen_lookups(self):
+        screen = Screen("DP-1", False, None, self.MODES, "")
+        assert screen.curr_mode is self.MODES[2] and screen.is_enabled
+        assert screen.preferred_resolution() == (2560, 1440)
+        assert screen.available_resolutions() == [(2560, 1440), (1920, 1080)]
+        with pytest.raises(ValueError):
+            screen.check_resolution((1280, 720))
+        screen.resolution = (2560, 1440)
+        assert screen.build_config().resolution == (2560, 1440)
+
+    def test_no_modes(self):
+        screen = Screen("DP-2", False, None, [], "")
+        assert not screen.is_connected and not screen.is_enabled and screen.curr_mode is None
+        assert screen.preferred_resolution() is None
+
+    def test_slots(self):
+        screen = Screen("DP-1", False, None, self.MODES, "")
+        with pytest.raises(AttributeError):
+            screen.unknown = 1
+        assert not hasattr(ScreenSettings(), "__dict__") and not hasattr(self.MODES[0], "__dict__")
+
+
+class TestRefreshRate:
+    MODES = [
+        Mode(2560, 1440, 60.0, current=True, preferred=True),
+        Mode(2560, 1440, 143.97, current=False, preferred=False),
+        Mode(2560, 1440, 120.0, current=False, preferred=False),
+        Mode(1920, 1080, 60.0, current=False, preferred=False),
+    ]
+
+    def _screen(self, modes=None):
+        return Screen("DP-1", False, RotateDirection.Normal, modes or self.MODES, "")
+
+    def test_all_rates_parsed(self):
+        lines = make_xrandr_output([{"name": "DP-1", "modes": [(2560, 1440, [60.0, 143.97, 120.0])]}])
+        (screen,) = parse_xrandr(lines)
+        assert screen.supported_modes.rates((2560, 1440)) == [60.0, 143.97, 120.0]
+        assert screen.curr_mode.freq == 60.0
+
+    def test_max_rate(self):
+        config = self._screen().plan_config(ScreenTarget(rate="max"))
+        assert config.to_args() == ["--output", "DP-1", "--mode", "2560x1440", "--rate", "143.97"]
+
+    def test_closest_rate(self):
+        config = self._screen().plan_config(ScreenTarget(resolution=(2560, 1440), rate=144))
+        assert config.rate == 143.97 and config.resolution == (2560, 1440)
+
+    def test_rate_already_set(self):
+        assert self._screen().plan_config(ScreenTarget(rate=60)) is None
+
+    def test_rate_with_new_resolution(self):
+        config = self._screen().plan_config(ScreenTarget(resolution=(1920, 1080), rate="max"))
+        assert config.to_args() == ["--output", "DP-1", "--mode", "1920x1080", "--rate", "60.00"]
+
+    def test_unsupported_rate(self):
+        with pytest.raises(ValueError, match="rate is not supported"):
+            self._screen().plan_config(ScreenTarget(rate=165))
+
+    def test_unknown_rates(self):
+        # sysfs does not report rates
+        screen = self._screen([Mode(2560, 1440, 0.0, current=True, preferred=True)])
+        assert screen.plan_config(ScreenTarget(rate=144)).rate == 144.0
+        assert screen.plan_config(ScreenTarget(rate="max")) is None
+
+    def test_randr_mode_by_rate(self):
+        conn = _fake_randr_connection()
+        conn.modes[4] = _mode_info(4, 1920, 1080, 144)
+        conn.outputs["eDP-1"].mode_ids.append(4)
+        changes, _ = conn.plan([OutputConfig("eDP-1", resolution=(1920, 1080), rate=144.0)])
+        assert changes[10].mode == 4
+        # Without a rate the first mode of the resolution, the current one
+        changes, _ = conn.plan([OutputConfig("eDP-1", resolution=(1920, 1080))])
+        assert changes == {}
+
+
+class TestProbeLevels:
+    @pytest.fixture
+    def xrandr_calls(self):
+        with patch("screenman.screen.exec_cmd_stream", wraps=exec_cmd_stream) as mock_exec:
+            yield lambda: [call.args[0][1:] for call in mock_exec.call_args_list]
+
+    def test_full_probe(self, fake_bin, xrandr_calls):
+        assert len(connected_screens()) == 2
+        assert xrandr_calls() == [["--props"]]
+
+    @pytest.mark.parametrize("level, args", [("current", ["--current", "--props"]), ("modes", ["--current"])])
+    def test_cheap_probe_escalates_once(self, fake_bin, xrandr_calls, level, args):
+        full = connected_screens()
+        assert [s.uid for s in connected_screens(probe=level)] == [s.uid for s in full]
+        assert [s.uid for s in connected_screens(probe=level)] == [s.uid for s in full]
+        assert xrandr_calls() == [["--props"], args, args]
+
+    def test_unknown_outputs_reprobed(self, fake_bin, xrandr_calls):
+        connected_screens(probe="modes")
+        fake_bin(4)
+        screens = connected_screens(probe="modes")
+        assert determine_layout(screens) == "outputs_04"
+        assert xrandr_calls() == [["--current"], ["--props"], ["--current"], ["--props"]]
+
+    def test_swapped_monitor_reprobed(self, fake_bin, xrandr_calls):
+        connected_screens()
+        get_output_cache().update({(s.name, modes_key(s)): "another" for s in connected_screens()})
+        connected_screens(probe="current")
+        assert xrandr_calls()[-2:] == [["--current", "--props"], ["--props"]]
+
+    def test_known_outputs_persisted(self, fake_bin, xrandr_calls, monkeypatch):
+        connected_screens()
+        monkeypatch.setattr("screenman.screen._output_cache", None)
+        assert determine_layout(connected_screens(probe="modes")) == "outputs_02"
+        assert xrandr_calls() == [["--props"], ["--current"]]
+
+    def test_displays_kept_apart(self, fake_bin, xrandr_calls, monkeypatch):
+        monkeypatch.setenv("DISPLAY", ":0")
+        connected_screens()
+        # The same outputs on another X server, they may show other monitors
+        monkeypatch.setenv("DISPLAY", ":1")
+        connected_screens(probe="modes")
+        assert xrandr_calls() == [["--props"], ["--current"], ["--props"]]
+        assert get_output_cache().path.name == "outputs:1.json"
+        monkeypatch.setenv("DISPLAY", ":0")
+        connected_screens(probe="modes")
+        assert xrandr_calls()[3:] == [["--current"]]
+
+    def test_rescan_probes_in_full(self, fake_bin):
+        with patch("screenman.daemon.rescan_and_settle"), patch(
+            "screenman.daemon.connected_screens", return_value=[]
+        ) as mock_discover:
+            run_command("print-info", rescan_pci=True, probe="modes")
+        mock_discover.assert_called_once_with(backend="xrandr", probe="full")
+
+    def test_unknown_level(self):
+        with pytest.raises(ValueError, match="Unknown probe level"):
+            connected_screens(probe="deep")
+
+    def test_cli_option(self):
+        with patch("screenman.daemon.run_command", return_value="") as mock_run:
+            result = CliRunner().invoke(cli.main, ["--no-daemon", "--probe", "current", "--print-info"])
+        assert result.exit_code == 0, result.output
+        mock_run.assert_called_once_with("print-info", backend="xrandr", rescan_pci=False, probe="current")
+
+
+class TestConfigWatcher:
+    @pytest.fixture
+    def candidates(self, tmp_path, monkeypatch):
+        """Two candidate directories, the first taking priority."""
+        dirs = [tmp_path / "first", tmp_path / "second"]
+        for directory in dirs:
+            directory.mkdir()
+        paths = [directory / "screenman.toml" for directory in dirs]
+        monkeypatch.setattr("screenman.watch.config_paths", lambda: paths)
+        return paths
+
+    @pytest.fixture
+    def make_watcher(self, candidates, monkeypatch):
+        """Create the watcher once the files of the test exist, so their creation is not seen as a change."""
+        monkeypatch.setattr(watch.ConfigWatcher, "POLL_INTERVAL", 0.01)
+        watchers = []
+
+        def make():
+            reloaded = threading.Event()
+            watcher = watch.ConfigWatcher(on_reload=reloaded.set, debounce=0.02)
+            watcher.reloaded = reloaded
+            watchers.append(watcher)
+            return watcher
+
+        yield make
+        for watcher in watchers:
+            watcher.stop()
+
+    def test_reload(self, candidates, make_watcher):
+        candidates[1].write_text(CONFIG_TOML)
+        assert make_watcher().reload()
+        assert list(get_config().layouts) == ["home"]
+
+    def test_broken_config_keeps_last_good(self, candidates, make_watcher):
+        candidates[1].write_text(CONFIG_TOML)
+        watcher = make_watcher()
+        watcher.reload()
+        candidates[1].write_text("[layouts.home.frametux]\nrate = 0\n")
+        with patch("screenman.watch.logger") as mock_logger:
+            assert not watcher.reload()
+        mock_logger.error.assert_called_once()
+        assert list(get_config().layouts) == ["home"]
+
+    def test_fallback_change_forgets_decoded(self, candidates, make_watcher, monkeypatch):
+        monkeypatch.setattr(Edid, "MEMO", {b"edid": Edid(name="stale")})
+        candidates[1].write_text(CONFIG_TOML)
+        make_watcher().reload()
+        assert Edid.MEMO == {}
+
+    def test_watches_only_relevant_paths(self, candidates, make_watcher):
+        candidates[1].write_text(CONFIG_TOML)
+        watcher = make_watcher()
+        assert watcher.paths == set(candidates)
+        candidates[0].write_text("")
+        watcher.update_watches()
+        assert watcher.paths == {candidates[0]}
+        assert set(watcher.watches.values()) == {candidates[0].parent}
+
+    def test_replaced_file_reloaded(self, candidates, make_watcher):
+        candidates[0].write_text("")
+        watcher = make_watcher()
+        watcher.start()
+        # Editors write a new file and rename it over the old one
+        tmp_path = candidates[0].with_name("screenman.toml.swp")
+        tmp_path.write_text(CONFIG_TOML)
+        tmp_path.rename(candidates[0])
+        assert watcher.reloaded.wait(5)
+        assert list(get_config().layouts) == ["home"]
+
+    def test_lower_priority_change_ignored(self, candidates, make_watcher):
+        candidates[0].write_text("")
+        watcher = make_watcher()
+        watcher.start()
+        candidates[1].write_text(CONFIG_TOML)
+        assert not watcher.reloaded.wait(0.2)
+        assert get_config().layouts == {}
+
+    def test_daemon_reapplies_on_reload(self):
+        source = QueueSource()
+        daemon = Daemon(source, watch_config=True)
+        with patch("screenman.daemon.ConfigWatcher") as mock_watcher, patch(
+            "screenman.daemon.connected_screens", return_value=[]
+        ), patch("screenman.daemon.apply_layout"), patch("screenman.daemon.remember_layout"):
+            source.close()
+            daemon.run()
+        mock_watcher.assert_called_once_with(lock=daemon.lock, on_reload=daemon.refresh)
+        mock_watcher.return_value.start.assert_called_once()
+        mock_watcher.return_value.stop.assert_called_once()
+
+
+class TestMirrorToggle:
+    @pytest.fixture(autouse=True)
+    def drm(self, tmp_path, monkeypatch):
+        root = make_sysfs_tree(
+            tmp_path / "drm",
+            {
+                "card0-eDP-1": {"status": "connected", "edid": make_edid(serial_str="PANEL")},
+                "card0-HDMI-1": {"status": "connected", "edid": make_edid(serial_str="EXT")},
+            },
+        )
+        monkeypatch.setattr("screenman.fingerprint.DRM_ROOT", root)
+        return root
+
+    @pytest.fixture
+    def x(self):
+        """A fake X server, its state follows the xrandr calls."""
+        x = SimpleNamespace(state="normal", calls=[])
+
+        def run(cmd):
+            x.calls.append(cmd)
+            x.state = "mirrored" if "--same-as" in cmd else "normal"
+            return []
+
+        with patch("screenman.fingerprint.x_state", side_effect=lambda: x.state), patch(
+            "screenman.screen.exec_cmd", side_effect=run
+        ), patch("screenman.daemon.connected_screens", side_effect=self.screens) as mock_discover:
+            x.discover = mock_discover
+            yield x
+
+    @staticmethod
+    def screens(**kwargs):
+        """Discover the screens in their state before mirroring."""
+        internal = _make_screen("eDP-1", [Mode(1920, 1080, 60.0, current=True, preferred=True)])
+        internal.record_state(position=("--pos", "0x0"))
+        external = _make_screen(
+            "HDMI-1",
+            [
+                Mode(3840, 2160, 60.0, current=False, preferred=True),
+                Mode(1920, 1080, 60.0, current=True, preferred=False),
+            ],
+        )
+        external.record_state(position=("--pos", "1920x0"))
+        return [internal, external]
+
+    def test_snapshot_restores_exact_state(self):
+        internal, external = self.screens()
+        assert snapshot_config(external).to_args() == [
+            *("--output", "HDMI-1", "--mode", "1920x1080", "--rate", "60.00", "--pos", "1920x0", "--scale", "1x1")
+        ]
+        internal.is_enabled = False
+        assert snapshot_config(internal).to_args() == ["--output", "eDP-1", "--off"]
+
+    def test_toggle_without_discovery(self, x):
+        run_command("mirror")
+        assert x.discover.call_count == 1 and x.state == "mirrored"
+        mirror_call = x.calls[-1]
+
+        run_command("mirror-off")
+        assert x.discover.call_count == 1 and x.state == "normal"
+        assert x.calls[-2] == ["xrandr", "--output", "eDP-1", "--auto", "--scale", "1x1"]
+        assert x.calls[-1] == [
+            "xrandr",
+            *("--output", "eDP-1", "--mode", "1920x1080", "--rate", "60.00", "--pos", "0x0", "--scale", "1x1"),
+            *("--output", "HDMI-1", "--mode", "1920x1080", "--rate", "60.00", "--pos", "1920x0", "--scale", "1x1"),
+        ]
+
+        run_command("mirror")
+        assert x.discover.call_count == 1 and x.calls[-1] == mirror_call
+        assert len(x.calls) == 4
+
+    def test_already_mirrored(self, x):
+        run_command("mirror")
+        run_command("mirror")
+        assert len(x.calls) == 1 and x.discover.call_count == 1
+
+    def test_x_state_changed(self, x):
+        run_command("mirror")
+        x.state = "rotated by hand"
+        with patch("screenman.daemon.apply_layout") as mock_apply:
+            run_command("mirror-off")
+        assert x.discover.call_count == 2
+        mock_apply.assert_called_once()
+
+    def test_hardware_changed(self, x, drm):
+        run_command("mirror")
+        (drm / "card0-HDMI-1" / "edid").write_bytes(bytes.fromhex(make_edid(serial_str="OTHER")))
+        with patch("screenman.daemon.apply_layout"):
+            run_command("mirror-off")
+        assert x.discover.call_count == 2
+
+    def test_config_changed(self, x, tmp_path):
+        config = tmp_path / "screenman.toml"
+        with patch("screenman.mirror.config_paths", return_value=[config]):
+            run_command("mirror")
+            config.write_text("[layouts.desk.EXT]\n")
+            with patch("screenman.daemon.apply_layout") as mock_apply:
+                run_command("mirror-off")
+        assert x.discover.call_count == 2
+        mock_apply.assert_called_once()
+
+    def test_not_saved_without_output_state(self, x):
+        def sysfs_screens(**kwargs):
+            screens = self.screens()
+            for screen in screens:
+                screen.state_known = False
+            return screens
+
+        x.discover.side_effect = sysfs_screens
+        run_command("mirror")
+        assert x.state == "mirrored" and not mirror.state_path().exists()
+
+    def test_failed_toggle_falls_back(self, x):
+        run_command("mirror")
+        with patch("screenman.mirror.run_configs", side_effect=subprocess.CalledProcessError(1, "xrandr")), patch(
+            "screenman.daemon.apply_layout"
+        ) as mock_apply:
+            run_command("mirror-off")
+        mock_apply.assert_called_once()
+        assert not mirror.state_path().exists()